@@ -1,18 +1,61 @@
 """
 SmartLid 配置管理模組
+
+設定以不可變的 ConfigSnapshot 保存，Config.reload() 重新讀取環境變數與 .env 後整體替換；
+使用端在每次狀態轉換開始時以 Config.current() 取得快照，轉換期間的數值保持一致。
+Config 的類別屬性同步為目前快照的值。
 """
 import os
+import socket
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any
-from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional
 
-# 載入環境變數
-load_dotenv()
+# .env 的已知位置（依序採用第一個存在者），不在啟動時逐層搜尋
+ENV_FILES = (Path(__file__).parent / ".env", Path(__file__).parent.parent / ".env")
 
+# 程序啟動時的環境變數；與 load_dotenv() 相同，優先於 .env 的設定
+_PROCESS_ENV = dict(os.environ)
 
-class Config:
-    """SmartLid 基礎配置類"""
-    
+# 變更後須重新啟動才會生效的設定（腳位、後端、資料庫與各服務端點）
+RESTART_REQUIRED = frozenset({
+    "RUNTIME_MODE", "HARDWARE_BACKEND", "CONFIG_WATCH_ENABLED", "REED_SWITCH_PIN", "REED_STABLE_TIME",
+    "SERVO_PIN", "SERVO_PWM_BACKEND", "SERVO_CLOSED_LOOP", "LIDS",
+    "LINE_CHANNEL_ACCESS_TOKEN", "LINE_SPOOL_ENABLED", "DB_PATH", "STATE_STORE_ENABLED",
+    "EVENT_STORE_ENABLED", "EVENT_BATCH_SIZE", "EVENT_FLUSH_INTERVAL", "METRICS_ENABLED",
+    "METRICS_HOST", "METRICS_PORT", "DASHBOARD_ENABLED", "FLASK_HOST", "FLASK_PORT",
+    "MQTT_ENABLED", "MQTT_BROKER_HOST", "MQTT_BROKER_PORT", "MQTT_TOPIC_PREFIX", "MQTT_USERNAME", "MQTT_PASSWORD",
+    "MQTT_DISCOVERY_PREFIX", "MQTT_BUFFER_SIZE", "MQTT_SPOOL_SIZE", "MQTT_BATCH_SIZE",
+    "FLEET_GATEWAY_URL", "FLEET_NODE_ID", "FLEET_TOKEN", "FLEET_CENTRAL_LINE", "FLEET_BATCH_SIZE",
+    "FLEET_FLUSH_INTERVAL", "FLEET_GATEWAY_HOST", "FLEET_GATEWAY_PORT", "FLEET_DB_PATH",
+    "LINE_CHANNEL_SECRET", "LINE_POOL_SIZE", "LINE_WEBHOOK_ENABLED", "LINE_WEBHOOK_HOST", "LINE_WEBHOOK_PORT",
+    "LINE_WEBHOOK_PATH", "LINE_WEBHOOK_RECORD_PATH",
+    "LOG_MAX_BYTES", "LOG_BACKUP_COUNT", "LOG_QUEUE_SIZE",
+})
+
+
+def env_file() -> Optional[Path]:
+    """目前使用的 .env 檔案，不存在時返回 None"""
+    for path in ENV_FILES:
+        if path.is_file():
+            return path
+    return None
+
+
+def _read_env() -> Dict[str, str]:
+    """內部函式：合併 .env 與程序環境變數（沒有 .env 時不必匯入 python-dotenv）"""
+    env: Dict[str, str] = {}
+    path = env_file()
+    if path is not None:
+        from dotenv import dotenv_values
+        env.update({key: value for key, value in dotenv_values(path).items() if value is not None})
+    env.update(_PROCESS_ENV)
+    return env
+
+
+def _load_settings(env: Mapping[str, str]) -> Dict[str, Any]:
+    """內部函式：由環境變數計算所有設定值"""
     # 專案路徑
     BASE_DIR = Path(__file__).parent.parent
     SRC_DIR = BASE_DIR / "src"
@@ -21,53 +64,309 @@ class Config:
     LOGS_DIR = BASE_DIR / "logs"
     
     # 應用配置
-    APP_NAME = os.getenv("APP_NAME", "SmartLid")
-    APP_ENV = os.getenv("APP_ENV", "development")
-    DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+    APP_NAME = env.get("APP_NAME", "SmartLid")
+    APP_ENV = env.get("APP_ENV", "development")
+    DEBUG = env.get("DEBUG", "False").lower() == "true"
+    LOG_LEVEL = env.get("LOG_LEVEL", "DEBUG" if DEBUG else "INFO")
+    LOG_MAX_BYTES = int(env.get("LOG_MAX_BYTES", str(5 * 1024 * 1024)))  # 位元組，超過即輪替
+    LOG_BACKUP_COUNT = int(env.get("LOG_BACKUP_COUNT", "5"))
+    LOG_QUEUE_SIZE = int(env.get("LOG_QUEUE_SIZE", "10000"))  # 筆，佇列已滿時丟棄而不阻塞
+    RUNTIME_MODE = env.get("RUNTIME_MODE", "thread")  # thread / asyncio
+    HARDWARE_BACKEND = env.get("HARDWARE_BACKEND", "gpio")  # gpio / sim（模擬硬體）
+    CONFIG_WATCH_ENABLED = env.get("CONFIG_WATCH_ENABLED", "True").lower() == "true"  # .env 變更時自動重新載入
     
     # 磁簧開關 GPIO 配置
-    REED_SWITCH_PIN = int(os.getenv("REED_SWITCH_PIN", "17"))
+    REED_SWITCH_PIN = int(env.get("REED_SWITCH_PIN", "17"))
+    REED_STABLE_TIME = float(env.get("REED_STABLE_TIME", "0.05"))  # 秒，防彈跳穩定時間
     
     # 伺服馬達 GPIO 配置
-    SERVO_PIN = int(os.getenv("SERVO_PIN", "18"))
-    SERVO_CLOSE_ANGLE = int(os.getenv("SERVO_CLOSE_ANGLE", "90"))
-    SERVO_DUTY_REST = float(os.getenv("SERVO_DUTY_REST", "3.3"))
-    SERVO_DUTY_PUSH = float(os.getenv("SERVO_DUTY_PUSH", "8.1"))
-    SERVO_MOVE_TIME = float(os.getenv("SERVO_MOVE_TIME", "0.5"))
-    SERVO_STABILIZE_TIME = float(os.getenv("SERVO_STABILIZE_TIME", "0.1"))
-    SERVO_PUSH_HOLD_TIME = float(os.getenv("SERVO_PUSH_HOLD_TIME", "2.0"))
+    SERVO_PIN = int(env.get("SERVO_PIN", "18"))
+    SERVO_PWM_BACKEND = env.get("SERVO_PWM_BACKEND", "software")  # software（RPi.GPIO）/ hardware（核心 PWM）
+    SERVO_CLOSE_ANGLE = int(env.get("SERVO_CLOSE_ANGLE", "90"))
+    SERVO_DUTY_REST = float(env.get("SERVO_DUTY_REST", "3.3"))
+    SERVO_DUTY_PUSH = float(env.get("SERVO_DUTY_PUSH", "8.1"))
+    SERVO_MOVE_TIME = float(env.get("SERVO_MOVE_TIME", "0.5"))
+    SERVO_STABILIZE_TIME = float(env.get("SERVO_STABILIZE_TIME", "0.1"))
+    SERVO_PUSH_HOLD_TIME = float(env.get("SERVO_PUSH_HOLD_TIME", "2.0"))  # 開迴路：推動後停留時間
+    # 閉迴路：推動期間監看磁簧開關，蓋子放下即收回；逾期未放下視為推蓋失敗
+    SERVO_CLOSED_LOOP = env.get("SERVO_CLOSED_LOOP", "True").lower() == "true"
+    SERVO_CLOSE_TIMEOUT = float(env.get("SERVO_CLOSE_TIMEOUT", "2.5"))  # 秒，自推動起算
     
     # 計時配置
-    LID_OPEN_TIMEOUT = int(os.getenv("LID_OPEN_TIMEOUT", "60"))  # 秒
-    DAILY_ALERT_THRESHOLD = int(os.getenv("DAILY_ALERT_THRESHOLD", "2"))  # 次數
+    LID_OPEN_TIMEOUT = int(env.get("LID_OPEN_TIMEOUT", "60"))  # 秒
+    DAILY_ALERT_THRESHOLD = int(env.get("DAILY_ALERT_THRESHOLD", "2"))  # 次數
+    DAILY_SUMMARY_ENABLED = env.get("DAILY_SUMMARY_ENABLED", "False").lower() == "true"  # 午夜發送每日摘要
+    
+    # 提醒動作期限配置（自計時器到期起算，秒）
+    AUDIO_ACTION_DEADLINE = float(env.get("AUDIO_ACTION_DEADLINE", "15"))
+    SERVO_ACTION_DEADLINE = float(env.get("SERVO_ACTION_DEADLINE", "6"))
+    LINE_ACTION_DEADLINE = float(env.get("LINE_ACTION_DEADLINE", "10"))
     
     # 音效配置
-    ALERT1_SOUND = os.getenv("ALERT1_SOUND", "data/sounds/alert1.mp3")
-    ALERT2_SOUND = os.getenv("ALERT2_SOUND", "data/sounds/alert2.mp3")
+    ALERT1_SOUND = env.get("ALERT1_SOUND", "data/sounds/alert1.mp3")
+    ALERT2_SOUND = env.get("ALERT2_SOUND", "data/sounds/alert2.mp3")
+    
+    # 多馬桶蓋配置：以逗號分隔，每組為「名稱:磁簧腳位:馬達腳位[:音效組[:收件者]]」
+    # 例如 LIDS=1F:17:18,2F:22:23:soft:Uxxxx；音效組對應 data/sounds/<音效組>/alert1.mp3、alert2.mp3
+    # 多位收件者以 + 分隔，例如 2F:22:23::Uaaaa+Ubbbb+Cgroup
+    # 未設定時使用上方單一馬桶蓋配置
+    LIDS = env.get("LIDS", "")
     
     # LINE Bot 配置
-    LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "")
-    LINE_USER_ID = os.getenv("LINE_USER_ID", "")
+    LINE_CHANNEL_ACCESS_TOKEN = env.get("LINE_CHANNEL_ACCESS_TOKEN", "")
+    # 收件者 ID；多位以逗號分隔（使用者合併為 Multicast 請求，群組 C…／聊天室 R… 各自 Push）
+    LINE_USER_ID = env.get("LINE_USER_ID", "")
+    
+    # LINE 推播佇列配置
+    LINE_SPOOL_ENABLED = env.get("LINE_SPOOL_ENABLED", "True").lower() == "true"
+    LINE_MESSAGE_DEADLINE = float(env.get("LINE_MESSAGE_DEADLINE", "86400"))  # 秒
+    LINE_RETRY_BASE = float(env.get("LINE_RETRY_BASE", "1.0"))  # 秒
+    LINE_RETRY_MAX = float(env.get("LINE_RETRY_MAX", "300"))  # 秒
+    
+    # LINE 推播限流與額度配置
+    LINE_ALERT_RATE_PER_HOUR = float(env.get("LINE_ALERT_RATE_PER_HOUR", "6"))
+    LINE_ALERT_BURST = int(env.get("LINE_ALERT_BURST", "2"))
+    LINE_COALESCE_WINDOW = float(env.get("LINE_COALESCE_WINDOW", "300"))  # 秒
+    LINE_MONTHLY_QUOTA = int(env.get("LINE_MONTHLY_QUOTA", "200"))  # 則，0 表示不限制
+    LINE_QUOTA_RESERVE = float(env.get("LINE_QUOTA_RESERVE", "0.2"))  # 比例
+    LINE_POOL_SIZE = int(env.get("LINE_POOL_SIZE", "4"))  # 連線池大小，也是 Webhook 同時回覆的數量
+    
+    # LINE Webhook 配置（以免費的 Reply API 回答「今天」「本週」「狀態」查詢）
+    LINE_CHANNEL_SECRET = env.get("LINE_CHANNEL_SECRET", "")
+    LINE_WEBHOOK_ENABLED = env.get("LINE_WEBHOOK_ENABLED", "False").lower() == "true"
+    LINE_WEBHOOK_HOST = env.get("LINE_WEBHOOK_HOST", "0.0.0.0")
+    LINE_WEBHOOK_PORT = int(env.get("LINE_WEBHOOK_PORT", "8781"))
+    LINE_WEBHOOK_PATH = env.get("LINE_WEBHOOK_PATH", "/callback")
+    LINE_WEBHOOK_CACHE_TTL = float(env.get("LINE_WEBHOOK_CACHE_TTL", "30"))  # 秒，統計回覆的快取時間
+    LINE_WEBHOOK_RECORD_PATH = env.get("LINE_WEBHOOK_RECORD_PATH", "")  # 保存收到的請求以供重播測試，空字串表示不保存
     
     # MQTT 配置（選用）
-    MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
-    MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", "1883"))
-    MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX", "smartlid")
+    MQTT_BROKER_HOST = env.get("MQTT_BROKER_HOST", "localhost")
+    MQTT_BROKER_PORT = int(env.get("MQTT_BROKER_PORT", "1883"))
+    MQTT_TOPIC_PREFIX = env.get("MQTT_TOPIC_PREFIX", "smartlid")
+    MQTT_ENABLED = env.get("MQTT_ENABLED", "False").lower() == "true"
+    MQTT_USERNAME = env.get("MQTT_USERNAME", "")
+    MQTT_PASSWORD = env.get("MQTT_PASSWORD", "")
+    MQTT_DISCOVERY_PREFIX = env.get("MQTT_DISCOVERY_PREFIX", "homeassistant")  # 空字串表示不發布探索設定
+    MQTT_BUFFER_SIZE = int(env.get("MQTT_BUFFER_SIZE", "1000"))  # 則，離線時記憶體緩衝上限
+    MQTT_SPOOL_SIZE = int(env.get("MQTT_SPOOL_SIZE", "10000"))  # 則，超過記憶體上限後的 SQLite 緩衝上限
+    MQTT_BATCH_SIZE = int(env.get("MQTT_BATCH_SIZE", "100"))  # 則，每批同時在途的數量
     
     # SQLite 資料庫配置
-    DB_PATH = os.getenv("DB_PATH", "data/smartlid.db")
+    DB_PATH = env.get("DB_PATH", "data/smartlid.db")
+    STATE_STORE_ENABLED = env.get("STATE_STORE_ENABLED", "True").lower() == "true"
+    EVENT_STORE_ENABLED = env.get("EVENT_STORE_ENABLED", "True").lower() == "true"
+    EVENT_BATCH_SIZE = int(env.get("EVENT_BATCH_SIZE", "100"))  # 筆
+    EVENT_FLUSH_INTERVAL = float(env.get("EVENT_FLUSH_INTERVAL", "1.0"))  # 秒，斷電時最多遺失的時間範圍
     
     # Flask Web Dashboard 配置
-    FLASK_HOST = os.getenv("FLASK_HOST", "0.0.0.0")
-    FLASK_PORT = int(os.getenv("FLASK_PORT", "5000"))
+    FLASK_HOST = env.get("FLASK_HOST", "0.0.0.0")
+    FLASK_PORT = int(env.get("FLASK_PORT", "5000"))
+    DASHBOARD_ENABLED = env.get("DASHBOARD_ENABLED", "False").lower() == "true"
+    DASHBOARD_CACHE_TTL = float(env.get("DASHBOARD_CACHE_TTL", "5"))  # 秒，統計回應的快取時間
+    
+    # Prometheus 指標端點配置
+    METRICS_ENABLED = env.get("METRICS_ENABLED", "True").lower() == "true"
+    METRICS_HOST = env.get("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(env.get("METRICS_PORT", "9108"))
+    
+    # 車隊閘道配置（節點端：設定 FLEET_GATEWAY_URL 即上傳事件；閘道端：python -m services.fleet_gateway）
+    FLEET_GATEWAY_URL = env.get("FLEET_GATEWAY_URL", "")  # 例如 http://gateway:8780/v1/frames
+    FLEET_NODE_ID = env.get("FLEET_NODE_ID", "") or socket.gethostname()
+    FLEET_TOKEN = env.get("FLEET_TOKEN", "")
+    FLEET_CENTRAL_LINE = env.get("FLEET_CENTRAL_LINE", "True").lower() == "true"  # LINE 通知改由閘道發送
+    FLEET_BATCH_SIZE = int(env.get("FLEET_BATCH_SIZE", "200"))  # 筆，每個框架的事件上限
+    FLEET_FLUSH_INTERVAL = float(env.get("FLEET_FLUSH_INTERVAL", "1.0"))  # 秒
+    FLEET_GATEWAY_HOST = env.get("FLEET_GATEWAY_HOST", "0.0.0.0")
+    FLEET_GATEWAY_PORT = int(env.get("FLEET_GATEWAY_PORT", "8780"))
+    FLEET_DB_PATH = env.get("FLEET_DB_PATH", "data/fleet.db")
+    
+    return {key: value for key, value in locals().items() if key.isupper()}
+
+
+def _parse_lids(settings) -> List[Dict[str, Any]]:
+    """
+    解析多馬桶蓋配置
+    
+    Args:
+        settings: 具有設定屬性的物件（ConfigSnapshot 或 Config）
+    
+    Returns:
+        List[Dict[str, Any]]: 每個馬桶蓋的 name、reed_pin、servo_pin、
+        alert1_sound、alert2_sound、recipient
+    """
+    entries = [entry.strip() for entry in settings.LIDS.split(",") if entry.strip()]
+    if not entries:
+        return [{
+            "name": "lid1",
+            "reed_pin": settings.REED_SWITCH_PIN,
+            "servo_pin": settings.SERVO_PIN,
+            "alert1_sound": settings.ALERT1_SOUND,
+            "alert2_sound": settings.ALERT2_SOUND,
+            "recipient": settings.LINE_USER_ID,
+        }]
+    
+    lids = []
+    for entry in entries:
+        fields = entry.split(":")
+        if len(fields) < 3:
+            raise ValueError(f"LIDS 設定格式錯誤: '{entry}'（應為 名稱:磁簧腳位:馬達腳位[:音效組[:收件者[+收件者…]]]）")
+        
+        sound_set = fields[3] if len(fields) > 3 and fields[3] else "default"
+        if sound_set == "default":
+            alert1_sound, alert2_sound = settings.ALERT1_SOUND, settings.ALERT2_SOUND
+        else:
+            alert1_sound = f"data/sounds/{sound_set}/alert1.mp3"
+            alert2_sound = f"data/sounds/{sound_set}/alert2.mp3"
+        
+        lids.append({
+            "name": fields[0],
+            "reed_pin": int(fields[1]),
+            "servo_pin": int(fields[2]),
+            "alert1_sound": alert1_sound,
+            "alert2_sound": alert2_sound,
+            "recipient": fields[4] if len(fields) > 4 and fields[4] else settings.LINE_USER_ID,
+        })
+    return lids
+
+
+class ConfigSnapshot:
+    """不可變的設定快照（以屬性存取設定值）"""
+    
+    __slots__ = ("_values", "version")
+    
+    def __init__(self, values: Mapping[str, Any], version: int = 0):
+        """
+        Args:
+            values: 設定名稱 → 值
+            version: 快照版本（每次重新載入遞增）
+        """
+        object.__setattr__(self, "_values", dict(values))
+        object.__setattr__(self, "version", version)
+    
+    def __getattr__(self, key: str) -> Any:
+        try:
+            return self._values[key]
+        except KeyError:
+            raise AttributeError(key) from None
+    
+    def __setattr__(self, key: str, value: Any):
+        raise AttributeError("ConfigSnapshot 為唯讀，請使用 Config.reload() 或 replace()")
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """所有設定值的副本"""
+        return dict(self._values)
+    
+    def replace(self, **changes) -> "ConfigSnapshot":
+        """返回套用變更後的新快照"""
+        return ConfigSnapshot({**self._values, **changes}, self.version + 1)
+    
+    def diff(self, other: "ConfigSnapshot") -> Dict[str, tuple]:
+        """與另一個快照不同的設定：名稱 → (本快照的值, 另一快照的值)"""
+        return {
+            key: (self._values.get(key), other._values.get(key))
+            for key in self._values.keys() | other._values.keys()
+            if self._values.get(key) != other._values.get(key)
+        }
+    
+    def get_lids(self) -> List[Dict[str, Any]]:
+        """解析多馬桶蓋配置"""
+        return _parse_lids(self)
+
+
+class Config:
+    """
+    SmartLid 基礎配置類
+    
+    類別屬性為目前快照的值（舊程式碼可直接讀取 Config.X）；需要一致數值的流程
+    請以 Config.current() 取得快照。
+    """
+    
+    _snapshot: ConfigSnapshot
+    _listeners: List[Callable[[ConfigSnapshot, ConfigSnapshot], None]] = []
+    _lock = threading.RLock()
+    
+    @classmethod
+    def current(cls) -> ConfigSnapshot:
+        """目前的設定快照"""
+        return cls._snapshot
+    
+    @classmethod
+    def apply(cls, snapshot: ConfigSnapshot) -> ConfigSnapshot:
+        """
+        替換目前的設定快照並通知監聽者
+        
+        Returns:
+            ConfigSnapshot: 被替換掉的舊快照
+        """
+        with cls._lock:
+            previous = getattr(cls, "_snapshot", None)
+            cls._snapshot = snapshot
+            for key, value in snapshot.as_dict().items():
+                setattr(cls, key, value)
+            listeners = list(cls._listeners) if previous is not None else []
+        for listener in listeners:
+            listener(previous, snapshot)
+        return previous
+    
+    @classmethod
+    def reload(cls) -> Dict[str, tuple]:
+        """
+        重新讀取環境變數與 .env，並以新快照整體替換
+        
+        Returns:
+            Dict[str, tuple]: 有變更的設定：名稱 → (舊值, 新值)
+        """
+        with cls._lock:
+            previous = cls._snapshot
+            snapshot = ConfigSnapshot(_load_settings(_read_env()), previous.version + 1)
+            # 先驗證馬桶蓋配置，格式錯誤時不替換
+            snapshot.get_lids()
+            changes = previous.diff(snapshot)
+            if changes:
+                cls.apply(snapshot)
+        return changes
+    
+    @classmethod
+    def subscribe(cls, listener: Callable[[ConfigSnapshot, ConfigSnapshot], None]):
+        """註冊快照替換時的回呼 (舊快照, 新快照)"""
+        with cls._lock:
+            cls._listeners.append(listener)
+    
+    @classmethod
+    def unsubscribe(cls, listener: Callable[[ConfigSnapshot, ConfigSnapshot], None]):
+        """取消註冊快照替換時的回呼"""
+        with cls._lock:
+            if listener in cls._listeners:
+                cls._listeners.remove(listener)
+    
+    @classmethod
+    @contextmanager
+    def override(cls, **values) -> Iterator[ConfigSnapshot]:
+        """暫時以變更後的快照取代目前設定（模擬與測試用），離開時還原"""
+        with cls._lock:
+            previous = cls._snapshot
+            snapshot = previous.replace(**values)
+            cls._snapshot = snapshot
+            for key, value in values.items():
+                setattr(cls, key, value)
+        try:
+            yield snapshot
+        finally:
+            with cls._lock:
+                cls._snapshot = previous
+                for key in values:
+                    setattr(cls, key, getattr(previous, key))
     
     @classmethod
     def get_all(cls) -> Dict[str, Any]:
         """獲取所有配置"""
-        return {
-            key: value for key, value in cls.__dict__.items()
-            if not key.startswith('_') and not callable(value)
-        }
+        return cls._snapshot.as_dict()
+    
+    @classmethod
+    def get_lids(cls) -> List[Dict[str, Any]]:
+        """解析多馬桶蓋配置（見 _parse_lids）"""
+        return _parse_lids(cls)
     
     @classmethod
     def display(cls):
@@ -82,6 +381,9 @@ class Config:
                 print(f"{key}: {value}")
 
 
+# 載入初始設定
+Config.apply(ConfigSnapshot(_load_settings(_read_env())))
+
 # 創建全局配置實例
 config = Config()
 
@@ -0,0 +1,247 @@
+"""
+提醒動作執行器模組
+讓音效、伺服馬達與 LINE 通知同時啟動，並提供逾時與取消機制
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ActionResult:
+    """單一動作的執行結果與延遲紀錄"""
+    
+    def __init__(self, name: str, deadline: Optional[float]):
+        self.name = name
+        self.deadline = deadline
+        self.status = "pending"     # pending / running / done / failed / timeout / cancelled
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def latency_from(self, origin: float) -> Optional[float]:
+        """從觸發時間點到動作開始的延遲（秒）"""
+        if self.started_at is None:
+            return None
+        return self.started_at - origin
+    
+    @property
+    def duration(self) -> Optional[float]:
+        """動作執行時間（秒）"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class ActionBatch:
+    """一次提醒所觸發的一組並行動作"""
+    
+    def __init__(self, origin: float):
+        """
+        Args:
+            origin: 觸發時間點（time.monotonic()），用於計算各動作延遲
+        """
+        self.origin = origin
+        # 每個動作各自的取消事件：單一動作逾期時不影響其他動作
+        self.cancel_events: Dict[str, threading.Event] = {}
+        self.results: Dict[str, ActionResult] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._settled = set()
+        self._callbacks: List[Callable[["ActionBatch"], None]] = []
+        self._deadline_tasks = []
+    
+    def done(self) -> bool:
+        """是否所有動作皆已結束"""
+        return all(future.done() for future in self._futures.values())
+    
+    def cancel(self):
+        """要求所有動作盡快中止"""
+        for cancel_event in self.cancel_events.values():
+            cancel_event.set()
+        for future in self._futures.values():
+            future.cancel()
+    
+    def expire(self, name: str):
+        """將逾期仍未完成的動作標記為 timeout 並要求該動作中止（其他動作繼續執行）"""
+        if self._futures[name].done():
+            return
+        self.results[name].status = "timeout"
+        self.cancel_events[name].set()
+        self._settle(name)
+    
+    def arm_deadlines(self, scheduler):
+        """
+        以排程器非阻塞地執行各動作期限（取代 wait() 的阻塞等待）
+        
+        Args:
+            scheduler: DeadlineScheduler 實例
+        """
+        if self.done():
+            return
+        for name, result in self.results.items():
+            if result.deadline is not None:
+                self._deadline_tasks.append(
+                    scheduler.schedule_at(self.origin + result.deadline, self.expire, name)
+                )
+    
+    def add_done_callback(self, callback: Callable[["ActionBatch"], None]):
+        """所有動作完成或逾期後呼叫 callback(batch)"""
+        with self._lock:
+            if len(self._settled) < len(self._futures):
+                self._callbacks.append(callback)
+                return
+        callback(self)
+    
+    def _settle(self, name: str):
+        """內部函式：記錄動作已結束，全部結束時觸發回呼"""
+        with self._lock:
+            if name in self._settled:
+                return
+            self._settled.add(name)
+            if len(self._settled) < len(self._futures):
+                return
+            callbacks, self._callbacks = self._callbacks, []
+        
+        for task in self._deadline_tasks:
+            task.cancel()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.exception(f"❌ 動作完成回呼失敗: {e}")
+    
+    def wait(self) -> List[ActionResult]:
+        """
+        等待所有動作完成；超過各自期限的動作標記為 timeout 並要求中止
+        
+        Returns:
+            List[ActionResult]: 各動作的執行結果
+        """
+        for name, future in self._futures.items():
+            result = self.results[name]
+            timeout = None
+            if result.deadline is not None:
+                timeout = max(0.0, self.origin + result.deadline - time.monotonic())
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                # 例外已由 _run 記錄於 ActionResult
+                pass
+            if not future.done():
+                self.expire(name)
+        return list(self.results.values())
+    
+    def report(self) -> str:
+        """產生各動作延遲報告字串"""
+        lines = []
+        for result in self.results.values():
+            latency = result.latency_from(self.origin)
+            latency_text = f"{latency * 1000:.1f} ms" if latency is not None else "-"
+            duration = result.duration
+            duration_text = f"{duration:.2f} s" if duration is not None else "-"
+            lines.append(
+                f"   {result.name:<6} 狀態: {result.status:<9} 啟動延遲: {latency_text:<10} 執行時間: {duration_text}"
+            )
+        return "\n".join(lines)
+
+
+class ActionExecutor:
+    """提醒動作並行執行器（固定大小執行緒池，避免每次提醒建立新執行緒）"""
+    
+    def __init__(self, max_workers: int = 3, clock: Callable[[], float] = time.monotonic,
+                 pool: Optional[Executor] = None):
+        """
+        初始化動作執行器
+        
+        Args:
+            max_workers: 同時執行的動作數量上限
+            clock: 單調時鐘函式（記錄動作開始與結束時間）
+            pool: 執行動作的 Executor（選用），預設為固定大小的執行緒池
+        """
+        self.clock = clock
+        self._pool = pool or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smartlid-action")
+        self._lock = threading.Lock()
+        self._batches: List[ActionBatch] = []
+    
+    def execute(self, actions: Dict[str, Callable[[threading.Event], object]],
+                deadlines: Optional[Dict[str, float]] = None,
+                origin: Optional[float] = None) -> ActionBatch:
+        """
+        同時啟動一組動作
+        
+        Args:
+            actions: 動作名稱 → 可呼叫物件（接收取消事件作為唯一參數）
+            deadlines: 動作名稱 → 從 origin 起算的期限（秒），未指定則不限時
+            origin: 觸發時間點（time.monotonic()），預設為現在
+        
+        Returns:
+            ActionBatch: 本次動作集合，可用於等待、取消與延遲報告
+        """
+        deadlines = deadlines or {}
+        batch = ActionBatch(origin if origin is not None else self.clock())
+        
+        for name, func in actions.items():
+            result = ActionResult(name, deadlines.get(name))
+            batch.results[name] = result
+            batch.cancel_events[name] = threading.Event()
+            batch._futures[name] = self._pool.submit(self._run, func, result, batch.cancel_events[name])
+        
+        # 全部送出後才註冊完成回呼，避免提早判定整批結束
+        for name, future in batch._futures.items():
+            future.add_done_callback(lambda _, name=name: batch._settle(name))
+        
+        with self._lock:
+            self._batches = [b for b in self._batches if not b.done()]
+            self._batches.append(batch)
+        return batch
+    
+    def _run(self, func: Callable[[threading.Event], object], result: ActionResult,
+             cancel_event: threading.Event):
+        """執行緒池中實際執行單一動作"""
+        result.started_at = self.clock()
+        if cancel_event.is_set():
+            result.status = "cancelled"
+            result.finished_at = result.started_at
+            return None
+        
+        result.status = "running"
+        try:
+            result.value = func(cancel_event)
+            if result.status == "running":
+                result.status = "cancelled" if cancel_event.is_set() else "done"
+            return result.value
+        except Exception as e:
+            result.error = e
+            result.status = "failed"
+            raise
+        finally:
+            result.finished_at = self.clock()
+    
+    def cancel_all(self):
+        """取消所有尚未結束的動作"""
+        with self._lock:
+            batches, self._batches = self._batches, []
+        for batch in batches:
+            batch.cancel()
+    
+    def shutdown(self):
+        """取消動作並關閉執行緒池"""
+        self.cancel_all()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class InlineExecutor(Executor):
+    """在呼叫端執行緒中同步執行的 Executor（用於虛擬時鐘模擬，結果可重現）"""
+    
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
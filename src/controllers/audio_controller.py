@@ -2,97 +2,313 @@
 音效播放控制器
 用於播放提醒音效
 """
+import asyncio
+import logging
 import os
+import threading
+import time
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 from pygame import mixer, error
 
+logger = logging.getLogger(__name__)
+
+
+class PlaybackHandle:
+    """單次播放的完成通知（以事件等待取代輪詢）"""
+    
+    # 預估結束後仍忙碌時的補償等待上限（秒）
+    GRACE_PERIOD = 0.25
+    
+    def __init__(self, channel, length: float):
+        """
+        Args:
+            channel: 播放所在的 pygame Channel
+            length: 音效長度（秒）
+        """
+        self.channel = channel
+        self.started_at = time.monotonic()
+        self.ends_at = self.started_at + length
+        self._stopped = threading.Event()
+    
+    def stop(self):
+        """停止播放並喚醒等待者"""
+        self.channel.stop()
+        self._stopped.set()
+    
+    def wait(self, cancel_event: Optional[threading.Event] = None) -> bool:
+        """
+        阻塞直到播放完畢，等待期間不佔用 CPU
+        
+        Args:
+            cancel_event: 取消事件（選用），觸發後停止播放
+        
+        Returns:
+            bool: 正常播放完畢返回 True，被取消返回 False
+        """
+        waiter = cancel_event if cancel_event is not None else self._stopped
+        deadline = self.ends_at + self.GRACE_PERIOD
+        
+        remaining = self.ends_at - time.monotonic()
+        while remaining > 0:
+            if waiter.wait(remaining) or self._stopped.is_set():
+                self.stop()
+                return False
+            if not self.channel.get_busy():
+                return True
+            # 混音器緩衝造成的微小延遲：短暫補償等待
+            remaining = min(0.02, deadline - time.monotonic())
+        return True
+
 
 class AudioController:
     """音效播放控制器"""
     
-    def __init__(self):
-        """初始化音效系統"""
+    def __init__(self, sound_files: Optional[Iterable[str]] = None):
+        """
+        初始化音效系統
+        
+        Args:
+            sound_files: 啟動時預先解碼至記憶體的音效檔案清單（選用）
+        """
+        self._sounds: Dict[str, "mixer.Sound"] = {}
+        self._channels: Dict[str, "mixer.Channel"] = {}
+        self._channel_ids: Dict[str, int] = {}
+        # 已卸載音效釋出的聲道編號，載入新音效時優先重複使用
+        self._free_channels: List[int] = []
+        self._lock = threading.Lock()
+        
         try:
             if not mixer.get_init():
-                mixer.init(44100, -16, 2)
-            print("HW: Pygame Mixer 音訊系統已初始化。")
+                # 較小的緩衝區可降低觸發到出聲的延遲
+                mixer.init(44100, -16, 2, 512)
+            logger.info("HW: Pygame Mixer 音訊系統已初始化。")
         except Exception as e:
-            print(f"FATAL: 初始化 Pygame Mixer 失敗: {e}")
+            logger.error(f"FATAL: 初始化 Pygame Mixer 失敗: {e}")
             raise
+        
+        if sound_files:
+            self.preload(sound_files)
     
-    def play_sound(self, filename: str, blocking: bool = True) -> bool:
+    def preload(self, filenames: Iterable[str]) -> int:
+        """
+        將音效解碼至記憶體並為每個音效保留專屬聲道
+        
+        Args:
+            filenames: 音效檔案路徑清單
+        
+        Returns:
+            int: 成功載入的音效數量
+        """
+        loaded = 0
+        for filename in filenames:
+            if self._load(filename) is not None:
+                loaded += 1
+        return loaded
+    
+    def _load(self, filename: str):
+        """內部函式：取得已快取的音效，未快取時解碼一次並保留聲道"""
+        with self._lock:
+            sound = self._sounds.get(filename)
+            if sound is not None:
+                return sound
+            
+            if not os.path.exists(filename):
+                logger.error(f"❌ 錯誤: 找不到音效檔案 '{filename}'")
+                return None
+            
+            try:
+                sound = mixer.Sound(filename)
+            except error as e:
+                logger.warning(f"⚠️ 無法預先解碼 '{filename}'，改用串流播放: {e}")
+                return None
+            
+            # 保留專屬聲道，避免與其他音效互相搶佔
+            try:
+                index = self._reserve_channel()
+                channel = mixer.Channel(index)
+            except (error, IndexError) as e:
+                logger.warning(f"⚠️ 無法為 '{filename}' 保留聲道，改用串流播放: {e}")
+                return None
+            self._sounds[filename] = sound
+            self._channels[filename] = channel
+            self._channel_ids[filename] = index
+            logger.info(f"🎼 已快取音效: {Path(filename).name} ({sound.get_length():.1f} 秒)")
+            return sound
+    
+    def _reserve_channel(self) -> int:
+        """內部函式：取得一個專屬聲道編號（呼叫者須持有 _lock）；聲道不足時擴充混音器的聲道數"""
+        if self._free_channels:
+            return self._free_channels.pop()
+        index = len(self._channels)
+        if index >= mixer.get_num_channels():
+            # pygame 預設只有 8 個聲道
+            mixer.set_num_channels(index + 1)
+        mixer.set_reserved(index + 1)
+        return index
+    
+    def unload(self, filenames: Iterable[str]) -> int:
+        """
+        自快取移除音效並釋出其聲道（設定熱重載更換音效後呼叫）
+        
+        Args:
+            filenames: 音效檔案路徑清單
+        
+        Returns:
+            int: 實際移除的音效數量
+        """
+        removed = 0
+        with self._lock:
+            for filename in filenames:
+                if self._sounds.pop(filename, None) is None:
+                    continue
+                self._channels.pop(filename).stop()
+                self._free_channels.append(self._channel_ids.pop(filename))
+                removed += 1
+                logger.info(f"🎼 已卸載音效: {Path(filename).name}")
+        return removed
+    
+    def start_sound(self, filename: str) -> Optional[PlaybackHandle]:
+        """
+        立即從記憶體播放快取音效（不等待）
+        
+        Args:
+            filename: 音效檔案路徑
+        
+        Returns:
+            Optional[PlaybackHandle]: 播放控制代碼，無法播放時返回 None
+        """
+        sound = self._load(filename)
+        if sound is None:
+            return None
+        
+        channel = self._channels[filename]
+        channel.play(sound)
+        return PlaybackHandle(channel, sound.get_length())
+    
+    def play_sound(self, filename: str, blocking: bool = True,
+                   cancel_event: Optional[threading.Event] = None) -> bool:
         """
         播放音效
         
         Args:
             filename: 音效檔案路徑
             blocking: 是否等待播放完畢（預設 True）
+            cancel_event: 取消事件（選用），觸發後停止播放
         
         Returns:
             bool: 播放成功返回 True，失敗返回 False
         """
         try:
-            if not os.path.exists(filename):
-                print(f"❌ 錯誤: 找不到音效檔案 '{filename}'")
-                return False
+            logger.debug(f"🔊 正在播放: {filename}")
             
-            print(f"🔊 正在播放: {filename}")
+            handle = self.start_sound(filename)
+            if handle is None:
+                return self._stream_sound(filename, blocking, cancel_event)
             
-            # 載入並播放音效
-            mixer.music.load(filename)
-            mixer.music.play()
-            
-            if blocking:
-                # 等待播放完成
-                while mixer.music.get_busy():
-                    mixer.time.Clock().tick(10)
+            if blocking and not handle.wait(cancel_event):
+                logger.debug(f"⏹️ 音效播放已取消: {filename}")
+                return False
             
-            print(f"✅ 音效播放完成: {filename}")
+            logger.debug(f"✅ 音效播放完成: {filename}")
             return True
-            
+        
         except error as e:
-            print(f"❌ Pygame 錯誤: {e}")
+            logger.error(f"❌ Pygame 錯誤: {e}")
             return False
         except Exception as e:
-            print(f"❌ 播放音效時發生錯誤: {e}")
+            logger.error(f"❌ 播放音效時發生錯誤: {e}")
             return False
     
-    def play_alert1(self, sound_file: str) -> bool:
+    async def play_sound_async(self, filename: str) -> bool:
+        """
+        播放音效的 asyncio 版本：自記憶體快取立即播放，以 asyncio.sleep 等待結束
+        
+        Args:
+            filename: 音效檔案路徑
+        
+        Returns:
+            bool: 播放成功返回 True
+        """
+        logger.debug(f"🔊 正在播放: {filename}")
+        handle = self.start_sound(filename)
+        if handle is None:
+            # 無法預先解碼：改在執行緒中串流播放
+            return await asyncio.to_thread(self._stream_sound, filename, True, None)
+        
+        try:
+            remaining = handle.ends_at - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        except asyncio.CancelledError:
+            handle.stop()
+            logger.debug(f"⏹️ 音效播放已取消: {filename}")
+            raise
+        
+        logger.debug(f"✅ 音效播放完成: {filename}")
+        return True
+    
+    def _stream_sound(self, filename: str, blocking: bool,
+                      cancel_event: Optional[threading.Event]) -> bool:
+        """內部函式：無法預先解碼時，退回 mixer.music 串流播放"""
+        if not os.path.exists(filename):
+            return False
+        
+        mixer.music.load(filename)
+        mixer.music.play()
+        
+        if blocking:
+            waiter = cancel_event if cancel_event is not None else threading.Event()
+            while mixer.music.get_busy():
+                if waiter.wait(0.1):
+                    mixer.music.stop()
+                    logger.debug(f"⏹️ 音效播放已取消: {filename}")
+                    return False
+        
+        logger.debug(f"✅ 音效播放完成: {filename}")
+        return True
+    
+    def play_alert1(self, sound_file: str, cancel_event: Optional[threading.Event] = None) -> bool:
         """
         播放階段1提醒音效
         
         Args:
             sound_file: 音效檔案路徑
-            
+            cancel_event: 取消事件（選用）
+        
         Returns:
             bool: 播放成功返回 True
         """
-        print("🎵 [階段1] 播放提醒音效...")
-        return self.play_sound(sound_file, blocking=True)
+        logger.info("🎵 [階段1] 播放提醒音效...")
+        return self.play_sound(sound_file, blocking=True, cancel_event=cancel_event)
     
-    def play_alert2(self, sound_file: str) -> bool:
+    def play_alert2(self, sound_file: str, cancel_event: Optional[threading.Event] = None) -> bool:
         """
         播放階段2提醒音效
         
         Args:
             sound_file: 音效檔案路徑
-            
+            cancel_event: 取消事件（選用）
+        
         Returns:
             bool: 播放成功返回 True
         """
-        print("🎵 [階段2] 播放嚴重提醒音效...")
-        return self.play_sound(sound_file, blocking=True)
+        logger.info("🎵 [階段2] 播放嚴重提醒音效...")
+        return self.play_sound(sound_file, blocking=True, cancel_event=cancel_event)
     
     def stop(self):
         """停止所有音效"""
         mixer.stop()
-        print("已停止所有音效")
+        logger.info("已停止所有音效")
     
     def cleanup(self):
         """清理音效系統"""
         try:
+            self._sounds.clear()
+            self._channels.clear()
+            self._channel_ids.clear()
+            self._free_channels.clear()
             mixer.quit()
-            print("HW: Pygame Mixer 已清理。")
+            logger.info("HW: Pygame Mixer 已清理。")
         except Exception as e:
-            print(f"清理 Pygame Mixer 時發生錯誤: {e}")
-
+            logger.warning(f"清理 Pygame Mixer 時發生錯誤: {e}")
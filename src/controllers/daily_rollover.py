@@ -0,0 +1,132 @@
+"""
+換日工作模組
+每天本地時間 00:00 將各馬桶蓋的當日計數歸零、寫入當日統計，並依設定發送每日摘要
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class DailyRollover:
+    """
+    午夜換日排程
+    
+    排程器使用單調時鐘，因此每次只排到下一個午夜；觸發時以牆上時間確認日期確實已變更
+    （時鐘校正造成提早觸發時重新排程）。每位收件者最多收到一則摘要：有延後提醒時由
+    end_of_day 發送，否則在啟用 DAILY_SUMMARY_ENABLED 時另外發送。啟動時若還原的計數屬於
+    較早的日期（停機跨過午夜），立即補做換日並補發該日的摘要。
+    """
+    
+    # 午夜後多等的時間（秒），避免在 23:59:59.9 觸發
+    MARGIN = 0.5
+    
+    def __init__(self, lids: Dict[str, object], scheduler, line_service, event_store=None,
+                 now: Callable[[], datetime] = datetime.now):
+        """
+        Args:
+            lids: 馬桶蓋名稱 → LidController
+            scheduler: DeadlineScheduler 或 LoopScheduler
+            line_service: LINE 通知服務
+            event_store: 事件紀錄（選用），用於讀取當日彙總
+            now: 取得本地時間的函式
+        """
+        self.lids = lids
+        self.scheduler = scheduler
+        self.line_service = line_service
+        self.event_store = event_store
+        self.now = now
+        self._day: Optional[date] = None
+        self._task = None
+    
+    def start(self) -> "DailyRollover":
+        """補做停機期間錯過的換日，並排定下一次換日"""
+        try:
+            self._roll_over(self.now().date())
+        except Exception as e:
+            logger.exception(f"❌ 啟動時補做換日失敗: {e}")
+        self._schedule_next()
+        return self
+    
+    def _schedule_next(self):
+        """內部函式：排到下一個本地午夜"""
+        now = self.now()
+        self._day = now.date()
+        midnight = datetime.combine(self._day + timedelta(days=1), datetime.min.time())
+        delay = (midnight - now).total_seconds() + self.MARGIN
+        self._task = self.scheduler.schedule(delay, self.run)
+        logger.debug(f"📅 下一次換日於 {delay / 3600:.2f} 小時後")
+    
+    def run(self):
+        """換日：歸零各馬桶蓋的計數、輸出當日統計並發送摘要，完成後排定下一次"""
+        today = self.now().date()
+        if today == self._day:
+            # 提早觸發（牆上時間被往回校正）
+            self._schedule_next()
+            return
+        
+        try:
+            self._roll_over(today)
+        except Exception as e:
+            logger.exception(f"❌ 換日工作失敗: {e}")
+        finally:
+            self._schedule_next()
+    
+    def _roll_over(self, today: date):
+        """內部函式：歸零日期早於 today 的馬桶蓋計數，依結束的日期輸出統計並發送摘要"""
+        totals: Dict[date, Dict[Optional[str], int]] = {}
+        for lid in self.lids.values():
+            rolled = lid.roll_over(today)
+            if rolled is None:
+                continue
+            ended_day, count = rolled
+            day_totals = totals.setdefault(ended_day, {})
+            day_totals[lid.recipient] = day_totals.get(lid.recipient, 0) + count
+        if not totals:
+            return
+        
+        days = sorted(totals)
+        loop = getattr(self.scheduler, "loop", None)
+        if loop is not None:
+            # asyncio 模式：flush 會等待事件紀錄的寫入執行緒，改在執行緒池中讀取，不阻塞事件迴圈
+            loop.run_in_executor(None, self._log_daily_stats, days)
+        else:
+            self._log_daily_stats(days)
+        for day in days:
+            self._send_summaries(day.isoformat(), totals[day])
+    
+    def _log_daily_stats(self, days: List[date]):
+        """內部函式：輸出各日彙總（事件紀錄在寫入時已累加，此處只讀取彙總表）"""
+        if self.event_store is None:
+            return
+        try:
+            self.event_store.flush()
+            for day in days:
+                for row in self.event_store.daily_stats(day.isoformat()):
+                    logger.info(f"📊 [{row['lid']}] {day} 開蓋 {row['opens']} 次"
+                                f"（共 {row['open_seconds'] / 60:.1f} 分鐘）"
+                                f" | 提醒 {row['alerts']} 次（階段2 {row['stage2_alerts']} 次）"
+                                f" | 失敗動作 {row['failed_actions']} 次")
+        except Exception as e:
+            logger.error(f"❌ 讀取當日統計失敗: {e}")
+    
+    def _send_summaries(self, day: str, totals: Dict[Optional[str], int]):
+        """內部函式：每位收件者最多發送一則每日摘要"""
+        send_summary = Config.current().DAILY_SUMMARY_ENABLED
+        for recipient, total in totals.items():
+            try:
+                if self.line_service.end_of_day(day, total, recipient):
+                    continue
+                if send_summary:
+                    self.line_service.send_daily_summary(day, total, recipient)
+            except Exception as e:
+                logger.error(f"❌ 發送每日摘要失敗（{recipient or '預設收件者'}）: {e}")
+    
+    def stop(self):
+        """取消已排定的換日"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,507 @@
+"""
+單一馬桶蓋控制器模組
+每個馬桶蓋擁有獨立的狀態機與每日計數，共用音效、通知、排程與動作執行器
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LidController:
+    """單一馬桶蓋控制器（狀態機、倒數計時與每日計數）"""
+    
+    def __init__(self, name: str, reed_switch, servo, audio, line_service, scheduler,
+                 action_executor, alert1_sound: str, alert2_sound: str,
+                 recipient: Optional[str] = None, event_store=None, state_store=None,
+                 on_alert: Optional[Callable[["LidController", object], None]] = None,
+                 today: Callable[[], date] = date.today):
+        """
+        初始化馬桶蓋控制器
+        
+        Args:
+            name: 馬桶蓋名稱（用於輸出與通知）
+            reed_switch: 此馬桶蓋的磁簧開關
+            servo: 此馬桶蓋的伺服馬達
+            audio: 共用的音效控制器
+            line_service: 共用的 LINE 通知服務
+            scheduler: 共用的期限排程器
+            action_executor: 共用的提醒動作執行器
+            alert1_sound: 階段1 音效檔案路徑
+            alert2_sound: 階段2 音效檔案路徑
+            recipient: LINE 收件者 ID（預設使用服務的 user_id）
+            event_store: 共用的事件紀錄（選用）
+            state_store: 共用的狀態快照，狀態轉換時更新（選用）
+            on_alert: 提醒動作全部結束後的回呼 (lid, batch)（選用）
+            today: 取得今日日期的函式（模擬時可替換為虛擬日曆）
+        """
+        self.name = name
+        self.reed_switch = reed_switch
+        self.servo = servo
+        self.audio = audio
+        self.line_service = line_service
+        self.scheduler = scheduler
+        self.action_executor = action_executor
+        self.alert1_sound = alert1_sound
+        self.alert2_sound = alert2_sound
+        self.recipient = recipient
+        self.event_store = event_store
+        self.state_store = state_store
+        self.on_alert = on_alert
+        self.today = today
+        self._state_listeners: List[Callable[[str, Dict[str, object]], None]] = []
+        # 倒數與延遲使用排程器的時鐘，模擬時即為虛擬時鐘
+        self.clock = getattr(scheduler, "clock", time.monotonic)
+        
+        # 狀態變數
+        self.countdown_task = None
+        self.countdown_deadline = None
+        self.is_countdown_active = False
+        self.opened_at = None
+        self.daily_alert_count = 0
+        self.last_reset_date = self.today()
+        self._restored_deadline = None
+        self._lock = threading.Lock()
+        # 當日計數與日期一起變更；換日工作與提醒可能在不同執行緒
+        self._count_lock = threading.Lock()
+        self._bind_metrics()
+    
+    def _bind_metrics(self):
+        """內部函式：取得此馬桶蓋的指標子項目；倒數相關量測值於抓取時才計算"""
+        self._opens_metric = metrics.LID_OPENS.labels(self.name)
+        self._closes_metric = metrics.LID_CLOSES.labels(self.name)
+        self._open_duration_metric = metrics.LID_OPEN_DURATION.labels(self.name)
+        self._alert_overhead_metric = metrics.ALERT_OVERHEAD.labels(self.name)
+        self._servo_cycle_metric = metrics.SERVO_CYCLE.labels(self.name)
+        metrics.COUNTDOWN_ACTIVE.labels(self.name).set_function(lambda: 1 if self.is_countdown_active else 0)
+        metrics.COUNTDOWN_REMAINING.labels(self.name).set_function(self._countdown_remaining)
+        metrics.DAILY_ALERT_COUNT.labels(self.name).set_function(lambda: self.daily_alert_count)
+    
+    def _countdown_remaining(self) -> float:
+        """內部函式：倒數剩餘秒數（未倒數時為 0）"""
+        deadline = self.countdown_deadline
+        if not self.is_countdown_active or deadline is None:
+            return 0.0
+        return max(0.0, deadline - self.clock())
+    
+    def bind(self):
+        """綁定 GPIO 事件"""
+        self.reed_switch.when_activated = self.on_lid_opened
+        self.reed_switch.when_deactivated = self.on_lid_closed
+    
+    def restore_state(self, state: Optional[Dict]):
+        """
+        還原重新啟動前保存的狀態（須在 check_initial_state 之前呼叫）
+        
+        Args:
+            state: StateStore.load() 返回的此馬桶蓋狀態，None 表示沒有紀錄
+        """
+        if not state:
+            return
+        self.daily_alert_count = state["daily_alert_count"]
+        self.last_reset_date = date.fromisoformat(state["last_reset_date"])
+        if state["countdown_deadline"] is not None:
+            # 保存的是牆上時間，換算回本次啟動的單調時鐘
+            self._restored_deadline = self.clock() + (state["countdown_deadline"] - time.time())
+        logger.info(f"♻️ [{self.name}] 已還原狀態: {self.last_reset_date} 第 {self.daily_alert_count} 次"
+                    f"{'，倒數進行中' if self._restored_deadline is not None else ''}")
+    
+    def check_initial_state(self):
+        """
+        啟動時檢查當前狀態，蓋子已抬起則開始計時
+        
+        有保存的倒數時沿用原期限；否則自磁簧開關記錄的開蓋時間（啟動期間開蓋）
+        或啟用時間（開機前已抬起）起算，不把初始化所花的時間算進寬限期。
+        """
+        restored_deadline, self._restored_deadline = self._restored_deadline, None
+        if self.reed_switch.value == 1:
+            if restored_deadline is not None:
+                remaining = max(0.0, restored_deadline - self.clock())
+                logger.info(f"[啟動檢測][{self.name}] 當前蓋子為「抬起」狀態，接續原倒數（剩餘 {remaining:.1f} 秒）...")
+            else:
+                opened_at = self._opened_since()
+                if opened_at is not None:
+                    restored_deadline = opened_at + Config.current().LID_OPEN_TIMEOUT
+                    self.opened_at = opened_at
+                logger.info(f"[啟動檢測][{self.name}] 當前蓋子為「抬起」狀態，啟動計時器...")
+            self.start_countdown(restored_deadline)
+        else:
+            logger.info(f"[啟動檢測][{self.name}] 當前蓋子為「放下」狀態。")
+            if restored_deadline is not None:
+                self._save_state()
+        self._publish("startup")
+    
+    def _opened_since(self) -> Optional[float]:
+        """內部函式：磁簧開關記錄的抬起起點（與排程器使用不同時鐘時無法換算，返回 None）"""
+        if getattr(self.reed_switch, "clock", None) is not self.clock:
+            return None
+        event = getattr(self.reed_switch, "last_event", None)
+        if event is not None:
+            return event.raw_timestamp if event.value == 1 else None
+        return getattr(self.reed_switch, "armed_at", None)
+    
+    def roll_over(self, current_date: Optional[date] = None) -> Optional[Tuple[date, int]]:
+        """
+        日期變更時將當日計數歸零（與提醒的累加互斥，不會遺失或重複計算）
+        
+        Args:
+            current_date: 新的日期，預設為 today()
+        
+        Returns:
+            (結束的日期, 當日提醒次數)；日期未變更返回 None
+        """
+        current_date = current_date or self.today()
+        with self._count_lock:
+            if current_date == self.last_reset_date:
+                return None
+            ended, count = self.last_reset_date, self.daily_alert_count
+            self.daily_alert_count = 0
+            self.last_reset_date = current_date
+            self._save_state()
+        logger.info(f"📅 [{self.name}] 日期變更: {ended} → {current_date}，前日提醒 {count} 次，計數器已重置為 0")
+        self._publish("rollover")
+        return ended, count
+    
+    def check_and_reset_daily_count(self):
+        """檢查日期是否已變更，若變更則重置計數器（換日工作未執行時的備援，例如系統休眠跨過午夜）"""
+        rolled = self.roll_over()
+        if rolled is not None:
+            ended, count = rolled
+            self.line_service.end_of_day(ended.isoformat(), count, self.recipient)
+    
+    def trigger_alert_and_push(self, deadline: Optional[float] = None):
+        """
+        定時器到期，觸發 Stage 1/Stage 2 動作
+        
+        Args:
+            deadline: 觸發此呼叫的倒數期限；與目前倒數不符時表示為過期任務，直接忽略
+        """
+        with self._lock:
+            if not self.is_countdown_active:
+                return
+            if deadline is not None and deadline != self.countdown_deadline:
+                return
+            self.is_countdown_active = False
+        
+        # 檢查當前狀態: 磁鐵是否仍遠離 (HIGH = 1)
+        if self.reed_switch.value == 1:
+            logger.info(f"⏰ [{self.name}] 計時器到期！蓋子仍未放下。")
+            
+            # 檢查並重置每日計數
+            self.check_and_reset_daily_count()
+            
+            with self._count_lock:
+                # 累加計數
+                self.daily_alert_count += 1
+                alert_count = self.daily_alert_count
+                self._save_state()
+            config = Config.current()
+            stage = "stage1" if alert_count < config.DAILY_ALERT_THRESHOLD else "stage2"
+            self._record("alert", value=alert_count, status=stage)
+            metrics.ALERTS.labels(self.name, stage).inc()
+            
+            self._dispatch_actions(self._build_actions(alert_count, config), config)
+            self._publish("alert")
+        else:
+            logger.info(f"✅ [{self.name}] 計時器到期前，蓋子已放下。無需提醒。")
+            self._save_state()
+    
+    def _build_actions(self, alert_count: int, config):
+        """依當日次數與設定快照決定階段並建立提醒動作（動作名稱 → 接收取消事件的可呼叫物件）"""
+        if alert_count < config.DAILY_ALERT_THRESHOLD:
+            # === 階段1：本地提醒 ===
+            logger.info(f"🔔 [階段1 提醒][{self.name}] 當日第 {alert_count} 次")
+            
+            return {
+                # 播放提醒音效
+                "audio": lambda cancel: self.audio.play_alert1(self.alert1_sound, cancel_event=cancel),
+                # 啟動伺服馬達推動蓋子
+                "servo": lambda cancel: self.servo.push_lid_down(cancel_event=cancel),
+            }
+        
+        # === 階段2：嚴重警告 + LINE 通知 ===
+        logger.info(f"🚨 [階段2 警告][{self.name}] 當日第 {alert_count} 次（已達門檻）")
+        
+        today = self.last_reset_date.isoformat()
+        return {
+            # 播放嚴重警告音效
+            "audio": lambda cancel: self.audio.play_alert2(self.alert2_sound, cancel_event=cancel),
+            # 啟動伺服馬達推動蓋子
+            "servo": lambda cancel: self.servo.push_lid_down(cancel_event=cancel),
+            # 發送 LINE 通知
+            "line": lambda cancel: self.line_service.send_alert(alert_count, today, self.recipient),
+        }
+    
+    @staticmethod
+    def _action_deadlines(config):
+        """各提醒動作的期限（自計時器到期起算，秒）"""
+        return {
+            "audio": config.AUDIO_ACTION_DEADLINE,
+            "servo": config.SERVO_ACTION_DEADLINE,
+            "line": config.LINE_ACTION_DEADLINE,
+        }
+    
+    def _dispatch_actions(self, actions, config):
+        """同時啟動各提醒動作；期限由排程器執行，全部結束後輸出延遲報告（不阻塞呼叫者）"""
+        origin = self.countdown_deadline if self.countdown_deadline is not None else self.clock()
+        batch = self.action_executor.execute(actions, deadlines=self._action_deadlines(config), origin=origin)
+        batch.arm_deadlines(self.scheduler)
+        expected_at = self.countdown_deadline
+        batch.add_done_callback(lambda batch: self._on_actions_done(batch, expected_at))
+    
+    def _on_actions_done(self, batch, expected_at: Optional[float] = None):
+        """
+        提醒動作全部結束（或逾期）後輸出延遲報告並更新指標
+        
+        Args:
+            batch: 已結束的動作批次
+            expected_at: 觸發提醒的倒數期限（排程器時鐘；熱重新載入不會改變已排定的期限），
+                用於提醒的額外延遲（自倒數期限至第一個動作啟動）
+        """
+        logger.info(f"📈 [{self.name}] 提醒動作延遲報告（自計時器到期起算）:")
+        logger.info(batch.report())
+        servo = batch.results.get("servo")
+        # 伺服馬達返回 ServoCycle；推蓋逾期失敗時由 LidCloseTimeout 帶回
+        cycle = None
+        if servo is not None:
+            cycle = servo.value if servo.value is not None else getattr(servo.error, "cycle", None)
+        for name, result in batch.results.items():
+            detail = {"name": name, "duration": result.duration}
+            if name == "servo" and cycle is not None:
+                detail.update(cycle.as_dict())
+            self._record("action", duration=result.latency_from(batch.origin), status=result.status,
+                         detail=detail)
+        started = [result.started_at for result in batch.results.values() if result.started_at is not None]
+        if expected_at is not None and started:
+            self._alert_overhead_metric.observe(min(started) - expected_at)
+        if cycle is not None and cycle.actuation_time is not None:
+            self._servo_cycle_metric.observe(cycle.actuation_time)
+            metrics.SERVO_OUTCOMES.labels(self.name, cycle.outcome).inc()
+        elif servo is not None and servo.status == "done" and servo.duration is not None:
+            self._servo_cycle_metric.observe(servo.duration)
+        if self.on_alert is not None:
+            self.on_alert(self, batch)
+    
+    def start_countdown(self, deadline: Optional[float] = None):
+        """
+        當馬桶蓋開啟時 (HIGH = 1)，啟動計時器
+        
+        Args:
+            deadline: 指定的倒數期限（排程器時鐘的時間點），預設為 LID_OPEN_TIMEOUT 秒後
+        """
+        with self._lock:
+            if self.is_countdown_active:
+                return
+            
+            if deadline is None:
+                timeout = Config.current().LID_OPEN_TIMEOUT
+                logger.info(f"[狀態][{self.name}] 馬桶蓋開啟 (HIGH)。{timeout} 秒後將檢查並觸發動作...")
+                deadline = self.clock() + timeout
+            
+            self.countdown_deadline = deadline
+            self.countdown_task = self.scheduler.schedule_at(
+                self.countdown_deadline, self.trigger_alert_and_push, self.countdown_deadline
+            )
+            self.is_countdown_active = True
+            self._save_state()
+    
+    def stop_countdown(self):
+        """當馬桶蓋關閉時 (LOW = 0)，取消計時器"""
+        with self._lock:
+            if self.is_countdown_active:
+                logger.info(f"[狀態][{self.name}] 馬桶蓋已放下！取消計時器。")
+                if self.countdown_task:
+                    self.countdown_task.cancel()
+                self.is_countdown_active = False
+                self._save_state()
+    
+    def on_lid_opened(self, event=None):
+        """事件：訊號從 LOW 變為 HIGH (磁鐵遠離 -> 蓋子抬起)，event 為磁簧開關的 ReedEvent"""
+        logger.info(f"[偵測][{self.name}] 訊號 HIGH (1): 馬桶蓋抬起！{self._describe_bounces(event)}")
+        self.opened_at = self.clock()
+        self._opens_metric.inc()
+        self._record("lid_opened", value=getattr(event, "bounces", None))
+        self.start_countdown()
+        self._publish("lid_opened")
+    
+    def on_lid_closed(self, event=None):
+        """事件：訊號從 HIGH 變為 LOW (磁鐵靠近 -> 蓋子放下)，event 為磁簧開關的 ReedEvent"""
+        logger.info(f"[偵測][{self.name}] 訊號 LOW (0): 馬桶蓋放下！{self._describe_bounces(event)}")
+        open_time = self.clock() - self.opened_at if self.opened_at is not None else None
+        self.opened_at = None
+        self._closes_metric.inc()
+        if open_time is not None:
+            self._open_duration_metric.observe(open_time)
+        self._record("lid_closed", value=getattr(event, "bounces", None), duration=open_time)
+        self.stop_countdown()
+        self._publish("lid_closed")
+    
+    def _save_state(self):
+        """內部函式：更新狀態快照（倒數期限以牆上時間保存，跨重新啟動仍有效）"""
+        if self.state_store is None:
+            return
+        deadline = None
+        if self.is_countdown_active and self.countdown_deadline is not None:
+            deadline = time.time() + (self.countdown_deadline - self.clock())
+        self.state_store.save(self.name, self.daily_alert_count, self.last_reset_date.isoformat(), deadline)
+    
+    def _record(self, kind: str, **fields):
+        """內部函式：寫入事件紀錄（未設定事件紀錄時略過）"""
+        if self.event_store is not None:
+            self.event_store.record(kind, self.name, **fields)
+    
+    def snapshot(self) -> Dict[str, object]:
+        """目前狀態（儀表板使用）"""
+        return {
+            "lid": self.name,
+            "open": self.reed_switch.value == 1,
+            "countdown_active": self.is_countdown_active,
+            "countdown_remaining": round(self._countdown_remaining(), 1),
+            "daily_alert_count": self.daily_alert_count,
+            "day": self.last_reset_date.isoformat(),
+        }
+    
+    def add_state_listener(self, callback: Callable[[str, Dict[str, object]], None]):
+        """
+        註冊狀態監聽者（儀表板、MQTT），狀態轉換時以 (事件種類, snapshot()) 呼叫
+        
+        Args:
+            callback: 在控制器的執行緒中呼叫，只能放入佇列，不可做 I/O
+        """
+        self._state_listeners = self._state_listeners + [callback]
+    
+    def _publish(self, event: str):
+        """內部函式：通知狀態監聽者"""
+        if not self._state_listeners:
+            return
+        state = self.snapshot()
+        for listener in self._state_listeners:
+            try:
+                listener(event, state)
+            except Exception as e:
+                logger.exception(f"❌ [{self.name}] 狀態監聽者執行失敗: {e}")
+    
+    @staticmethod
+    def _describe_bounces(event) -> str:
+        """內部函式：有合併抖動時附加說明"""
+        bounces = getattr(event, "bounces", 0)
+        return f"（已合併 {bounces} 次抖動）" if bounces else ""
+    
+    def cleanup(self):
+        """取消計時器並清理此馬桶蓋的硬體"""
+        if self.countdown_task:
+            self.countdown_task.cancel()
+        self.servo.cleanup()
+        self.reed_switch.cleanup()
+
+
+class AsyncLidController(LidController):
+    """
+    asyncio 模式的馬桶蓋控制器
+    
+    GPIO 事件由 gpiozero 執行緒轉送至事件迴圈，倒數與提醒動作全部在事件迴圈執行緒上運作，
+    狀態只在單一執行緒中變更。
+    """
+    
+    def __init__(self, *args, loop: asyncio.AbstractEventLoop, **kwargs):
+        """
+        Args:
+            loop: 執行所有狀態轉換的事件迴圈（其餘參數同 LidController）
+        """
+        super().__init__(*args, **kwargs)
+        self.loop = loop
+        self._action_tasks = set()
+    
+    def bind(self):
+        """綁定 GPIO 事件：回呼只負責把事件排入事件迴圈"""
+        self.reed_switch.when_activated = (
+            lambda event=None: self.loop.call_soon_threadsafe(self.on_lid_opened, event)
+        )
+        self.reed_switch.when_deactivated = (
+            lambda event=None: self.loop.call_soon_threadsafe(self.on_lid_closed, event)
+        )
+    
+    def _build_actions(self, alert_count: int, config):
+        """建立提醒動作（動作名稱 → 協程函式）"""
+        if alert_count < config.DAILY_ALERT_THRESHOLD:
+            # === 階段1：本地提醒 ===
+            logger.info(f"🔔 [階段1 提醒][{self.name}] 當日第 {alert_count} 次")
+            
+            return {
+                "audio": lambda: self.audio.play_sound_async(self.alert1_sound),
+                "servo": lambda: self.servo.push_lid_down_async(),
+            }
+        
+        # === 階段2：嚴重警告 + LINE 通知 ===
+        logger.info(f"🚨 [階段2 警告][{self.name}] 當日第 {alert_count} 次（已達門檻）")
+        
+        today = self.last_reset_date.isoformat()
+        
+        async def notify():
+            # HTTP 為非同步傳輸，但額度與延後次數的保存是同步的 SQLite 提交，改在執行緒池中執行
+            return await self.loop.run_in_executor(
+                None, self.line_service.send_alert, alert_count, today, self.recipient
+            )
+        
+        return {
+            "audio": lambda: self.audio.play_sound_async(self.alert2_sound),
+            "servo": lambda: self.servo.push_lid_down_async(),
+            "line": notify,
+        }
+    
+    def _dispatch_actions(self, actions: Dict[str, Callable], config):
+        """以事件迴圈任務同時執行各提醒動作，逾期以 asyncio.wait_for 取消"""
+        from controllers.action_executor import ActionBatch, ActionResult
+        
+        origin = self.countdown_deadline if self.countdown_deadline is not None else self.clock()
+        batch = ActionBatch(origin)
+        deadlines = self._action_deadlines(config)
+        
+        tasks = []
+        for name, factory in actions.items():
+            result = ActionResult(name, deadlines.get(name))
+            batch.results[name] = result
+            tasks.append(self._run_action(factory, result, origin))
+        
+        task = self.loop.create_task(self._gather_actions(batch, tasks, self.countdown_deadline))
+        self._action_tasks.add(task)
+        task.add_done_callback(self._action_tasks.discard)
+    
+    async def _gather_actions(self, batch, coroutines, expected_at: Optional[float] = None):
+        """等待所有動作結束後輸出延遲報告"""
+        await asyncio.gather(*coroutines)
+        self._on_actions_done(batch, expected_at)
+    
+    @staticmethod
+    async def _run_action(factory: Callable, result, origin: float):
+        """執行單一動作並記錄狀態與延遲"""
+        result.started_at = time.monotonic()
+        result.status = "running"
+        timeout = None
+        if result.deadline is not None:
+            timeout = max(0.0, origin + result.deadline - result.started_at)
+        try:
+            result.value = await asyncio.wait_for(factory(), timeout)
+            result.status = "done"
+        except asyncio.TimeoutError:
+            result.status = "timeout"
+        except asyncio.CancelledError:
+            result.status = "cancelled"
+        except Exception as e:
+            result.error = e
+            result.status = "failed"
+        finally:
+            result.finished_at = time.monotonic()
+    
+    def cancel_actions(self):
+        """取消進行中的提醒動作"""
+        for task in list(self._action_tasks):
+            task.cancel()
+
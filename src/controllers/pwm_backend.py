@@ -0,0 +1,134 @@
+"""
+PWM 輸出後端模組
+伺服馬達只在動作期間輸出 PWM：start() 取得輸出並送出佔空比，stop() 完全停止，
+close() 於程式結束時釋放腳位。各後端介面同 RPi.GPIO.PWM（start / ChangeDutyCycle / stop）
+"""
+import logging
+import time
+from pathlib import Path
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SoftwarePWM:
+    """
+    RPi.GPIO 軟體 PWM
+    
+    RPi.GPIO 以背景執行緒切換電位產生 PWM，執行期間每個週期喚醒兩次；
+    stop() 後執行緒結束，閒置時不佔用 CPU。GPIO 設定延到第一次 start() 才進行。
+    """
+    
+    def __init__(self, pin: int, frequency: float = 50):
+        """
+        Args:
+            pin: GPIO 針腳號碼（BCM）
+            frequency: PWM 頻率（Hz）
+        """
+        self.pin = pin
+        self.frequency = frequency
+        self._gpio = None
+        self._pwm = None
+        self.running = False
+    
+    def start(self, duty_cycle: float):
+        if self._pwm is None:
+            import RPi.GPIO as GPIO
+            
+            # 設定 GPIO 模式；同一腳位只能有一個 PWM 實例，停止後重複使用
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(self.pin, GPIO.OUT)
+            self._gpio = GPIO
+            self._pwm = GPIO.PWM(self.pin, self.frequency)
+        self._pwm.start(duty_cycle)
+        self.running = True
+    
+    def ChangeDutyCycle(self, duty_cycle: float):
+        self._pwm.ChangeDutyCycle(duty_cycle)
+    
+    def stop(self):
+        if self.running:
+            self._pwm.stop()
+            self.running = False
+    
+    def close(self):
+        self.stop()
+        if self._gpio is not None:
+            self._gpio.cleanup(self.pin)
+            self._gpio = self._pwm = None
+
+
+class HardwarePWM:
+    """
+    Linux 核心硬體 PWM（/sys/class/pwm），由 SoC 的 PWM 週邊產生波形，不需要背景執行緒
+    
+    需在 /boot/config.txt 啟用 dtoverlay=pwm 或 pwm-2chan；只有 GPIO 12、13、18、19 可用。
+    start() 時匯出通道，stop() 時停用並取消匯出。
+    """
+    
+    # BCM 腳位 → PWM 通道
+    CHANNELS: Dict[int, int] = {12: 0, 18: 0, 13: 1, 19: 1}
+    
+    def __init__(self, pin: int, frequency: float = 50, chip: int = 0,
+                 sysfs_root: str = "/sys/class/pwm"):
+        """
+        Args:
+            pin: GPIO 針腳號碼（BCM），須為硬體 PWM 腳位
+            frequency: PWM 頻率（Hz）
+            chip: pwmchip 編號
+            sysfs_root: sysfs PWM 目錄
+        """
+        if pin not in self.CHANNELS:
+            raise ValueError(f"GPIO {pin} 不支援硬體 PWM（可用: {sorted(self.CHANNELS)}）")
+        self.pin = pin
+        self.channel = self.CHANNELS[pin]
+        self.chip_dir = Path(sysfs_root) / f"pwmchip{chip}"
+        self.channel_dir = self.chip_dir / f"pwm{self.channel}"
+        self.period_ns = 0
+        self.running = False
+        self.ChangeFrequency(frequency)
+    
+    def _write(self, path: Path, value):
+        """內部函式：寫入 sysfs 屬性"""
+        path.write_text(f"{value}\n")
+    
+    def _export(self, timeout: float = 1.0):
+        """內部函式：匯出 PWM 通道並等待 udev 設定好權限"""
+        if not self.channel_dir.exists():
+            self._write(self.chip_dir / "export", self.channel)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._write(self.channel_dir / "period", self.period_ns)
+                return
+            except (FileNotFoundError, PermissionError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.01)
+    
+    def start(self, duty_cycle: float):
+        if not self.running:
+            self._export()
+        self.ChangeDutyCycle(duty_cycle)
+        if not self.running:
+            self._write(self.channel_dir / "enable", 1)
+            self.running = True
+    
+    def ChangeDutyCycle(self, duty_cycle: float):
+        self._write(self.channel_dir / "duty_cycle", int(self.period_ns * duty_cycle / 100))
+    
+    def ChangeFrequency(self, frequency: float):
+        self.frequency = frequency
+        self.period_ns = int(1e9 / frequency)
+        if self.running:
+            self._write(self.channel_dir / "period", self.period_ns)
+    
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._write(self.channel_dir / "enable", 0)
+        self._write(self.chip_dir / "unexport", self.channel)
+    
+    def close(self):
+        self.stop()
@@ -2,15 +2,82 @@
 伺服馬達控制器模組
 用於輔助馬桶蓋落下
 """
-import RPi.GPIO as GPIO
+import asyncio
+import logging
+import threading
+import time
 from time import sleep
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServoCycle:
+    """單次推蓋動作的紀錄（時間皆為伺服馬達時鐘）"""
+    
+    __slots__ = ("outcome", "started_at", "pushed_at", "closed_at", "finished_at")
+    
+    def __init__(self, started_at: float):
+        """
+        Args:
+            started_at: 動作開始時間
+        """
+        # completed（開迴路跑完全程）/ closed / already_closed / timeout / cancelled / error
+        self.outcome = "running"
+        self.started_at = started_at
+        self.pushed_at: Optional[float] = None
+        self.closed_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    @property
+    def actuation_time(self) -> Optional[float]:
+        """馬達實際作動時間（秒），含收回"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+    
+    @property
+    def close_latency(self) -> Optional[float]:
+        """自推動到偵測蓋子放下的時間（秒）"""
+        if self.pushed_at is None or self.closed_at is None:
+            return None
+        return self.closed_at - self.pushed_at
+    
+    def as_dict(self) -> Dict[str, object]:
+        """事件紀錄用的摘要"""
+        return {"outcome": self.outcome, "actuation_time": self.actuation_time,
+                "close_latency": self.close_latency}
+    
+    def __repr__(self):
+        actuation = self.actuation_time
+        return (f"ServoCycle(outcome={self.outcome}, actuation="
+                f"{'-' if actuation is None else f'{actuation * 1000:.0f}ms'})")
+
+
+class LidCloseTimeout(Exception):
+    """推動後蓋子未在期限內放下"""
+    
+    def __init__(self, cycle: ServoCycle, timeout: float):
+        super().__init__(f"蓋子未在推動後 {timeout} 秒內放下")
+        self.cycle = cycle
 
 
 class ServoController:
-    """SG90 伺服馬達控制器（使用 PWM 控制）"""
+    """
+    SG90 伺服馬達控制器（使用 PWM 控制）
     
-    def __init__(self, pin: int, duty_rest: float, duty_push: float, 
-                 move_time: float, stabilize_time: float, push_hold_time: float):
+    未指定 lid_sensor 時為開迴路：轉動、穩定、推動、停留 push_hold_time 後收回。
+    指定 lid_sensor（磁簧開關）時為閉迴路：推動期間監看蓋子狀態，一放下就收回；
+    close_timeout 秒內未放下則收回並拋出 LidCloseTimeout。每次動作返回 ServoCycle。
+    """
+    
+    # 閉迴路等待中檢查取消事件的間隔（秒）；蓋子放下由磁簧開關事件立即喚醒
+    CANCEL_POLL_INTERVAL = 0.05
+    
+    def __init__(self, pin: int, duty_rest: float, duty_push: float,
+                 move_time: float, stabilize_time: float, push_hold_time: float, pwm=None,
+                 lid_sensor=None, close_timeout: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
         """
         初始化伺服馬達
         
@@ -20,7 +87,12 @@ class ServoController:
             duty_push: 推動角度的 PWM 佔空比
             move_time: 馬達轉動時間（秒）
             stabilize_time: 馬達啟動後穩定時間（秒）
-            push_hold_time: 馬達推動角度後停留時間（秒）
+            push_hold_time: 馬達推動角度後停留時間（秒，開迴路）
+            pwm: PWM 輸出（選用），預設為 RPi.GPIO 的 50Hz 軟體 PWM；可傳入 controllers.pwm_backend
+                的其他後端或 simulation.drivers.SimPWM。只在動作期間啟動，動作結束即停止
+            lid_sensor: 同一馬桶蓋的磁簧開關（選用），指定時使用閉迴路控制
+            close_timeout: 閉迴路自推動起等待蓋子放下的期限（秒），預設為 move_time + push_hold_time
+            clock: 記錄動作時間使用的單調時鐘
         """
         self.pin = pin
         self.duty_rest = duty_rest
@@ -28,65 +100,344 @@ class ServoController:
         self.move_time = move_time
         self.stabilize_time = stabilize_time
         self.push_hold_time = push_hold_time
+        self.close_timeout = close_timeout if close_timeout is not None else move_time + push_hold_time
+        self.clock = clock
+        self.last_cycle: Optional[ServoCycle] = None
+        self._pending_timing: Optional[dict] = None
+        
+        if pwm is None:
+            from controllers.pwm_backend import SoftwarePWM
+            pwm = SoftwarePWM(self.pin, 50)
+        # 閒置時不輸出 PWM：每次動作才 start()，結束後 stop()
+        self.pwm = pwm
+        self._release_handle = None
+        
+        # 閉迴路：磁簧開關回報蓋子放下時喚醒等待中的動作
+        self.lid_sensor = lid_sensor
+        self._lid_closed = threading.Event()
+        self._async_waiter = None
+        if lid_sensor is not None:
+            lid_sensor.add_listener(self._on_lid_event)
+        
+        logger.info(f"⚙️ 伺服馬達已初始化於 GPIO {pin}（{'閉迴路' if lid_sensor is not None else '開迴路'}）")
+        logger.info(f"   靜止角度: {duty_rest}% | 推動角度: {duty_push}% | 停留時間: {push_hold_time}秒")
+    
+    def configure(self, **timing):
+        """
+        更新佔空比與時間參數（設定重新載入時使用）；進行中的動作不受影響，
+        下一次動作開始時才套用
         
-        # 設定 GPIO 模式
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin, GPIO.OUT)
+        Args:
+            **timing: duty_rest、duty_push、move_time、stabilize_time、push_hold_time、close_timeout
+        """
+        unknown = set(timing) - {"duty_rest", "duty_push", "move_time", "stabilize_time", "push_hold_time",
+                                 "close_timeout"}
+        if unknown:
+            raise ValueError(f"未知的伺服馬達參數: {sorted(unknown)}")
+        self._pending_timing = timing
+    
+    def _apply_pending_timing(self):
+        """內部函式：動作開始前套用待生效的參數"""
+        timing, self._pending_timing = self._pending_timing, None
+        if timing:
+            for key, value in timing.items():
+                setattr(self, key, value)
+    
+    def _on_lid_event(self, event):
+        """內部函式：磁簧開關事件（在感測器執行緒中呼叫），蓋子放下時喚醒等待"""
+        if event.value != 0:
+            return
+        self._lid_closed.set()
+        waiter = self._async_waiter
+        if waiter is not None:
+            loop, closed = waiter
+            loop.call_soon_threadsafe(closed.set)
+    
+    @staticmethod
+    def _wait(seconds: float, cancel_event: Optional[threading.Event]) -> bool:
+        """
+        內部函式：等待指定時間，可被取消事件提前中斷
         
-        # 建立 PWM 實例 (50Hz)
-        self.pwm = GPIO.PWM(self.pin, 50)
-        self.pwm.start(0)
+        Returns:
+            bool: 被取消返回 True
+        """
+        if cancel_event is None:
+            sleep(seconds)
+            return False
+        return cancel_event.wait(seconds)
+    
+    def _wait_for_close(self, seconds: float, cancel_event: Optional[threading.Event]) -> Optional[str]:
+        """
+        內部函式：等待蓋子放下（閉迴路）
         
-        print(f"⚙️ 伺服馬達已初始化於 GPIO {pin}")
-        print(f"   靜止角度: {duty_rest}% | 推動角度: {duty_push}% | 停留時間: {push_hold_time}秒")
+        Returns:
+            "closed"、"cancelled"，或期限到時返回 None
+        """
+        deadline = self.clock() + seconds
+        while True:
+            if self.lid_sensor.is_closed():
+                return "closed"
+            if cancel_event is not None and cancel_event.is_set():
+                return "cancelled"
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return None
+            if cancel_event is not None:
+                remaining = min(remaining, self.CANCEL_POLL_INTERVAL)
+            self._lid_closed.wait(remaining)
     
-    def _change_angle(self, duty: float):
+    def _change_angle(self, duty: float, cancel_event: Optional[threading.Event] = None) -> bool:
         """
         內部函式：變更 PWM 佔空比
         
         Args:
             duty: PWM 佔空比
+            cancel_event: 取消事件（選用）
+        
+        Returns:
+            bool: 等待期間被取消返回 True
         """
         self.pwm.ChangeDutyCycle(duty)
-        sleep(self.move_time)
-        
-    def push_lid_down(self):
+        return self._wait(self.move_time, cancel_event)
+    
+    def _start_pwm(self):
+        """內部函式：動作開始時才啟動 PWM 輸出，並送出靜止角度"""
+        if self._release_handle is not None:
+            # 上一次取消後尚未釋放：沿用中的輸出改由本次動作負責
+            self._release_handle.cancel()
+            self._release_handle = None
+        self.pwm.start(self.duty_rest)
+    
+    def _release_pwm(self):
+        """內部函式：動作結束後停止 PWM 輸出（軟體 PWM 的背景執行緒隨之結束）"""
+        self._release_handle = None
+        try:
+            self.pwm.stop()
+        except Exception as e:
+            logger.warning(f"停止 PWM 輸出時發生錯誤: {e}")
+    
+    def _finish(self, cycle: ServoCycle, outcome: str) -> ServoCycle:
+        """內部函式：結束一次動作紀錄"""
+        cycle.outcome = outcome
+        cycle.finished_at = self.clock()
+        self.last_cycle = cycle
+        return cycle
+    
+    def push_lid_down(self, cancel_event: Optional[threading.Event] = None) -> ServoCycle:
         """
         控制伺服馬達執行輕推落蓋的動作
+        
+        Args:
+            cancel_event: 取消事件（選用），觸發後立即回到靜止位置
+        
+        Returns:
+            ServoCycle: 本次動作紀錄
+        
+        Raises:
+            LidCloseTimeout: 閉迴路下蓋子未在 close_timeout 秒內放下（馬達已收回）
         """
-        print("⚙️ 馬達動作: 開始輕推落蓋...")
+        self._apply_pending_timing()
+        if self.lid_sensor is not None:
+            return self._push_closed_loop(cancel_event)
+        
+        logger.info("⚙️ 馬達動作: 開始輕推落蓋...")
+        cycle = ServoCycle(self.clock())
         
         try:
             # 啟動 PWM
-            self._change_angle(self.duty_rest)
-            sleep(self.stabilize_time)
+            self._start_pwm()
+            cancelled = (self._wait(self.move_time, cancel_event)
+                         or self._wait(self.stabilize_time, cancel_event))
+            
+            if not cancelled:
+                # 推動到指定角度
+                logger.debug(f"   → 推動至 {self.duty_push}% 角度...")
+                cycle.pushed_at = self.clock()
+                cancelled = self._change_angle(self.duty_push, cancel_event)
             
-            # 推動到指定角度
-            print(f"   → 推動至 {self.duty_push}% 角度...")
-            self._change_angle(self.duty_push)
+            if not cancelled:
+                # 停留指定時間
+                logger.debug(f"   → 維持角度 {self.push_hold_time} 秒...")
+                cancelled = self._wait(self.push_hold_time, cancel_event)
             
-            # 停留指定時間
-            print(f"   → 維持角度 {self.push_hold_time} 秒...")
-            sleep(self.push_hold_time)
+            if cancelled:
+                logger.debug("   → 動作已取消")
             
             # 回到靜止位置
-            print(f"   → 回到靜止位置 {self.duty_rest}%...")
+            logger.debug(f"   → 回到靜止位置 {self.duty_rest}%...")
             self._change_angle(self.duty_rest)
             
-            # 停止 PWM 訊號
-            self.pwm.ChangeDutyCycle(0)
+            logger.info("✅ 馬達動作完成！")
+            outcome = "cancelled" if cancelled else "completed"
+        
+        except Exception as e:
+            logger.error(f"❌ 伺服馬達操作失敗: {e}")
+            outcome = "error"
+        finally:
+            # 停止並釋放 PWM 輸出
+            self._release_pwm()
+        return self._finish(cycle, outcome)
+    
+    def _push_closed_loop(self, cancel_event: Optional[threading.Event]) -> ServoCycle:
+        """內部函式：閉迴路推蓋，蓋子放下即收回"""
+        cycle = ServoCycle(self.clock())
+        if self.lid_sensor.is_closed():
+            logger.info("⚙️ 蓋子已放下，略過推蓋")
+            return self._finish(cycle, "already_closed")
+        
+        logger.info("⚙️ 馬達動作: 開始輕推落蓋（蓋子放下即收回）...")
+        self._lid_closed.clear()
+        try:
+            # 啟動 PWM；穩定期間蓋子就放下時不必推動
+            self._start_pwm()
+            outcome = self._wait_for_close(self.move_time + self.stabilize_time, cancel_event)
+            
+            if outcome is None:
+                logger.debug(f"   → 推動至 {self.duty_push}% 角度，最多等待 {self.close_timeout} 秒...")
+                self.pwm.ChangeDutyCycle(self.duty_push)
+                cycle.pushed_at = self.clock()
+                outcome = self._wait_for_close(self.close_timeout, cancel_event) or "timeout"
+                if outcome == "closed":
+                    cycle.closed_at = self.clock()
+                
+                # 收回至靜止位置
+                logger.debug(f"   → 回到靜止位置 {self.duty_rest}%...")
+                self._change_angle(self.duty_rest)
+            
+            elif outcome == "closed":
+                cycle.closed_at = self.clock()
+        
+        except Exception as e:
+            logger.error(f"❌ 伺服馬達操作失敗: {e}")
+            return self._finish(cycle, "error")
+        finally:
+            self._release_pwm()
+        
+        return self._report(self._finish(cycle, outcome))
+    
+    def _report(self, cycle: ServoCycle) -> ServoCycle:
+        """內部函式：輸出閉迴路動作結果，逾期未放下時拋出 LidCloseTimeout"""
+        if cycle.outcome == "timeout":
+            logger.warning(f"⚠️ 推蓋失敗：蓋子未在 {self.close_timeout} 秒內放下"
+                           f"（馬達作動 {cycle.actuation_time:.2f} 秒）")
+            raise LidCloseTimeout(cycle, self.close_timeout)
+        if cycle.outcome == "closed" and cycle.close_latency is not None:
+            logger.info(f"✅ 蓋子已放下，馬達收回（推動 {cycle.close_latency:.2f} 秒，"
+                        f"作動 {cycle.actuation_time:.2f} 秒）")
+        elif cycle.outcome == "closed":
+            logger.info("✅ 推動前蓋子已放下，馬達收回")
+        else:
+            logger.debug("   → 動作已取消")
+        return cycle
+    
+    async def push_lid_down_async(self) -> ServoCycle:
+        """
+        輕推落蓋動作的 asyncio 版本（以 asyncio.sleep 等待，不佔用執行緒）
+        
+        任務被取消時會立即送出靜止角度，並在轉動時間後停止 PWM 訊號。
+        """
+        self._apply_pending_timing()
+        if self.lid_sensor is not None:
+            return await self._push_closed_loop_async()
+        
+        logger.info("⚙️ 馬達動作: 開始輕推落蓋...")
+        cycle = ServoCycle(self.clock())
+        
+        try:
+            self._start_pwm()
+            await asyncio.sleep(self.move_time + self.stabilize_time)
+            
+            logger.debug(f"   → 推動至 {self.duty_push}% 角度...")
+            self.pwm.ChangeDutyCycle(self.duty_push)
+            cycle.pushed_at = self.clock()
+            await asyncio.sleep(self.move_time)
+            
+            logger.debug(f"   → 維持角度 {self.push_hold_time} 秒...")
+            await asyncio.sleep(self.push_hold_time)
+            
+            logger.debug(f"   → 回到靜止位置 {self.duty_rest}%...")
+            self.pwm.ChangeDutyCycle(self.duty_rest)
+            await asyncio.sleep(self.move_time)
+            
+            self._release_pwm()
+            logger.info("✅ 馬達動作完成！")
+            return self._finish(cycle, "completed")
+        
+        except asyncio.CancelledError:
+            self._retract_on_cancel(cycle)
+            raise
+        except Exception as e:
+            logger.error(f"❌ 伺服馬達操作失敗: {e}")
+            self._release_pwm()
+            return self._finish(cycle, "error")
+    
+    async def _push_closed_loop_async(self) -> ServoCycle:
+        """內部函式：閉迴路推蓋的 asyncio 版本"""
+        cycle = ServoCycle(self.clock())
+        if self.lid_sensor.is_closed():
+            logger.info("⚙️ 蓋子已放下，略過推蓋")
+            return self._finish(cycle, "already_closed")
+        
+        logger.info("⚙️ 馬達動作: 開始輕推落蓋（蓋子放下即收回）...")
+        closed = asyncio.Event()
+        self._async_waiter = (asyncio.get_running_loop(), closed)
+        try:
+            self._start_pwm()
+            outcome = await self._wait_for_close_async(closed, self.move_time + self.stabilize_time)
             
-            print("✅ 馬達動作完成！")
+            if outcome is None:
+                logger.debug(f"   → 推動至 {self.duty_push}% 角度，最多等待 {self.close_timeout} 秒...")
+                self.pwm.ChangeDutyCycle(self.duty_push)
+                cycle.pushed_at = self.clock()
+                outcome = await self._wait_for_close_async(closed, self.close_timeout) or "timeout"
+                if outcome == "closed":
+                    cycle.closed_at = self.clock()
+                
+                logger.debug(f"   → 回到靜止位置 {self.duty_rest}%...")
+                self.pwm.ChangeDutyCycle(self.duty_rest)
+                await asyncio.sleep(self.move_time)
             
+            elif outcome == "closed":
+                cycle.closed_at = self.clock()
+            self._release_pwm()
+        
+        except asyncio.CancelledError:
+            self._retract_on_cancel(cycle)
+            raise
         except Exception as e:
-            print(f"❌ 伺服馬達操作失敗: {e}")
+            logger.error(f"❌ 伺服馬達操作失敗: {e}")
+            self._release_pwm()
+            return self._finish(cycle, "error")
+        finally:
+            self._async_waiter = None
+        
+        return self._report(self._finish(cycle, outcome))
+    
+    async def _wait_for_close_async(self, closed: asyncio.Event, seconds: float) -> Optional[str]:
+        """內部函式：等待蓋子放下，放下返回 "closed"，期限到返回 None"""
+        if self.lid_sensor.is_closed():
+            return "closed"
+        try:
+            await asyncio.wait_for(closed.wait(), seconds)
+        except asyncio.TimeoutError:
+            return "closed" if self.lid_sensor.is_closed() else None
+        return "closed"
+    
+    def _retract_on_cancel(self, cycle: ServoCycle):
+        """內部函式：asyncio 任務被取消時立即送出靜止角度，轉動時間後釋放 PWM"""
+        logger.debug("   → 動作已取消，回到靜止位置")
+        self.pwm.ChangeDutyCycle(self.duty_rest)
+        self._release_handle = asyncio.get_running_loop().call_later(self.move_time, self._release_pwm)
+        self._finish(cycle, "cancelled")
     
     def cleanup(self):
         """清理 GPIO 資源"""
         try:
+            if self.lid_sensor is not None:
+                self.lid_sensor.remove_listener(self._on_lid_event)
             if self.pwm:
                 self.pwm.stop()
-            print("HW: 伺服馬達已清理。")
+                self.pwm.close()
+            logger.info("HW: 伺服馬達已清理。")
         except Exception as e:
-            print(f"清理伺服馬達時發生錯誤: {e}")
-
+            logger.warning(f"清理伺服馬達時發生錯誤: {e}")
@@ -2,208 +2,544 @@
 SmartLid 主程式
 智慧馬桶蓋提醒系統核心控制程式
 """
+import asyncio
+import logging
 import sys
-import threading
-from datetime import date
-from signal import pause, signal, SIGINT
+from concurrent.futures import ThreadPoolExecutor
+from signal import pause, signal, SIGHUP, SIGINT
+from typing import Any, Dict, Optional
+
+# 最先匯入：以此作為啟動時間軸的起點
+from utils.profiling import StartupProfile
 
 # 導入配置
-from config import Config
+from config import ENV_FILES, RESTART_REQUIRED, Config
+
+# 導入各模組控制器（requests、pygame、gpiozero、RPi.GPIO 與 sqlite3 皆於初始化時才匯入）
+from controllers.action_executor import ActionExecutor
+from controllers.lid_controller import AsyncLidController, LidController
+from utils.hardware import create_audio, create_reed_switch, create_servo
+from utils.log import setup_logging
+from utils.metrics import MetricsServer
+from utils.scheduler import DeadlineScheduler, LoopScheduler
 
-# 導入各模組控制器
-from controllers.audio_controller import AudioController
-from controllers.servo_controller import ServoController
-from sensors.reed_switch import ReedSwitch
-from services.line_messaging import LineMessagingService
+logger = logging.getLogger(__name__)
 
 
 class SmartLidController:
-    """SmartLid 主控制器"""
+    """SmartLid 主控制器（單一程序監管多個馬桶蓋）"""
     
-    def __init__(self):
-        """初始化 SmartLid 控制器"""
-        # 狀態變數
-        self.countdown_timer = None
-        self.is_countdown_active = False
-        self.daily_alert_count = 0
-        self.last_reset_date = date.today()
+    def __init__(self, profile: Optional[StartupProfile] = None):
+        """
+        初始化 SmartLid 控制器
+        
+        Args:
+            profile: 啟動時間軸（選用），預設自行建立；初始化完成後輸出報告
+        """
+        self.profile = profile if profile is not None else StartupProfile()
+        
+        # 馬桶蓋註冊表：名稱 → LidController
+        self.lids: Dict[str, LidController] = {}
+        
+        # 共用的期限排程器（單一執行緒管理所有倒數計時）
+        self.scheduler = self._create_scheduler()
         
         # 初始化硬體模組
         self._init_hardware()
     
+    def _create_scheduler(self):
+        """建立倒數計時使用的排程器"""
+        return DeadlineScheduler().start()
+    
+    def _create_lid(self, **kwargs) -> LidController:
+        """建立單一馬桶蓋控制器"""
+        return LidController(**kwargs)
+    
+    def _create_audio(self, sound_files):
+        """建立音效控制器（依 HARDWARE_BACKEND 使用真實或模擬硬體）"""
+        return create_audio(sound_files)
+    
+    def _create_line_service(self):
+        """建立 LINE 通知服務（FLEET_CENTRAL_LINE 時改由車隊閘道發送）"""
+        if self.fleet_uploader is not None and Config.FLEET_CENTRAL_LINE:
+            from services.fleet_uploader import FleetLineService
+            
+            return FleetLineService(self.fleet_uploader)
+        from services.line_messaging import LineMessagingService
+        
+        line_service = LineMessagingService(
+            channel_access_token=Config.LINE_CHANNEL_ACCESS_TOKEN,
+            user_id=Config.LINE_USER_ID,
+            rate_per_hour=Config.LINE_ALERT_RATE_PER_HOUR,
+            burst=Config.LINE_ALERT_BURST,
+            coalesce_window=Config.LINE_COALESCE_WINDOW,
+            monthly_quota=Config.LINE_MONTHLY_QUOTA,
+            quota_reserve=Config.LINE_QUOTA_RESERVE,
+            pool_size=Config.LINE_POOL_SIZE,
+            state_path=Config.DB_PATH
+        )
+        if Config.LINE_SPOOL_ENABLED:
+            line_service.enable_spool(
+                Config.DB_PATH,
+                deadline=Config.LINE_MESSAGE_DEADLINE,
+                retry_base=Config.LINE_RETRY_BASE,
+                retry_max=Config.LINE_RETRY_MAX
+            )
+        return line_service
+    
+    def _create_fleet_uploader(self):
+        """建立車隊閘道上傳器（待送區位於 DB_PATH），未設定 FLEET_GATEWAY_URL 時返回 None"""
+        if not Config.FLEET_GATEWAY_URL:
+            return None
+        from services.fleet_uploader import FleetUploader
+        
+        uploader = FleetUploader(
+            Config.FLEET_GATEWAY_URL,
+            Config.FLEET_NODE_ID,
+            Config.DB_PATH,
+            token=Config.FLEET_TOKEN or None,
+            batch_size=Config.FLEET_BATCH_SIZE,
+            flush_interval=Config.FLEET_FLUSH_INTERVAL
+        ).start()
+        logger.info(f"[初始化] 車隊閘道: {Config.FLEET_GATEWAY_URL}（節點 {Config.FLEET_NODE_ID}）")
+        return uploader
+    
+    def _create_action_executor(self, lid_count: int) -> ActionExecutor:
+        """建立提醒動作執行器（音效、馬達、通知並行）"""
+        return ActionExecutor(max_workers=min(32, 3 * lid_count))
+    
+    def _create_servo(self, lid_config: Dict[str, Any], reed_switch):
+        """建立單一馬桶蓋的伺服馬達；啟用閉迴路時監看同一馬桶蓋的磁簧開關"""
+        return create_servo(
+            lid_config["servo_pin"],
+            lid_sensor=reed_switch if Config.SERVO_CLOSED_LOOP else None,
+            duty_rest=Config.SERVO_DUTY_REST,
+            duty_push=Config.SERVO_DUTY_PUSH,
+            move_time=Config.SERVO_MOVE_TIME,
+            stabilize_time=Config.SERVO_STABILIZE_TIME,
+            push_hold_time=Config.SERVO_PUSH_HOLD_TIME,
+            close_timeout=Config.SERVO_CLOSE_TIMEOUT
+        )
+    
+    def _create_event_store(self):
+        """建立事件紀錄（批次寫入 SQLite，不阻塞事件處理），未啟用時返回 None"""
+        if not Config.EVENT_STORE_ENABLED:
+            return None
+        from services.event_store import EventStore
+        
+        return EventStore(
+            Config.DB_PATH,
+            batch_size=Config.EVENT_BATCH_SIZE,
+            flush_interval=Config.EVENT_FLUSH_INTERVAL
+        ).start()
+    
+    def _create_state_store(self):
+        """載入重新啟動前的狀態快照，返回 (狀態快照, 各馬桶蓋狀態)；未啟用時為 (None, {})"""
+        if not Config.STATE_STORE_ENABLED:
+            return None, {}
+        from services.state_store import StateStore
+        
+        state_store = StateStore(Config.DB_PATH)
+        saved_states = state_store.load()
+        state_store.start()
+        logger.info(f"[初始化] 已載入 {len(saved_states)} 筆狀態快照")
+        return state_store, saved_states
+    
     def _init_hardware(self):
-        """初始化所有硬體模組"""
+        """
+        初始化所有硬體模組
+        
+        磁簧開關最先啟用，之後初始化期間的開蓋也會被記錄；音效、LINE、事件紀錄、
+        狀態快照與伺服馬達再於執行緒池中並行初始化，全部就緒後才建立各馬桶蓋控制器。
+        """
         try:
-            # 1. 初始化音效控制器
-            print("\n[初始化] 載入音效系統...")
-            self.audio = AudioController()
+            lid_configs = Config.get_lids()
+            profile = self.profile
             
-            # 2. 初始化磁簧開關
-            print("\n[初始化] 載入磁簧開關...")
-            self.reed_switch = ReedSwitch(pin=Config.REED_SWITCH_PIN)
+            # 1. 最先啟用各馬桶蓋的磁簧開關
+            reed_switches = {}
+            with profile.phase("reed_switches"):
+                for lid_config in lid_configs:
+                    name = lid_config["name"]
+                    if name in reed_switches:
+                        raise ValueError(f"馬桶蓋名稱重複: {name}")
+                    reed_switches[name] = create_reed_switch(lid_config["reed_pin"], Config.REED_STABLE_TIME)
+            logger.info(f"[初始化] 磁簧開關已開始監測（{profile.elapsed() * 1000:.1f} ms）")
             
-            # 3. 初始化伺服馬達
-            print("\n[初始化] 載入伺服馬達...")
-            self.servo = ServoController(
-                pin=Config.SERVO_PIN,
-                duty_rest=Config.SERVO_DUTY_REST,
-                duty_push=Config.SERVO_DUTY_PUSH,
-                move_time=Config.SERVO_MOVE_TIME,
-                stabilize_time=Config.SERVO_STABILIZE_TIME,
-                push_hold_time=Config.SERVO_PUSH_HOLD_TIME
-            )
+            # 2. 並行初始化其餘子系統（設定車隊閘道時先建立上傳器，LINE 通知可改由閘道發送）
+            self.fleet_uploader = self._create_fleet_uploader()
+            sound_files = []
+            for lid_config in lid_configs:
+                for sound_file in (lid_config["alert1_sound"], lid_config["alert2_sound"]):
+                    if sound_file not in sound_files:
+                        sound_files.append(sound_file)
             
-            # 4. 初始化 LINE 服務
-            print("\n[初始化] 載入 LINE 通知服務...")
-            self.line_service = LineMessagingService(
-                channel_access_token=Config.LINE_CHANNEL_ACCESS_TOKEN,
-                user_id=Config.LINE_USER_ID
-            )
+            with ThreadPoolExecutor(max_workers=4, thread_name_prefix="smartlid-init") as pool:
+                audio = pool.submit(profile.timed("audio", self._create_audio), sound_files)
+                line_service = pool.submit(profile.timed("line_service", self._create_line_service))
+                event_store = pool.submit(profile.timed("event_store", self._create_event_store))
+                state_store = pool.submit(profile.timed("state_store", self._create_state_store))
+                servos = {
+                    lid_config["name"]: pool.submit(
+                        profile.timed(f"servo[{lid_config['name']}]", self._create_servo),
+                        lid_config, reed_switches[lid_config["name"]]
+                    )
+                    for lid_config in lid_configs
+                }
+                
+                self.audio = audio.result()
+                self.line_service = line_service.result()
+                self.event_store = event_store.result()
+                self.state_store, saved_states = state_store.result()
+                servos = {name: servo.result() for name, servo in servos.items()}
             
-            print("\n✅ 所有硬體模組初始化完成！\n")
+            # 3. 初始化提醒動作執行器（音效、馬達、通知並行）
+            self.action_executor = self._create_action_executor(len(lid_configs))
+            
+            # 4. 建立各馬桶蓋控制器並還原狀態（狀態轉換時通知儀表板、LINE Webhook 與 MQTT）
+            self.state_hub = None
+            self.mqtt_publisher = None
+            self.state_listeners = []
+            if Config.DASHBOARD_ENABLED or Config.LINE_WEBHOOK_ENABLED:
+                from services.dashboard import LiveStateHub
+                
+                self.state_hub = LiveStateHub()
+                self.state_listeners.append(self.state_hub.publish)
+            if Config.MQTT_ENABLED:
+                self.mqtt_publisher = self._create_mqtt_publisher()
+                self.state_listeners.append(self.mqtt_publisher.publish)
+            if self.fleet_uploader is not None:
+                self.state_listeners.append(self.fleet_uploader.publish)
+            with profile.phase("lids"):
+                for lid_config in lid_configs:
+                    name = lid_config["name"]
+                    self._init_lid(lid_config, reed_switches[name], servos[name])
+                    self.lids[name].restore_state(saved_states.get(name))
+            
+            # 5. 啟動 Prometheus 指標端點
+            self.metrics_server = None
+            if Config.METRICS_ENABLED:
+                self.metrics_server = MetricsServer(Config.METRICS_HOST, Config.METRICS_PORT).start()
+                logger.info(f"[初始化] 指標端點: {self.metrics_server.url}")
+            
+            # 6. 啟動網頁儀表板
+            self.dashboard_server = None
+            if Config.DASHBOARD_ENABLED:
+                from services.dashboard import DashboardServer, create_app
+                
+                app = create_app(self.event_store, self.state_hub, Config.DASHBOARD_CACHE_TTL)
+                self.dashboard_server = DashboardServer(app, Config.FLASK_HOST, Config.FLASK_PORT).start()
+                logger.info(f"[初始化] 網頁儀表板: {self.dashboard_server.url}")
             
+            # 7. 啟動 LINE Webhook（查詢回覆）
+            self.webhook_server = self._create_webhook_server() if Config.LINE_WEBHOOK_ENABLED else None
+            
+            profile.record("ready", profile.origin)
+            logger.info(f"✅ 所有硬體模組初始化完成！（共 {len(self.lids)} 個馬桶蓋）")
+            logger.info(profile.report())
+        
         except Exception as e:
-            print(f"\n❌ 硬體初始化失敗: {e}")
+            logger.exception(f"❌ 硬體初始化失敗: {e}")
             sys.exit(1)
     
-    def check_and_reset_daily_count(self):
-        """檢查日期是否已變更，若變更則重置計數器"""
-        current_date = date.today()
-        if current_date != self.last_reset_date:
-            print(f"\n📅 日期變更: {self.last_reset_date} → {current_date}")
-            print(f"   前日提醒次數: {self.daily_alert_count} 次")
-            self.daily_alert_count = 0
-            self.last_reset_date = current_date
-            print("   計數器已重置為 0")
-    
-    def trigger_alert_and_push(self):
-        """定時器到期，觸發 Stage 1/Stage 2 動作"""
-        if not self.is_countdown_active:
-            return
+    def _create_webhook_server(self):
+        """建立 LINE Webhook 伺服器；缺少 Channel secret 或由車隊閘道發送 LINE 時返回 None"""
+        if not Config.LINE_CHANNEL_SECRET:
+            logger.warning("⚠️ 未設定 LINE_CHANNEL_SECRET，不啟動 LINE Webhook")
+            return None
+        if not hasattr(self.line_service, "reply"):
+            logger.warning("⚠️ LINE 通知由車隊閘道發送，不啟動 LINE Webhook")
+            return None
+        from services.line_webhook import LineWebhookServer, StatsResponder
         
-        self.is_countdown_active = False
+        responder = StatsResponder(self.event_store, self.state_hub, Config.LINE_WEBHOOK_CACHE_TTL)
+        server = LineWebhookServer(
+            Config.LINE_CHANNEL_SECRET,
+            self.line_service,
+            responder,
+            host=Config.LINE_WEBHOOK_HOST,
+            port=Config.LINE_WEBHOOK_PORT,
+            path=Config.LINE_WEBHOOK_PATH,
+            record_path=Config.LINE_WEBHOOK_RECORD_PATH or None
+        ).start()
+        logger.info(f"[初始化] LINE Webhook: {server.url}")
+        return server
+    
+    def _create_mqtt_publisher(self):
+        """建立 MQTT 發布器（離線時溢出到 DB_PATH 的 mqtt_outbox 資料表）"""
+        from services.mqtt_publisher import MqttPublisher
         
-        # 檢查當前狀態: 磁鐵是否仍遠離 (HIGH = 1)
-        if self.reed_switch.value == 1:
-            print("\n⏰ 計時器到期！蓋子仍未放下。")
-            
-            # 檢查並重置每日計數
-            self.check_and_reset_daily_count()
-            
-            # 累加計數
-            self.daily_alert_count += 1
+        publisher = MqttPublisher(
+            Config.MQTT_BROKER_HOST,
+            Config.MQTT_BROKER_PORT,
+            prefix=Config.MQTT_TOPIC_PREFIX,
+            db_path=Config.DB_PATH,
+            buffer_size=Config.MQTT_BUFFER_SIZE,
+            spool_size=Config.MQTT_SPOOL_SIZE,
+            batch_size=Config.MQTT_BATCH_SIZE,
+            discovery_prefix=Config.MQTT_DISCOVERY_PREFIX or None,
+            username=Config.MQTT_USERNAME or None,
+            password=Config.MQTT_PASSWORD or None
+        ).start()
+        logger.info(f"[初始化] MQTT 發布至 {Config.MQTT_BROKER_HOST}:{Config.MQTT_BROKER_PORT}"
+                    f"（主題 {Config.MQTT_TOPIC_PREFIX}/<lid>/...）")
+        return publisher
+    
+    def _init_lid(self, lid_config: Dict[str, Any], reed_switch, servo):
+        """以已啟用的磁簧開關與伺服馬達建立單一馬桶蓋控制器並加入註冊表"""
+        name = lid_config["name"]
+        self.lids[name] = self._create_lid(
+            name=name,
+            reed_switch=reed_switch,
+            servo=servo,
+            audio=self.audio,
+            line_service=self.line_service,
+            scheduler=self.scheduler,
+            action_executor=self.action_executor,
+            alert1_sound=lid_config["alert1_sound"],
+            alert2_sound=lid_config["alert2_sound"],
+            recipient=lid_config["recipient"] or None,
+            event_store=self.event_store,
+            state_store=self.state_store
+        )
+        for listener in self.state_listeners:
+            self.lids[name].add_state_listener(listener)
+    
+    def _start_config_reload(self):
+        """啟用設定熱重新載入：SIGHUP 由 run() 註冊，.env 變更以 inotify 監看"""
+        Config.subscribe(self._on_config_changed)
+        self.config_watcher = None
+        if Config.CONFIG_WATCH_ENABLED:
+            from utils.config_watcher import ConfigWatcher
             
-            # 判斷階段
-            if self.daily_alert_count < Config.DAILY_ALERT_THRESHOLD:
-                # === 階段1：本地提醒 ===
-                print(f"\n🔔 [階段1 提醒] 當日第 {self.daily_alert_count} 次")
-                
-                # 播放提醒音效
-                self.audio.play_alert1(Config.ALERT1_SOUND)
-                
-                # 啟動伺服馬達推動蓋子
-                self.servo.push_lid_down()
-                
-            else:
-                # === 階段2：嚴重警告 + LINE 通知 ===
-                print(f"\n🚨 [階段2 警告] 當日第 {self.daily_alert_count} 次（已達門檻）")
-                
-                # 播放嚴重警告音效
-                self.audio.play_alert2(Config.ALERT2_SOUND)
-                
-                # 啟動伺服馬達推動蓋子
-                self.servo.push_lid_down()
-                
-                # 發送 LINE 通知
-                self.line_service.send_alert(self.daily_alert_count)
-        else:
-            print("\n✅ 計時器到期前，蓋子已放下。無需提醒。")
+            try:
+                self.config_watcher = ConfigWatcher(ENV_FILES, self._on_config_file_changed).start()
+            except OSError as e:
+                logger.warning(f"⚠️ 無法監看設定檔，僅支援 SIGHUP 重新載入: {e}")
+    
+    def _on_config_file_changed(self):
+        """內部函式：.env 變更（於 ConfigWatcher 執行緒呼叫）"""
+        self.reload_config()
     
-    def start_countdown(self):
-        """當馬桶蓋開啟時 (HIGH = 1)，啟動計時器"""
-        if self.is_countdown_active:
+    def reload_config(self):
+        """重新載入設定（SIGHUP 或 .env 變更時呼叫）；設定有誤時沿用目前的設定"""
+        try:
+            changes = Config.reload()
+        except Exception as e:
+            logger.error(f"❌ 重新載入設定失敗，沿用目前設定: {e}")
             return
         
-        print(f"\n[狀態] 馬桶蓋開啟 (HIGH)。{Config.LID_OPEN_TIMEOUT} 秒後將檢查並觸發動作...")
-        
-        self.countdown_timer = threading.Timer(Config.LID_OPEN_TIMEOUT, self.trigger_alert_and_push)
-        self.countdown_timer.start()
-        self.is_countdown_active = True
-    
-    def stop_countdown(self):
-        """當馬桶蓋關閉時 (LOW = 0)，取消計時器"""
-        if self.is_countdown_active:
-            print("\n[狀態] 馬桶蓋已放下！取消計時器。")
-            if self.countdown_timer:
-                self.countdown_timer.cancel()
-            self.is_countdown_active = False
+        if not changes:
+            logger.info("🔄 設定未變更")
+            return
+        for key, (old, new) in sorted(changes.items()):
+            if any(sensitive in key for sensitive in ("TOKEN", "SECRET", "PASSWORD")):
+                old = new = "***"
+            note = "（需重新啟動才會生效）" if key in RESTART_REQUIRED else ""
+            logger.info(f"🔄 設定變更 {key}: {old} → {new}{note}")
     
-    def on_lid_opened(self, device):
-        """事件：訊號從 LOW 變為 HIGH (磁鐵遠離 -> 蓋子抬起)"""
-        print("[偵測] 訊號 HIGH (1): 馬桶蓋抬起！")
-        self.start_countdown()
+    def _on_config_changed(self, previous, snapshot):
+        """
+        將新設定套用至執行中的模組
+        
+        進行中的倒數保留原期限；逾時與門檻由各馬桶蓋在下一次狀態轉換時讀取新快照，
+        伺服馬達參數與音效則於下一次提醒動作生效。
+        """
+        if snapshot.LOG_LEVEL != previous.LOG_LEVEL:
+            logging.getLogger().setLevel(snapshot.LOG_LEVEL.upper())
+        
+        for lid in self.lids.values():
+            lid.servo.configure(
+                duty_rest=snapshot.SERVO_DUTY_REST,
+                duty_push=snapshot.SERVO_DUTY_PUSH,
+                move_time=snapshot.SERVO_MOVE_TIME,
+                stabilize_time=snapshot.SERVO_STABILIZE_TIME,
+                push_hold_time=snapshot.SERVO_PUSH_HOLD_TIME,
+                close_timeout=snapshot.SERVO_CLOSE_TIMEOUT
+            )
+        
+        new_sounds, replaced = [], set()
+        for lid_config in snapshot.get_lids():
+            lid = self.lids.get(lid_config["name"])
+            if lid is None:
+                continue
+            for attribute in ("alert1_sound", "alert2_sound"):
+                if getattr(lid, attribute) != lid_config[attribute]:
+                    replaced.add(getattr(lid, attribute))
+                    setattr(lid, attribute, lid_config[attribute])
+                    new_sounds.append(lid_config[attribute])
+        if new_sounds:
+            # 不再被任何馬桶蓋使用的舊音效自快取卸載，釋出記憶體與聲道
+            in_use = {getattr(lid, attribute) for lid in self.lids.values()
+                      for attribute in ("alert1_sound", "alert2_sound")}
+            self.audio.unload(replaced - in_use)
+            self.audio.preload(new_sounds)
     
-    def on_lid_closed(self, device):
-        """事件：訊號從 HIGH 變為 LOW (磁鐵靠近 -> 蓋子放下)"""
-        print("[偵測] 訊號 LOW (0): 馬桶蓋放下！")
-        self.stop_countdown()
+    def _start_daily_rollover(self):
+        """排定每天 00:00 的換日工作（計數歸零、當日統計與每日摘要）"""
+        from controllers.daily_rollover import DailyRollover
+        
+        self.daily_rollover = DailyRollover(self.lids, self.scheduler, self.line_service, self.event_store).start()
     
     def cleanup(self):
         """處理程式結束時的安全清理"""
-        print("\n偵測到 Ctrl+C。程式正在安全終止...")
+        logger.info("偵測到 Ctrl+C。程式正在安全終止...")
+        
+        # 停止設定監看
+        Config.unsubscribe(self._on_config_changed)
+        if getattr(self, "config_watcher", None) is not None:
+            self.config_watcher.stop()
+        if getattr(self, "daily_rollover", None) is not None:
+            self.daily_rollover.stop()
+        
+        # 取消計時器並停止排程器
+        for lid in self.lids.values():
+            if lid.countdown_task:
+                lid.countdown_task.cancel()
+        self.scheduler.stop()
         
-        # 取消計時器
-        if self.countdown_timer and self.countdown_timer.is_alive():
-            self.countdown_timer.cancel()
+        # 中止進行中的提醒動作
+        self.action_executor.shutdown()
         
         # 清理各模組
-        self.servo.cleanup()
-        self.reed_switch.cleanup()
+        for lid in self.lids.values():
+            lid.cleanup()
         self.audio.cleanup()
+        if self.event_store is not None:
+            self.event_store.stop()
+        if self.state_store is not None:
+            self.state_store.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.dashboard_server is not None:
+            self.dashboard_server.stop()
+        if self.webhook_server is not None:
+            self.webhook_server.stop()
+        if self.mqtt_publisher is not None:
+            self.mqtt_publisher.stop()
+        if self.fleet_uploader is not None:
+            self.fleet_uploader.stop()
+        logger.info(f"LINE: 推播統計 {self.line_service.get_push_stats()}")
+        self.line_service.close()
         
-        print("HW: 硬體清理完成。")
+        logger.info("HW: 硬體清理完成。")
         sys.exit(0)
     
     def run(self):
         """啟動 SmartLid 系統"""
         # 綁定 GPIO 事件
-        self.reed_switch.when_activated = self.on_lid_opened
-        self.reed_switch.when_deactivated = self.on_lid_closed
+        for lid in self.lids.values():
+            lid.bind()
         
         # 顯示啟動訊息
-        print("=" * 60)
-        print("🚽 SmartLid 核心控制程式 V7.0 啟動")
-        print(f"   延遲通知時間: {Config.LID_OPEN_TIMEOUT} 秒")
-        print(f"   Stage 2 門檻: 當日 {Config.DAILY_ALERT_THRESHOLD} 次")
-        print(f"   馬達 PWM: {Config.SERVO_DUTY_REST:.1f}% -> {Config.SERVO_DUTY_PUSH:.1f}%")
-        print(f"   推動停留時間: {Config.SERVO_PUSH_HOLD_TIME:.1f} 秒")
-        print("=" * 60)
+        logger.info("=" * 60)
+        logger.info("🚽 SmartLid 核心控制程式 V7.0 啟動")
+        logger.info(f"   監管馬桶蓋: {', '.join(self.lids)}")
+        logger.info(f"   延遲通知時間: {Config.LID_OPEN_TIMEOUT} 秒")
+        logger.info(f"   Stage 2 門檻: 當日 {Config.DAILY_ALERT_THRESHOLD} 次")
+        logger.info(f"   馬達 PWM: {Config.SERVO_DUTY_REST:.1f}% -> {Config.SERVO_DUTY_PUSH:.1f}%")
+        if Config.SERVO_CLOSED_LOOP:
+            logger.info(f"   推蓋控制: 閉迴路（蓋子放下即收回，最長 {Config.SERVO_CLOSE_TIMEOUT:.1f} 秒）")
+        else:
+            logger.info(f"   推動停留時間: {Config.SERVO_PUSH_HOLD_TIME:.1f} 秒")
+        logger.info("=" * 60)
         
         # 檢查當前狀態
-        if self.reed_switch.value == 1:
-            print("\n[啟動檢測] 當前蓋子為「抬起」狀態，啟動計時器...")
-            self.start_countdown()
-        else:
-            print("\n[啟動檢測] 當前蓋子為「放下」狀態。")
+        for lid in self.lids.values():
+            lid.check_initial_state()
         
         # 註冊信號處理
         signal(SIGINT, lambda sig, frame: self.cleanup())
+        signal(SIGHUP, lambda sig, frame: self.reload_config())
+        self._start_config_reload()
+        self._start_daily_rollover()
         
         # 保持程式運行
-        print("\n程式正在監聽 GPIO 事件 (按 Ctrl+C 結束)...\n")
+        logger.info("程式正在監聽 GPIO 事件 (按 Ctrl+C 結束)...")
         try:
-            pause()
+            # SIGHUP 處理完後 pause() 會返回，繼續等待直到 cleanup() 結束程式
+            while True:
+                pause()
         except KeyboardInterrupt:
             self.cleanup()
 
 
+class AsyncSmartLidController(SmartLidController):
+    """
+    asyncio 模式的 SmartLid 主控制器
+    
+    GPIO 事件轉送至事件迴圈，倒數為事件迴圈計時器，馬達與音效以協程等待，
+    LINE 推播經由佇列或非同步 HTTP 送出；所有狀態由單一執行緒處理。
+    """
+    
+    def _create_scheduler(self):
+        """建立事件迴圈與對應的排程器"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._stop_event = asyncio.Event()
+        return LoopScheduler(self.loop)
+    
+    def _create_lid(self, **kwargs) -> LidController:
+        """建立 asyncio 模式的馬桶蓋控制器"""
+        return AsyncLidController(loop=self.loop, **kwargs)
+    
+    def _init_hardware(self):
+        """初始化所有硬體模組，並讓 LINE 服務使用非同步傳輸"""
+        super()._init_hardware()
+        self.line_service.use_async_transport(self.loop)
+    
+    def _on_config_file_changed(self):
+        """內部函式：.env 變更時改在事件迴圈中重新載入（與 SIGHUP 相同），套用設定不與事件迴圈競爭"""
+        self.loop.call_soon_threadsafe(self.reload_config)
+    
+    async def _serve(self):
+        """事件迴圈主程式"""
+        for lid in self.lids.values():
+            lid.bind()
+            lid.check_initial_state()
+        
+        self.loop.add_signal_handler(SIGINT, self._stop_event.set)
+        self.loop.add_signal_handler(SIGHUP, self.reload_config)
+        self._start_config_reload()
+        self._start_daily_rollover()
+        logger.info("程式正在監聽 GPIO 事件（asyncio 模式，按 Ctrl+C 結束）...")
+        await self._stop_event.wait()
+        
+        # 在事件迴圈內取消進行中的動作並關閉非同步連線
+        for lid in self.lids.values():
+            lid.cancel_actions()
+        await asyncio.sleep(0)
+        await self.line_service.close_async()
+    
+    def run(self):
+        """啟動 SmartLid 系統（asyncio 模式）"""
+        logger.info("=" * 60)
+        logger.info("🚽 SmartLid 核心控制程式 V7.0 啟動（asyncio 模式）")
+        logger.info(f"   監管馬桶蓋: {', '.join(self.lids)}")
+        logger.info(f"   延遲通知時間: {Config.LID_OPEN_TIMEOUT} 秒")
+        logger.info(f"   Stage 2 門檻: 當日 {Config.DAILY_ALERT_THRESHOLD} 次")
+        logger.info("=" * 60)
+        
+        try:
+            self.loop.run_until_complete(self._serve())
+        except KeyboardInterrupt:
+            pass
+        self.cleanup()
+
+
 def main():
     """主函式"""
+    profile = StartupProfile()
+    profile.record("imports", profile.origin)
+    setup_logging()
     try:
-        controller = SmartLidController()
+        if Config.RUNTIME_MODE == "asyncio":
+            controller = AsyncSmartLidController(profile)
+        else:
+            controller = SmartLidController(profile)
         controller.run()
     except Exception as e:
-        print(f"\n❌ 程式執行錯誤: {e}")
+        logger.exception(f"❌ 程式執行錯誤: {e}")
         sys.exit(1)
 
 
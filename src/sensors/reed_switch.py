@@ -2,33 +2,107 @@
 磁簧開關（Reed Switch）感測器模組
 用於偵測馬桶蓋開合狀態
 """
-from gpiozero import DigitalInputDevice
-from typing import Callable, Optional
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ReedEvent:
+    """穩定後的開合事件"""
+    
+    __slots__ = ("value", "raw_timestamp", "settled_at", "bounces")
+    
+    def __init__(self, value: int, raw_timestamp: float, settled_at: float, bounces: int):
+        """
+        Args:
+            value: 穩定後的狀態值（1 = 蓋子抬起，0 = 蓋子放下）
+            raw_timestamp: 本次抖動中第一個原始邊緣的時間（time.monotonic()）
+            settled_at: 判定為穩定的時間
+            bounces: 被合併掉的原始邊緣數量
+        """
+        self.value = value
+        self.raw_timestamp = raw_timestamp
+        self.settled_at = settled_at
+        self.bounces = bounces
+    
+    @property
+    def settle_delay(self) -> float:
+        """自第一個原始邊緣到判定穩定的延遲（秒）"""
+        return self.settled_at - self.raw_timestamp
+    
+    def __repr__(self):
+        return (f"ReedEvent(value={self.value}, bounces={self.bounces}, "
+                f"settle_delay={self.settle_delay * 1000:.1f}ms)")
 
 
 class ReedSwitch:
-    """磁簧開關感測器類別"""
+    """
+    磁簧開關感測器類別
     
-    def __init__(self, pin: int):
+    磁鐵接近或離開時接點會抖動，產生一連串的原始邊緣。原始邊緣只記錄時間並喚醒
+    穩定判定執行緒；訊號維持 stable_time 秒沒有變化後才讀取電位，與上次發出的
+    狀態不同時才呼叫 when_activated / when_deactivated，並傳入 ReedEvent。
+    抖動後回到原狀態的短暫雜訊不會產生任何回呼。
+    """
+    
+    def __init__(self, pin: int, stable_time: float = 0.05, clock: Callable[[], float] = time.monotonic,
+                 device=None):
         """
         初始化磁簧開關
         
         Args:
             pin: GPIO 針腳號碼
+            stable_time: 判定為穩定所需的無變化時間（秒），0 表示不做防彈跳
+            clock: 單調時鐘函式
+            device: 輸入裝置（選用），預設為 gpiozero 的 DigitalInputDevice；
+                模擬時可傳入 simulation.drivers.SimInputDevice
         """
         self.pin = pin
-        self.device = DigitalInputDevice(pin)
-        print(f"🧲 磁簧開關已初始化於 GPIO {pin}")
+        self.stable_time = stable_time
+        self.clock = clock
+        if device is None:
+            from gpiozero import DigitalInputDevice
+            device = DigitalInputDevice(pin)
+        self.device = device
+        
+        self.stats: Dict[str, int] = {"raw_edges": 0, "emitted": 0, "bounces": 0, "glitches": 0}
+        # 啟用時間與最近一次穩定事件：回調綁定前（啟動期間）發生的開合仍可追溯
+        self.armed_at = clock()
+        self.last_event: Optional[ReedEvent] = None
+        
+        self._when_activated: Optional[Callable] = None
+        self._when_deactivated: Optional[Callable] = None
+        self._listeners: List[Callable[[ReedEvent], None]] = []
+        self._state = self.device.value
+        self._burst_started: Optional[float] = None
+        self._burst_edges = 0
+        self._last_edge: Optional[float] = None
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread: Optional[threading.Thread] = None
         
+        if stable_time > 0:
+            self._thread = threading.Thread(target=self._settle_loop, name=f"smartlid-reed{pin}", daemon=True)
+            self._thread.start()
+        
+        self.device.when_activated = lambda: self._on_raw_edge(1)
+        self.device.when_deactivated = lambda: self._on_raw_edge(0)
+        logger.info(f"🧲 磁簧開關已初始化於 GPIO {pin}（防彈跳 {stable_time * 1000:.0f} ms）")
+    
     @property
     def value(self) -> int:
         """
-        取得當前狀態值
+        取得穩定後的狀態值
         
         Returns:
             0: LOW (磁鐵靠近，蓋子放下)
             1: HIGH (磁鐵遠離，蓋子抬起)
         """
+        if self.stable_time > 0:
+            return self._state
         return self.device.value
     
     def is_closed(self) -> bool:
@@ -39,7 +113,7 @@ class ReedSwitch:
             True: 蓋子放下（磁鐵靠近開關，LOW）
             False: 蓋子抬起（磁鐵遠離開關，HIGH）
         """
-        return self.device.value == 0
+        return self.value == 0
     
     def is_open(self) -> bool:
         """
@@ -49,7 +123,7 @@ class ReedSwitch:
             True: 蓋子抬起（HIGH）
             False: 蓋子放下（LOW）
         """
-        return self.device.value == 1
+        return self.value == 1
     
     def wait_for_open(self, timeout: Optional[float] = None):
         """
@@ -58,9 +132,9 @@ class ReedSwitch:
         Args:
             timeout: 超時時間（秒），None 表示無限等待
         """
-        print("等待蓋子開啟...")
+        logger.info("等待蓋子開啟...")
         self.device.wait_for_active(timeout=timeout)
-        print("偵測到蓋子開啟")
+        logger.info("偵測到蓋子開啟")
     
     def wait_for_close(self, timeout: Optional[float] = None):
         """
@@ -69,32 +143,117 @@ class ReedSwitch:
         Args:
             timeout: 超時時間（秒），None 表示無限等待
         """
-        print("等待蓋子關閉...")
+        logger.info("等待蓋子關閉...")
         self.device.wait_for_inactive(timeout=timeout)
-        print("偵測到蓋子關閉")
+        logger.info("偵測到蓋子關閉")
     
     @property
     def when_activated(self):
-        """蓋子開啟（HIGH）時的回調函數"""
-        return self.device.when_activated
+        """蓋子開啟（HIGH）且穩定時的回調函數，參數為 ReedEvent"""
+        return self._when_activated
     
     @when_activated.setter
     def when_activated(self, callback: Callable):
         """設定蓋子開啟時的回調函數"""
-        self.device.when_activated = callback
+        self._when_activated = callback
     
     @property
     def when_deactivated(self):
-        """蓋子關閉（LOW）時的回調函數"""
-        return self.device.when_deactivated
+        """蓋子關閉（LOW）且穩定時的回調函數，參數為 ReedEvent"""
+        return self._when_deactivated
     
     @when_deactivated.setter
     def when_deactivated(self, callback: Callable):
         """設定蓋子關閉時的回調函數"""
-        self.device.when_deactivated = callback
+        self._when_deactivated = callback
+    
+    def add_listener(self, callback: Callable[[ReedEvent], None]):
+        """
+        註冊額外的事件監聽者（例如閉迴路伺服馬達），與 when_activated / when_deactivated 互不影響
+        
+        Args:
+            callback: 每個穩定事件都會呼叫，參數為 ReedEvent；應快速返回
+        """
+        self._listeners = self._listeners + [callback]
+    
+    def remove_listener(self, callback: Callable[[ReedEvent], None]):
+        """移除事件監聽者"""
+        self._listeners = [listener for listener in self._listeners if listener is not callback]
+    
+    def _on_raw_edge(self, value: int):
+        """內部函式：原始邊緣只記錄時間，交由穩定判定執行緒處理"""
+        now = self.clock()
+        if self.stable_time <= 0:
+            self.stats["raw_edges"] += 1
+            self._state = value
+            self._emit(ReedEvent(value, now, now, 0))
+            return
+        
+        with self._condition:
+            self.stats["raw_edges"] += 1
+            if self._burst_started is None:
+                self._burst_started = now
+                self._burst_edges = 0
+                # 新的抖動開始：喚醒執行緒計算等待時間（抖動期間不再喚醒）
+                self._condition.notify()
+            self._burst_edges += 1
+            self._last_edge = now
+    
+    def _settle_loop(self):
+        """穩定判定執行緒主迴圈"""
+        while True:
+            with self._condition:
+                while self._running:
+                    if self._last_edge is None:
+                        self._condition.wait()
+                        continue
+                    remaining = self._last_edge + self.stable_time - self.clock()
+                    if remaining > 0:
+                        self._condition.wait(remaining)
+                        continue
+                    break
+                if not self._running:
+                    return
+                
+                started, edges = self._burst_started, self._burst_edges
+                self._burst_started = self._last_edge = None
+                value = self.device.value
+                
+                if value == self._state:
+                    # 抖動後回到原狀態：視為雜訊，不發出事件
+                    self.stats["glitches"] += 1
+                    self.stats["bounces"] += edges
+                    continue
+                
+                self._state = value
+                self.stats["bounces"] += edges - 1
+                event = ReedEvent(value, started, self.clock(), edges - 1)
+            
+            self._emit(event)
+    
+    def _emit(self, event: ReedEvent):
+        """內部函式：呼叫穩定狀態的回調函數"""
+        self.stats["emitted"] += 1
+        self.last_event = event
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.exception(f"❌ 磁簧開關監聽者執行失敗: {e}")
+        callback = self._when_activated if event.value == 1 else self._when_deactivated
+        if callback is None:
+            return
+        try:
+            callback(event)
+        except Exception as e:
+            logger.exception(f"❌ 磁簧開關回調執行失敗: {e}")
     
     def cleanup(self):
         """清理資源"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
         self.device.close()
-        print("HW: 磁簧開關已清理。")
-
+        logger.info("HW: 磁簧開關已清理。")
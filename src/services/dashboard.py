@@ -0,0 +1,330 @@
+"""
+網頁儀表板模組
+以 Flask 提供每小時／每日／各馬桶蓋的統計（讀取事件紀錄的彙總表）與即時狀態（Server-Sent Events）。
+統計回應經過記憶體 TTL 快取並附 ETag；儀表板在獨立執行緒中以唯讀連線查詢，
+控制器只把狀態放入記憶體中的 LiveStateHub，不會被網頁請求阻塞。
+Flask 只在啟用儀表板時才匯入。
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LiveStateHub:
+    """
+    即時狀態發布
+    
+    publish() 只在鎖內更新最新狀態並附加序號（不做 JSON 序列化或 I/O）；
+    SSE 連線以序號取得漏掉的事件，超過保留數量時改送最新狀態。
+    """
+    
+    def __init__(self, history: int = 256):
+        """
+        Args:
+            history: 保留的最近事件數量
+        """
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._seq = 0
+    
+    def publish(self, event: str, state: Dict[str, Any]):
+        """
+        發布一個馬桶蓋的狀態
+        
+        Args:
+            event: 事件種類（lid_opened、lid_closed、alert、rollover）
+            state: LidController.snapshot()
+        """
+        payload = dict(state, event=event, ts=time.time())
+        with self._condition:
+            self._seq += 1
+            self._events.append((self._seq, payload))
+            self._latest[state["lid"]] = payload
+            self._condition.notify_all()
+    
+    def latest(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """目前序號與各馬桶蓋的最新狀態"""
+        with self._condition:
+            return self._seq, list(self._latest.values())
+    
+    def wait(self, after: int, timeout: float) -> Tuple[int, Optional[List[Dict[str, Any]]]]:
+        """
+        等待序號大於 after 的事件
+        
+        Returns:
+            (最新序號, 事件清單)；事件已超出保留範圍時事件清單為 None（應改送最新狀態）
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after, timeout)
+            if self._seq <= after:
+                return self._seq, []
+            if not self._events or self._events[0][0] > after + 1:
+                return self._seq, None
+            return self._seq, [payload for seq, payload in self._events if seq > after]
+
+
+class TTLCache:
+    """儀表板回應的記憶體快取：在 ttl 秒內重複的查詢直接返回已序列化的內容與 ETag"""
+    
+    def __init__(self, ttl: float = 5.0, max_entries: int = 256):
+        """
+        Args:
+            ttl: 快取有效時間（秒），0 表示不快取
+            max_entries: 最多快取的查詢數量
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries: Dict[tuple, Tuple[float, bytes, str]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key: tuple, compute: Callable[[], bytes],
+            cacheable: Optional[Callable[[], bool]] = None) -> Tuple[bytes, str]:
+        """
+        取得快取內容，過期或不存在時呼叫 compute 重新產生
+        
+        Args:
+            key: 查詢鍵
+            compute: 產生內容的函式
+            cacheable: compute 完成後呼叫（同一執行緒），返回 False 時不快取這次的內容（例如查詢失敗）
+        
+        Returns:
+            (內容, ETag)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.stats["hits"] += 1
+                return entry[1], entry[2]
+            self.stats["misses"] += 1
+        
+        body = compute()
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        if self.ttl > 0 and (cacheable is None or cacheable()):
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    # 先清掉過期項目，仍然太多時整個清空（查詢種類有限，很少發生）
+                    self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                    if len(self._entries) >= self.max_entries:
+                        self._entries.clear()
+                self._entries[key] = (now + self.ttl, body, etag)
+        return body, etag
+
+
+_INDEX_HTML = """<!DOCTYPE html>
+<html lang="zh-Hant"><head><meta charset="utf-8"><title>SmartLid 儀表板</title>
+<style>
+body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}td,th{padding:.3em .8em;border-bottom:1px solid #ddd}
+.bar{display:inline-block;width:14px;margin-right:2px;background:#4a90d9;vertical-align:bottom}
+.open{color:#c0392b}.closed{color:#27ae60}
+</style></head><body>
+<h1>🚽 SmartLid 儀表板</h1>
+<h2>即時狀態</h2>
+<table><thead><tr><th>馬桶蓋</th><th>狀態</th><th>倒數</th><th>今日提醒</th><th>最後事件</th></tr></thead>
+<tbody id="lids"></tbody></table>
+<h2>近 30 日提醒次數</h2><div id="daily" style="height:120px"></div>
+<script>
+const lids = {};
+function render() {
+  document.getElementById("lids").innerHTML = Object.values(lids).map(s =>
+    `<tr><td>${s.lid}</td><td class="${s.open ? "open" : "closed"}">${s.open ? "抬起" : "放下"}</td>` +
+    `<td>${s.countdown_active ? s.countdown_remaining + " 秒" : "-"}</td><td>${s.daily_alert_count}</td>` +
+    `<td>${s.event} ${new Date(s.ts * 1000).toLocaleTimeString()}</td></tr>`).join("");
+}
+const source = new EventSource("api/events");
+source.addEventListener("state", e => { for (const s of JSON.parse(e.data)) lids[s.lid] = s; render(); });
+fetch("api/daily?days=30").then(r => r.json()).then(data => {
+  const totals = {};
+  for (const row of data.rows) totals[row.day] = (totals[row.day] || 0) + row.alerts;
+  const max = Math.max(1, ...Object.values(totals));
+  document.getElementById("daily").innerHTML = Object.entries(totals).map(([day, n]) =>
+    `<span class="bar" title="${day}: ${n}" style="height:${n / max * 100}%"></span>`).join("");
+});
+</script></body></html>
+"""
+
+
+def create_app(event_store=None, state_hub: Optional[LiveStateHub] = None, cache_ttl: float = 5.0,
+               heartbeat: float = 15.0, today: Callable[[], date] = date.today):
+    """
+    建立儀表板 Flask 應用程式
+    
+    Args:
+        event_store: 事件紀錄（提供彙總表查詢），None 時統計端點返回 503
+        state_hub: 即時狀態來源，None 時即時端點返回 503
+        cache_ttl: 統計回應的快取時間（秒）
+        heartbeat: SSE 無事件時送出心跳的間隔（秒），用於偵測已斷線的連線
+        today: 取得今日日期的函式
+    
+    Returns:
+        Flask: 應用程式（app.config["CACHE"] 為 TTLCache）
+    """
+    from flask import Flask, Response, abort, request
+    
+    app = Flask(__name__)
+    cache = TTLCache(cache_ttl)
+    app.config["CACHE"] = cache
+    local = threading.local()
+    
+    def reader() -> sqlite3.Connection:
+        """每個請求執行緒一條唯讀連線（WAL 模式下不阻塞控制器的寫入）"""
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{event_store.db_path}?mode=ro", uri=True, check_same_thread=False)
+            local.conn = conn
+        return conn
+    
+    def rollup(granularity: str, start: str, end: str, lid: Optional[str]) -> List[Dict[str, Any]]:
+        if event_store is None:
+            abort(503, "事件紀錄未啟用")
+        try:
+            return event_store.rollup(granularity, start, end, lid, conn=reader())
+        except sqlite3.Error:
+            # 資料庫尚未建立或連線失效：關閉連線，下次重新連線；這次的空結果不快取
+            conn = getattr(local, "conn", None)
+            if conn is not None:
+                conn.close()
+            local.conn = None
+            local.failed = True
+            return []
+    
+    def json_response(key: tuple, compute: Callable[[], Any]) -> Response:
+        """已快取的 JSON 回應；If-None-Match 相符時返回 304"""
+        local.failed = False
+        body, etag = cache.get(key, lambda: json.dumps(compute(), ensure_ascii=False).encode("utf-8"),
+                               cacheable=lambda: not local.failed)
+        headers = {"Cache-Control": f"max-age={int(cache.ttl)}"}
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+        else:
+            response = Response(body, mimetype="application/json", headers=headers)
+        response.set_etag(etag)
+        return response
+    
+    def days_arg(default: int) -> int:
+        return max(1, min(request.args.get("days", default, type=int), 3660))
+    
+    @app.route("/")
+    def index():
+        return Response(_INDEX_HTML, mimetype="text/html")
+    
+    @app.route("/api/hourly")
+    def hourly():
+        day = request.args.get("day") or today().isoformat()
+        lid = request.args.get("lid")
+        return json_response(("hourly", day, lid), lambda: {
+            "day": day, "rows": rollup("hour", f"{day}T00", f"{day}T23", lid)
+        })
+    
+    @app.route("/api/daily")
+    def daily():
+        days, lid = days_arg(30), request.args.get("lid")
+        end = today()
+        start = end - timedelta(days=days - 1)
+        return json_response(("daily", end, days, lid), lambda: {
+            "start": start.isoformat(), "end": end.isoformat(),
+            "rows": rollup("day", start.isoformat(), end.isoformat(), lid)
+        })
+    
+    @app.route("/api/lids")
+    def lids():
+        days = days_arg(30)
+        end = today()
+        start = end - timedelta(days=days - 1)
+        
+        def compute():
+            totals: Dict[str, Dict[str, Any]] = {}
+            for row in rollup("day", start.isoformat(), end.isoformat(), None):
+                lid_totals = totals.setdefault(row["lid"], {"lid": row["lid"]})
+                for column, value in row.items():
+                    if column not in ("day", "lid"):
+                        lid_totals[column] = lid_totals.get(column, 0) + value
+            return {"start": start.isoformat(), "end": end.isoformat(), "lids": list(totals.values())}
+        
+        return json_response(("lids", end, days), compute)
+    
+    @app.route("/api/state")
+    def state():
+        if state_hub is None:
+            abort(503, "即時狀態未啟用")
+        seq, states = state_hub.latest()
+        return Response(json.dumps({"seq": seq, "lids": states}, ensure_ascii=False),
+                        mimetype="application/json", headers={"Cache-Control": "no-store"})
+    
+    @app.route("/api/events")
+    def events():
+        if state_hub is None:
+            abort(503, "即時狀態未啟用")
+        last_id = request.headers.get("Last-Event-ID", type=int)
+        
+        def stream():
+            seq, states = state_hub.latest()
+            if last_id is None or last_id > seq:
+                yield _sse("state", seq, states)
+            else:
+                seq = last_id
+            while True:
+                seq, changes = state_hub.wait(seq, heartbeat)
+                if changes is None:
+                    # 落後太多：改送各馬桶蓋的最新狀態
+                    seq, changes = state_hub.latest()
+                if changes:
+                    yield _sse("state", seq, changes)
+                else:
+                    yield ": keepalive\n\n"
+        
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    
+    return app
+
+
+def _sse(event: str, seq: int, data: Any) -> str:
+    """內部函式：組成一則 Server-Sent Event"""
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class DashboardServer:
+    """在背景執行緒中執行儀表板（werkzeug 多執行緒伺服器，每個 SSE 連線一條執行緒）"""
+    
+    def __init__(self, app, host: str = "0.0.0.0", port: int = 5000):
+        """
+        Args:
+            app: create_app() 建立的應用程式
+            host: 監聽位址
+            port: 監聽埠號（0 表示自動分配）
+        """
+        from werkzeug.serving import WSGIRequestHandler, make_server
+        
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                # 靜音：SSE 連線與輪詢頻繁，不輸出存取紀錄（錯誤仍會記錄）
+                pass
+        
+        self._server = make_server(host, port, app, threaded=True, request_handler=QuietHandler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+    
+    def start(self) -> "DashboardServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="smartlid-dashboard", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,315 @@
+"""
+事件紀錄模組
+以 SQLite（WAL 模式）保存開合、提醒與動作結果，寫入由背景執行緒批次進行
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EventStore:
+    """
+    批次寫入的事件紀錄
+    
+    record() 只把事件放入記憶體緩衝區，不做任何 I/O；背景執行緒在緩衝區達到
+    batch_size 或距上次寫入超過 flush_interval 秒時，以單一交易寫入整批事件。
+    每批交易都以 synchronous=FULL 落盤，因此斷電時最多遺失最近 flush_interval 秒
+    （且不超過 max_buffer 筆）的事件，資料庫本身不會損毀。
+    
+    同一交易內也把該批事件累加到 hourly_stats 與 daily_stats（每小時／每日、每個馬桶蓋一列），
+    換日統計與儀表板只讀彙總表，查詢成本與原始事件的累積量無關。
+    """
+    
+    # 事件種類
+    LID_OPENED = "lid_opened"
+    LID_CLOSED = "lid_closed"
+    ALERT = "alert"
+    ACTION = "action"
+    
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS lid_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            lid TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value INTEGER,
+            duration REAL,
+            status TEXT,
+            detail TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_lid_events_ts ON lid_events (ts);
+        CREATE TABLE IF NOT EXISTS hourly_stats (
+            hour TEXT NOT NULL,
+            lid TEXT NOT NULL,
+            opens INTEGER NOT NULL DEFAULT 0,
+            closes INTEGER NOT NULL DEFAULT 0,
+            open_seconds REAL NOT NULL DEFAULT 0,
+            alerts INTEGER NOT NULL DEFAULT 0,
+            stage2_alerts INTEGER NOT NULL DEFAULT 0,
+            failed_actions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, lid)
+        );
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT NOT NULL,
+            lid TEXT NOT NULL,
+            opens INTEGER NOT NULL DEFAULT 0,
+            closes INTEGER NOT NULL DEFAULT 0,
+            open_seconds REAL NOT NULL DEFAULT 0,
+            alerts INTEGER NOT NULL DEFAULT 0,
+            stage2_alerts INTEGER NOT NULL DEFAULT 0,
+            failed_actions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, lid)
+        );
+    """
+    
+    _ROLLUP_COLUMNS = ("opens", "closes", "open_seconds", "alerts", "stage2_alerts", "failed_actions")
+    
+    def __init__(self, db_path: str, batch_size: int = 100, flush_interval: float = 1.0,
+                 max_buffer: int = 10000):
+        """
+        初始化事件紀錄
+        
+        Args:
+            db_path: SQLite 資料庫路徑
+            batch_size: 緩衝區達到此數量時立即寫入
+            flush_interval: 最長寫入間隔（秒），即斷電時最多遺失的時間範圍
+            max_buffer: 緩衝區上限；儲存裝置停滯時捨棄最舊的事件，避免記憶體無限增長
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        
+        self.stats: Dict[str, Any] = {"recorded": 0, "written": 0, "batches": 0, "write_time": 0.0}
+        
+        self._buffer = deque(maxlen=max_buffer)
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> "EventStore":
+        """啟動背景寫入執行緒"""
+        self._thread = threading.Thread(target=self._run, name="smartlid-events", daemon=True)
+        self._thread.start()
+        return self
+    
+    def record(self, kind: str, lid: str, value: Optional[int] = None, duration: Optional[float] = None,
+               status: Optional[str] = None, detail: Optional[Dict[str, Any]] = None):
+        """
+        記錄一筆事件（不阻塞）
+        
+        Args:
+            kind: 事件種類（LID_OPENED、LID_CLOSED、ALERT、ACTION）
+            lid: 馬桶蓋名稱
+            value: 整數值（例如提醒次數、合併的抖動數）
+            duration: 時間長度（秒），例如開蓋時間或動作延遲
+            status: 狀態文字（例如提醒階段、動作結果）
+            detail: 其他資訊，以 JSON 保存
+        """
+        self._buffer.append((
+            time.time(), lid, kind, value, duration, status,
+            json.dumps(detail, ensure_ascii=False) if detail else None
+        ))
+        self.stats["recorded"] += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        要求立即寫入並等待完成
+        
+        Returns:
+            bool: 緩衝區已清空返回 True
+        """
+        with self._flushed:
+            self._wakeup.set()
+            return self._flushed.wait_for(lambda: not self._buffer, timeout)
+    
+    def query(self, since: float = 0.0, lid: Optional[str] = None, kind: Optional[str] = None,
+              limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        查詢已寫入的事件（使用獨立的唯讀連線，不影響寫入）
+        
+        Args:
+            since: 起始時間（time.time()）
+            lid: 只查詢此馬桶蓋（選用）
+            kind: 只查詢此事件種類（選用）
+            limit: 最多返回筆數
+        
+        Returns:
+            List[Dict[str, Any]]: 依時間排序的事件
+        """
+        sql = "SELECT ts, lid, kind, value, duration, status, detail FROM lid_events WHERE ts >= ?"
+        params: list = [since]
+        if lid is not None:
+            sql += " AND lid = ?"
+            params.append(lid)
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " ORDER BY ts LIMIT ?"
+        params.append(limit)
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "ts": ts, "lid": lid_name, "kind": event_kind, "value": value,
+                "duration": duration, "status": status,
+                "detail": json.loads(detail) if detail else None,
+            }
+            for ts, lid_name, event_kind, value, duration, status, detail in rows
+        ]
+    
+    def daily_stats(self, day: str, lid: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查詢每日彙總（寫入事件時累加，讀取時不掃描原始事件）
+        
+        Args:
+            day: 日期字串（YYYY-MM-DD，本地時間）
+            lid: 只查詢此馬桶蓋（選用）
+        
+        Returns:
+            List[Dict[str, Any]]: 各馬桶蓋當日的開合、開蓋時間、提醒與失敗動作數
+        """
+        return self.rollup("day", day, day, lid)
+    
+    def rollup(self, granularity: str, start: str, end: str, lid: Optional[str] = None,
+               conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        """
+        查詢彙總表的區間（以主鍵範圍掃描，只讀取區間內的列）
+        
+        Args:
+            granularity: "hour"（鍵為 YYYY-MM-DDTHH）或 "day"（鍵為 YYYY-MM-DD）
+            start: 起始鍵（含）
+            end: 結束鍵（含）
+            lid: 只查詢此馬桶蓋（選用）
+            conn: 沿用的唯讀連線（選用），預設每次開啟新連線
+        
+        Returns:
+            List[Dict[str, Any]]: 依時間、馬桶蓋排序的彙總列，時間鍵欄位名稱同 granularity
+        """
+        table = {"hour": "hourly_stats", "day": "daily_stats"}[granularity]
+        sql = (f"SELECT {granularity}, lid, {', '.join(self._ROLLUP_COLUMNS)} FROM {table} "
+               f"WHERE {granularity} BETWEEN ? AND ?")
+        params: list = [start, end]
+        if lid is not None:
+            sql += " AND lid = ?"
+            params.append(lid)
+        sql += f" ORDER BY {granularity}, lid"
+        
+        owned = conn is None
+        if owned:
+            conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            # 背景執行緒尚未建立資料表
+            rows = []
+        finally:
+            if owned:
+                conn.close()
+        return [dict(zip((granularity, "lid") + self._ROLLUP_COLUMNS, row)) for row in rows]
+    
+    def stop(self, timeout: float = 5.0):
+        """停止背景執行緒，結束前寫入緩衝區內所有事件"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """內部函式：建立資料庫連線並確保資料表存在"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # 每批交易都落盤：批次寫入讓 fsync 次數與事件數量無關
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.executescript(self._SCHEMA)
+        conn.commit()
+        return conn
+    
+    @classmethod
+    def _fold_rollups(cls, rows: List[tuple]) -> Dict[str, List[tuple]]:
+        """內部函式：將一批事件累加為每小時與每日 (時間鍵, lid) 的增量"""
+        totals: Dict[tuple, List[float]] = {}
+        for ts, lid, kind, _, duration, status, _ in rows:
+            counts = totals.setdefault((datetime.fromtimestamp(ts).strftime("%Y-%m-%dT%H"), lid),
+                                       [0] * len(cls._ROLLUP_COLUMNS))
+            if kind == cls.LID_OPENED:
+                counts[0] += 1
+            elif kind == cls.LID_CLOSED:
+                counts[1] += 1
+                counts[2] += duration or 0.0
+            elif kind == cls.ALERT:
+                counts[3] += 1
+                counts[4] += status == "stage2"
+            elif kind == cls.ACTION and status in ("failed", "timeout"):
+                counts[5] += 1
+        
+        daily: Dict[tuple, List[float]] = {}
+        for (hour, lid), counts in totals.items():
+            day_counts = daily.setdefault((hour[:10], lid), [0] * len(cls._ROLLUP_COLUMNS))
+            for index, value in enumerate(counts):
+                day_counts[index] += value
+        return {
+            "hourly_stats": [key + tuple(counts) for key, counts in totals.items()],
+            "daily_stats": [key + tuple(counts) for key, counts in daily.items()],
+        }
+    
+    def _write_batch(self, conn: sqlite3.Connection):
+        """內部函式：將緩衝區內的事件以單一交易寫入"""
+        with self._flushed:
+            rows = []
+            while self._buffer:
+                rows.append(self._buffer.popleft())
+            if rows:
+                started = time.perf_counter()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO lid_events (ts, lid, kind, value, duration, status, detail) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+                    for table, increments in self._fold_rollups(rows).items():
+                        key = "hour" if table == "hourly_stats" else "day"
+                        conn.executemany(
+                            f"INSERT INTO {table} ({key}, lid, {', '.join(self._ROLLUP_COLUMNS)}) "
+                            f"VALUES (?, ?, {', '.join('?' * len(self._ROLLUP_COLUMNS))}) "
+                            f"ON CONFLICT ({key}, lid) DO UPDATE SET "
+                            + ", ".join(f"{column} = {column} + excluded.{column}"
+                                        for column in self._ROLLUP_COLUMNS),
+                            increments
+                        )
+                self.stats["write_time"] += time.perf_counter() - started
+                self.stats["written"] += len(rows)
+                self.stats["batches"] += 1
+            self._flushed.notify_all()
+    
+    def _run(self):
+        """背景執行緒主迴圈"""
+        conn = self._connect()
+        try:
+            while not self._stopping:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                try:
+                    self._write_batch(conn)
+                except sqlite3.Error as e:
+                    logger.exception(f"❌ 寫入事件紀錄失敗: {e}")
+            
+            # 結束前寫入剩餘事件
+            self._write_batch(conn)
+        finally:
+            conn.close()
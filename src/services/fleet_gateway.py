@@ -0,0 +1,439 @@
+"""
+車隊閘道模組
+接收各 SmartLid 節點上傳的批次事件框架（HTTP），依節點與序號去除重複後大量寫入 SQLite，
+並以單一共用的 LineMessagingService 統一發送各節點的 LINE 通知。
+
+使用方式:
+    cd src && python -m services.fleet_gateway
+"""
+import hmac
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _valid_event(event: Any) -> bool:
+    """內部函式：檢查事件 [序號, 時間戳, 種類, 馬桶蓋, 次數, 日期, 收件者] 的欄位型別"""
+    if not isinstance(event, list) or len(event) != 7:
+        return False
+    seq, ts, kind = event[:3]
+    return (isinstance(seq, int) and not isinstance(seq, bool)
+            and isinstance(ts, (int, float)) and not isinstance(ts, bool)
+            and isinstance(kind, str))
+
+
+class _IngestRequest:
+    """一個待提交的框架；寫入執行緒提交後設定 ack 並喚醒等待的請求執行緒"""
+    
+    __slots__ = ("node", "events", "ack", "error", "done")
+    
+    def __init__(self, node: str, events: List[list]):
+        self.node = node
+        self.events = events
+        self.ack = 0
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class FleetGateway:
+    """
+    車隊事件匯集
+    
+    ingest() 由各 HTTP 請求執行緒呼叫，將框架放入佇列後等待提交；單一寫入執行緒每次取出
+    所有排隊中的框架，以一個交易大量寫入（group commit），因此負載越高每次提交的框架越多。
+    每個節點的序號依序遞增，寫入執行緒以記憶體中的最大已提交序號過濾重送的框架，
+    資料表的 (node, seq) 主鍵再保證不重複；只有新事件中的通知請求會交給通知執行緒發送。
+    通知執行緒每處理完一則通知即更新 fleet_notified 中該節點的已通知序號，閘道重新啟動時
+    會先補送已確認但尚未通知的事件，因此確認後當機不會遺失通知（最多重送一則）。
+    """
+    
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fleet_events (
+            node TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            ts REAL NOT NULL,
+            kind TEXT NOT NULL,
+            lid TEXT,
+            count INTEGER,
+            day TEXT,
+            recipient TEXT,
+            PRIMARY KEY (node, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS fleet_nodes (
+            node TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL,
+            last_seen REAL NOT NULL,
+            events INTEGER NOT NULL,
+            alerts INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS fleet_notified (
+            node TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    """
+    
+    def __init__(self, db_path: str, line_service=None, commit_timeout: float = 10.0):
+        """
+        Args:
+            db_path: SQLite 資料庫路徑
+            line_service: 統一發送通知的 LineMessagingService（None 表示只匯集事件）
+            commit_timeout: 請求等待提交的期限（秒）
+        """
+        self.db_path = db_path
+        self.line_service = line_service
+        self.commit_timeout = commit_timeout
+        
+        self.stats: Dict[str, int] = {
+            "frames": 0, "events": 0, "duplicates": 0, "commits": 0, "notifications": 0, "failed": 0
+        }
+        
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._notifications = deque()
+        self._notify_wakeup = threading.Event()
+        self._last_seq: Dict[str, int] = {}
+        self._ready = threading.Event()
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+    
+    def start(self) -> "FleetGateway":
+        """啟動寫入與通知執行緒（等待資料庫就緒、載入各節點的已提交序號與尚未發送的通知）"""
+        self._threads = [
+            threading.Thread(target=self._run_writer, name="fleet-writer", daemon=True),
+            threading.Thread(target=self._run_notifier, name="fleet-notifier", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._ready.wait()
+        return self
+    
+    def ingest(self, node: str, events: List[list]) -> int:
+        """
+        提交一個框架並等待寫入完成
+        
+        Args:
+            node: 節點名稱
+            events: [[序號, 時間戳, 種類, 馬桶蓋, 次數, 日期, 收件者], ...]，序號遞增
+        
+        Returns:
+            int: 此節點已提交的最大序號（節點據此自待送區刪除）
+        
+        Raises:
+            TimeoutError: 未在期限內提交
+            sqlite3.Error: 寫入失敗
+            Exception: 框架內容無法處理（例如欄位型別錯誤；HTTP 端點已先行驗證）
+        """
+        request = _IngestRequest(node, events)
+        self._queue.append(request)
+        self._wakeup.set()
+        if not request.done.wait(self.commit_timeout):
+            raise TimeoutError("等待提交逾時")
+        if request.error is not None:
+            raise request.error
+        return request.ack
+    
+    def nodes(self) -> List[Dict[str, Any]]:
+        """各節點的最後上線時間與累計數量"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute("SELECT * FROM fleet_nodes ORDER BY node")]
+        finally:
+            conn.close()
+    
+    def stop(self, timeout: float = 5.0):
+        """停止執行緒（佇列中的框架會先提交，通知會先送完）"""
+        self._stopping = True
+        self._wakeup.set()
+        self._notify_wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """內部函式：建立資料庫連線並確保資料表存在"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self._SCHEMA)
+        return conn
+    
+    def _run_writer(self):
+        """寫入執行緒主迴圈"""
+        conn = self._connect()
+        self._last_seq = dict(conn.execute("SELECT node, last_seq FROM fleet_nodes"))
+        if self.line_service is not None:
+            self._load_unsent(conn)
+        self._ready.set()
+        try:
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                batch = []
+                while self._queue:
+                    batch.append(self._queue.popleft())
+                if batch:
+                    try:
+                        self._commit(conn, batch)
+                    except Exception as e:
+                        # 未預期的錯誤只讓這一批失敗，寫入執行緒繼續服務後續的框架
+                        logger.exception(f"❌ 車隊框架提交失敗（{len(batch)} 個框架）: {e}")
+                        self.stats["failed"] += len(batch)
+                        for request in batch:
+                            if not request.done.is_set():
+                                request.error = e
+                                request.done.set()
+                elif self._stopping:
+                    return
+        finally:
+            conn.close()
+    
+    def _load_unsent(self, conn: sqlite3.Connection):
+        """內部函式：將已提交但尚未通知的通知請求放回通知佇列（上次在通知前停止或當機）"""
+        rows = conn.execute(
+            "SELECT e.node, e.seq, e.ts, e.kind, e.lid, e.count, e.day, e.recipient "
+            "FROM fleet_events e LEFT JOIN fleet_notified n ON n.node = e.node "
+            "WHERE e.kind LIKE 'notify!_%' ESCAPE '!' AND e.seq > COALESCE(n.seq, 0) "
+            "ORDER BY e.ts, e.node, e.seq"
+        ).fetchall()
+        if rows:
+            logger.warning(f"📨 補送 {len(rows)} 則尚未發送的車隊通知")
+            self._notifications.extend((row[0], list(row[1:])) for row in rows)
+            self._notify_wakeup.set()
+    
+    def _commit(self, conn: sqlite3.Connection, batch: List[_IngestRequest]):
+        """內部函式：過濾重複事件後以單一交易寫入整批框架"""
+        last_seq = {}
+        rows, notifications = [], []
+        nodes: Dict[str, list] = {}
+        now = time.time()
+        for request in batch:
+            committed = last_seq.get(request.node, self._last_seq.get(request.node, 0))
+            fresh = [event for event in request.events if event[0] > committed]
+            self.stats["duplicates"] += len(request.events) - len(fresh)
+            if fresh:
+                committed = fresh[-1][0]
+                last_seq[request.node] = committed
+                totals = nodes.setdefault(request.node, [0, 0])
+                for event in fresh:
+                    rows.append((request.node, *event))
+                    totals[0] += 1
+                    if event[2] == "alert":
+                        totals[1] += 1
+                    elif event[2].startswith("notify_"):
+                        notifications.append((request.node, event))
+            request.ack = committed
+        
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO fleet_events (node, seq, ts, kind, lid, count, day, recipient) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                conn.executemany(
+                    "INSERT INTO fleet_nodes (node, last_seq, last_seen, events, alerts) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(node) DO UPDATE SET last_seq = excluded.last_seq, last_seen = excluded.last_seen, "
+                    "events = events + excluded.events, alerts = alerts + excluded.alerts",
+                    [(node, last_seq[node], now, events, alerts) for node, (events, alerts) in nodes.items()]
+                )
+        except sqlite3.Error as e:
+            logger.error(f"❌ 車隊事件寫入失敗（{len(batch)} 個框架）: {e}")
+            self.stats["failed"] += len(batch)
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        
+        self._last_seq.update(last_seq)
+        self.stats["frames"] += len(batch)
+        self.stats["events"] += len(rows)
+        self.stats["commits"] += 1
+        for request in batch:
+            request.done.set()
+        if notifications and self.line_service is not None:
+            self._notifications.extend(notifications)
+            self._notify_wakeup.set()
+    
+    def _run_notifier(self):
+        """通知執行緒：依收到的順序以共用的 LINE 服務發送（套用該服務的限流與合併）"""
+        self._ready.wait()
+        conn = self._connect()
+        try:
+            self._notify_loop(conn)
+        finally:
+            conn.close()
+    
+    def _notify_loop(self, conn: sqlite3.Connection):
+        """內部函式：發送通知並記錄各節點的已通知序號"""
+        while True:
+            self._notify_wakeup.wait()
+            self._notify_wakeup.clear()
+            while self._notifications:
+                node, (seq, ts, kind, lid, count, day, recipient) = self._notifications.popleft()
+                try:
+                    if kind == "notify_alert":
+                        self.line_service.send_alert(count, day, recipient)
+                    elif kind == "notify_end_of_day":
+                        self.line_service.end_of_day(day, count, recipient)
+                    elif kind == "notify_summary":
+                        if not self.line_service.end_of_day(day, count, recipient):
+                            self.line_service.send_daily_summary(day, count, recipient)
+                    self.stats["notifications"] += 1
+                except Exception as e:
+                    logger.exception(f"❌ [{node}] 發送通知失敗（序號 {seq}）: {e}")
+                try:
+                    with conn:
+                        conn.execute(
+                            "INSERT INTO fleet_notified (node, seq) VALUES (?, ?) "
+                            "ON CONFLICT(node) DO UPDATE SET seq = MAX(seq, excluded.seq)",
+                            (node, seq)
+                        )
+                except sqlite3.Error as e:
+                    logger.error(f"❌ [{node}] 已通知序號寫入失敗（序號 {seq}）: {e}")
+            if self._stopping:
+                return
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    """框架上傳端點（支援 HTTP/1.1 keep-alive）"""
+    
+    protocol_version = "HTTP/1.1"
+    # keep-alive 下避免 Nagle 與延遲 ACK 互相等待造成約 40 ms 的假延遲
+    disable_nagle_algorithm = True
+    
+    def do_POST(self):
+        server: "FleetGatewayServer" = self.server.gateway_server
+        length = int(self.headers.get("Content-Length", "0"))
+        body = self.rfile.read(length)
+        if self.path != "/v1/frames":
+            self._reply(404, {"error": "not found"})
+            return
+        if server.token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {server.token}"):
+            self._reply(401, {"error": "unauthorized"})
+            return
+        try:
+            frame = json.loads(body)
+            node, events = frame["node"], frame["events"]
+            if not isinstance(node, str) or not isinstance(events, list) or not all(map(_valid_event, events)):
+                raise ValueError("框架格式錯誤")
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        try:
+            ack = server.gateway.ingest(node, events)
+        except (TimeoutError, sqlite3.Error) as e:
+            self._reply(503, {"error": str(e)})
+            return
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        self._reply(200, {"ack": ack})
+    
+    def do_GET(self):
+        server: "FleetGatewayServer" = self.server.gateway_server
+        if self.path != "/v1/nodes":
+            self._reply(404, {"error": "not found"})
+            return
+        self._reply(200, {"nodes": server.gateway.nodes()})
+    
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # 靜音：上傳頻繁，不輸出存取紀錄
+        pass
+
+
+class FleetGatewayServer:
+    """車隊閘道 HTTP 伺服器（背景執行緒，每個連線一條執行緒）"""
+    
+    def __init__(self, gateway: FleetGateway, host: str = "0.0.0.0", port: int = 8780,
+                 token: Optional[str] = None):
+        """
+        Args:
+            gateway: 事件匯集
+            host: 監聽位址
+            port: 監聽埠號（0 表示自動分配）
+            token: 節點上傳時須附上的共用權杖（選用）
+        """
+        self.gateway = gateway
+        self.token = token
+        self._server = ThreadingHTTPServer((host, port), _GatewayHandler)
+        self._server.daemon_threads = True
+        self._server.gateway_server = self
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/frames"
+    
+    def start(self) -> "FleetGatewayServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fleet-http", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def run_gateway():
+    """以 .env 設定啟動車隊閘道（Ctrl+C 或 SIGTERM 結束）"""
+    import signal
+    from config import Config
+    from services.line_messaging import LineMessagingService
+    from utils.log import setup_logging
+    
+    setup_logging()
+    line_service = None
+    if Config.LINE_CHANNEL_ACCESS_TOKEN:
+        line_service = LineMessagingService(
+            channel_access_token=Config.LINE_CHANNEL_ACCESS_TOKEN,
+            user_id=Config.LINE_USER_ID,
+            rate_per_hour=Config.LINE_ALERT_RATE_PER_HOUR,
+            burst=Config.LINE_ALERT_BURST,
+            coalesce_window=Config.LINE_COALESCE_WINDOW,
+            monthly_quota=Config.LINE_MONTHLY_QUOTA,
+            quota_reserve=Config.LINE_QUOTA_RESERVE,
+            state_path=Config.FLEET_DB_PATH
+        )
+        if Config.LINE_SPOOL_ENABLED:
+            line_service.enable_spool(Config.FLEET_DB_PATH, deadline=Config.LINE_MESSAGE_DEADLINE,
+                                      retry_base=Config.LINE_RETRY_BASE, retry_max=Config.LINE_RETRY_MAX)
+    else:
+        logger.warning("⚠️ 未設定 LINE_CHANNEL_ACCESS_TOKEN，閘道只匯集事件、不發送通知")
+    
+    gateway = FleetGateway(Config.FLEET_DB_PATH, line_service).start()
+    server = FleetGatewayServer(gateway, Config.FLEET_GATEWAY_HOST, Config.FLEET_GATEWAY_PORT,
+                                token=Config.FLEET_TOKEN or None).start()
+    logger.info(f"🛰️ 車隊閘道已啟動: {server.url}")
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stopped.set())
+    try:
+        stopped.wait()
+    finally:
+        server.stop()
+        gateway.stop()
+        if line_service is not None:
+            line_service.close()
+        logger.info(f"🛰️ 車隊閘道已停止 {gateway.stats}")
+
+
+if __name__ == "__main__":
+    run_gateway()
@@ -0,0 +1,243 @@
+"""
+車隊閘道上傳模組（節點端）
+將本機的狀態事件與 LINE 通知請求寫入 SQLite 待送區，由背景執行緒批次上傳到車隊閘道；
+待送區的自動遞增 id 即為序號（跨重新啟動遞增），閘道依節點與序號去除重複。
+"""
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class FleetUploader:
+    """
+    批次上傳事件框架到車隊閘道
+    
+    框架格式（JSON）:
+        {"node": 節點名稱, "events": [[序號, 時間戳, 種類, 馬桶蓋, 次數, 日期, 收件者], ...]}
+    種類為狀態事件（lid_opened、lid_closed、alert、rollover、startup）或
+    通知請求（notify_alert、notify_end_of_day、notify_summary）。閘道提交後回應
+    {"ack": 已提交的最大序號}，節點才自待送區刪除。
+    """
+    
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fleet_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            kind TEXT NOT NULL,
+            lid TEXT,
+            count INTEGER,
+            day TEXT,
+            recipient TEXT
+        )
+    """
+    
+    def __init__(self, url: str, node_id: str, db_path: str, token: Optional[str] = None,
+                 batch_size: int = 200, flush_interval: float = 1.0, timeout: float = 5.0,
+                 retry_base: float = 1.0, retry_max: float = 60.0):
+        """
+        Args:
+            url: 閘道的框架上傳網址（例如 http://gateway:8780/v1/frames）
+            node_id: 節點名稱（車隊內唯一）
+            db_path: 待送區使用的 SQLite 資料庫路徑
+            token: 閘道的共用權杖（選用）
+            batch_size: 每個框架最多的事件數量
+            flush_interval: 上傳間隔（秒）；通知請求會立即上傳
+            timeout: 單次上傳逾時（秒）
+            retry_base: 第一次重試的基準等待時間（秒）
+            retry_max: 重試等待時間上限（秒）
+        """
+        self.url = url
+        self.node_id = node_id
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        
+        self.stats: Dict[str, int] = {"queued": 0, "uploaded": 0, "frames": 0, "retried": 0}
+        
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> "FleetUploader":
+        """啟動背景上傳執行緒（重新啟動時會接續上傳待送區中的事件）"""
+        self._thread = threading.Thread(target=self._run, name="smartlid-fleet", daemon=True)
+        self._thread.start()
+        return self
+    
+    def publish(self, event: str, state: Dict[str, Any]):
+        """狀態事件（LidController 的狀態監聽者，不阻塞）"""
+        self._pending.append((time.time(), event, state["lid"], state["daily_alert_count"], state["day"], None))
+        self.stats["queued"] += 1
+    
+    def notify(self, kind: str, recipient: Optional[str], count: int, day: str):
+        """通知請求（由閘道統一發送 LINE），立即喚醒上傳執行緒"""
+        self._pending.append((time.time(), f"notify_{kind}", None, count, day, recipient))
+        self.stats["queued"] += 1
+        self._wakeup.set()
+    
+    def stop(self, timeout: float = 5.0):
+        """停止上傳，尚未上傳的事件保留在待送區"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.session.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """內部函式：建立資料庫連線並確保資料表存在"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(self._SCHEMA)
+        if conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'fleet_outbox'").fetchone() is None:
+            # 新建的待送區：序號自目前時間（毫秒 × 1000）起算，資料庫重建後仍大於閘道已收過的序號
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('fleet_outbox', ?)",
+                         (int(time.time() * 1000) * 1000,))
+        conn.commit()
+        return conn
+    
+    def _flush_pending(self, conn: sqlite3.Connection):
+        """內部函式：將記憶體中的新事件以單一交易寫入待送區（此時才分配序號）"""
+        rows = []
+        while self._pending:
+            rows.append(self._pending.popleft())
+        if rows:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO fleet_outbox (ts, kind, lid, count, day, recipient) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+    
+    def _run(self):
+        """背景執行緒主迴圈"""
+        conn = self._connect()
+        attempts = 0
+        try:
+            while not self._stopping:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self._flush_pending(conn)
+                while not self._stopping:
+                    rows = conn.execute(
+                        "SELECT id, ts, kind, lid, count, day, recipient FROM fleet_outbox ORDER BY id LIMIT ?",
+                        (self.batch_size,)
+                    ).fetchall()
+                    if not rows:
+                        attempts = 0
+                        break
+                    if self._upload(conn, rows):
+                        attempts = 0
+                        continue
+                    attempts += 1
+                    delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+                    delay = delay / 2 + random.uniform(0, delay / 2)
+                    logger.warning(f"🔁 車隊閘道上傳失敗，{delay:.1f} 秒後重試（第 {attempts} 次）")
+                    self.stats["retried"] += 1
+                    self._wakeup.wait(delay)
+                    self._flush_pending(conn)
+            
+            # 結束前保存尚未落盤的事件
+            self._flush_pending(conn)
+        finally:
+            conn.close()
+    
+    def _upload(self, conn: sqlite3.Connection, rows: List[tuple]) -> bool:
+        """內部函式：上傳一個框架，閘道確認後自待送區刪除"""
+        events = [[row_id, round(ts, 3), kind, lid, count, day, recipient]
+                  for row_id, ts, kind, lid, count, day, recipient in rows]
+        body = json.dumps({"node": self.node_id, "events": events}, ensure_ascii=False, separators=(",", ":"))
+        try:
+            response = self.session.post(self.url, data=body.encode("utf-8"), timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.debug(f"車隊閘道連線失敗: {e}")
+            return False
+        if response.status_code != 200:
+            logger.debug(f"車隊閘道回應 HTTP {response.status_code}")
+            return False
+        
+        try:
+            ack = response.json()["ack"]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.debug(f"車隊閘道回應格式錯誤: {e}")
+            return False
+        if not isinstance(ack, int) or isinstance(ack, bool):
+            logger.debug(f"車隊閘道確認序號無效: {ack!r}")
+            return False
+        
+        with conn:
+            conn.execute("DELETE FROM fleet_outbox WHERE id <= ?", (ack,))
+        self.stats["uploaded"] += len(rows)
+        self.stats["frames"] += 1
+        return True
+
+
+class FleetLineService:
+    """
+    由車隊閘道統一發送 LINE 通知（介面同 LineMessagingService 中控制器使用的部分）
+    
+    通知請求經上傳框架送到閘道，由閘道共用的 LineMessagingService 套用限流、合併與每月額度。
+    """
+    
+    def __init__(self, uploader: FleetUploader):
+        """
+        Args:
+            uploader: 節點的上傳器
+        """
+        self.uploader = uploader
+        self.push_stats: Dict[str, int] = {"alerts": 0, "summaries": 0}
+        logger.info("LINE: 通知改由車隊閘道發送")
+    
+    def send_alert(self, alert_count: int, today_date: Optional[str] = None, to: Optional[str] = None) -> bool:
+        self.uploader.notify("alert", to, alert_count, today_date or time.strftime("%Y-%m-%d"))
+        self.push_stats["alerts"] += 1
+        return True
+    
+    def end_of_day(self, day: str, total_count: int, to: Optional[str] = None) -> bool:
+        # 沒有延後提醒時是否另發每日摘要由閘道依 end_of_day 的結果決定，因此一律視為已處理
+        kind = "summary" if Config.current().DAILY_SUMMARY_ENABLED else "end_of_day"
+        self.uploader.notify(kind, to, total_count, day)
+        self.push_stats["summaries"] += 1
+        return True
+    
+    def send_daily_summary(self, date: str, total_count: int, to: Optional[str] = None) -> bool:
+        self.uploader.notify("summary", to, total_count, date)
+        self.push_stats["summaries"] += 1
+        return True
+    
+    def enable_spool(self, *args, **kwargs):
+        # 待送區本身即為持久化佇列
+        pass
+    
+    def use_async_transport(self, loop):
+        pass
+    
+    def get_push_stats(self) -> Dict[str, int]:
+        return dict(self.push_stats, **self.uploader.stats)
+    
+    def close(self):
+        pass
+    
+    async def close_async(self):
+        pass
@@ -1,22 +1,410 @@
 """
 LINE Messaging API 服務模組
-使用 LINE Messaging API 發送推播訊息（Push Message）
+使用 LINE Messaging API 發送推播訊息（Push Message）；多位收件者時改用 Multicast 分批發送
 """
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MessageTemplate:
+    """
+    預先序列化的訊息樣板
+    
+    樣板內容只在建立時序列化一次，之後每次發送只需替換 {欄位} 佔位符，
+    不必重新建立與序列化整個訊息物件。
+    """
+    
+    _FIELD_PATTERN = re.compile(r"\{(\w+)\}")
+    
+    def __init__(self, message: dict):
+        """
+        Args:
+            message: LINE 訊息物件，字串值中可使用 {欄位} 佔位符
+        """
+        serialized = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        # 切分後偶數索引為固定片段，奇數索引為欄位名稱
+        self._parts = self._FIELD_PATTERN.split(serialized)
+    
+    def render(self, **fields) -> str:
+        """
+        填入動態欄位並返回 JSON 字串
+        
+        Returns:
+            str: 序列化後的訊息物件
+        """
+        parts = self._parts[:]
+        for i in range(1, len(parts), 2):
+            # 以 JSON 規則跳脫欄位內容（去除外層引號）
+            parts[i] = json.dumps(str(fields[parts[i]]), ensure_ascii=False)[1:-1]
+        return "".join(parts)
+
+
+# 文字訊息樣板
+TEXT_TEMPLATE = MessageTemplate({"type": "text", "text": "{text}"})
+
+# 提醒訊息樣板
+ALERT_TEMPLATE = MessageTemplate({
+    "type": "text",
+    "text": """⚠️ SmartLid 馬桶蓋提醒 ⚠️
+
+📅 日期: {today_date}
+🔔 今日累計未落蓋次數: {alert_count} 次
+
+請記得隨手將馬桶蓋放下喔！🚽
+養成良好衛生習慣 💪"""
+})
+
+# 每日摘要樣板
+DAILY_SUMMARY_TEMPLATE = MessageTemplate({
+    "type": "text",
+    "text": """📊 SmartLid 每日報告
+
+📅 日期: {date}
+📈 今日未落蓋次數: {total_count} 次
+
+{emoji} {comment}"""
+})
+
+# 合併提醒摘要樣板
+DIGEST_TEMPLATE = MessageTemplate({
+    "type": "text",
+    "text": """🚽 SmartLid 提醒摘要
+
+自 {since} 起又有 {count} 次未落蓋提醒
+📅 日期: {today_date}
+🔔 今日累計未落蓋次數: {alert_count} 次"""
+})
+
+# 提醒 Flex Message 樣板
+ALERT_FLEX_TEMPLATE = MessageTemplate({
+    "type": "flex",
+    "altText": "SmartLid 馬桶蓋提醒",
+    "contents": {
+        "type": "bubble",
+        "hero": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "⚠️ SmartLid 提醒",
+                    "weight": "bold",
+                    "size": "xl",
+                    "color": "#FF6B6B"
+                }
+            ],
+            "backgroundColor": "#FFF3E0",
+            "paddingAll": "20px"
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "box",
+                    "layout": "baseline",
+                    "contents": [
+                        {
+                            "type": "text",
+                            "text": "📅",
+                            "size": "sm",
+                            "flex": 0
+                        },
+                        {
+                            "type": "text",
+                            "text": "日期: {today_date}",
+                            "size": "sm",
+                            "color": "#666666",
+                            "margin": "md"
+                        }
+                    ]
+                },
+                {
+                    "type": "box",
+                    "layout": "baseline",
+                    "contents": [
+                        {
+                            "type": "text",
+                            "text": "🔔",
+                            "size": "sm",
+                            "flex": 0
+                        },
+                        {
+                            "type": "text",
+                            "text": "今日累計: {alert_count} 次",
+                            "size": "md",
+                            "color": "#FF6B6B",
+                            "weight": "bold",
+                            "margin": "md"
+                        }
+                    ],
+                    "margin": "lg"
+                },
+                {
+                    "type": "separator",
+                    "margin": "lg"
+                },
+                {
+                    "type": "text",
+                    "text": "請記得隨手將馬桶蓋放下喔！🚽",
+                    "size": "sm",
+                    "color": "#666666",
+                    "wrap": True,
+                    "margin": "lg"
+                },
+                {
+                    "type": "text",
+                    "text": "養成良好衛生習慣 💪",
+                    "size": "sm",
+                    "color": "#4CAF50",
+                    "wrap": True,
+                    "margin": "md"
+                }
+            ]
+        }
+    }
+})
+
+
+class TokenBucket:
+    """權杖桶限流器"""
+    
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate: 每秒補充的權杖數
+            capacity: 權杖桶容量（可連續發送的上限）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def try_acquire(self) -> bool:
+        """嘗試取得一個權杖，成功返回 True"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def time_until_available(self) -> float:
+        """距離下一個權杖可用的秒數"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class PushBudget:
+    """
+    每月推播額度追蹤
+    
+    指定 db_path 時，本月已使用則數與各收件者延後到每日摘要的提醒數保存在 SQLite
+    （與推播佇列同一個資料庫），重新啟動後接續計算，不會因重啟而恢復成整月額度。
+    """
+    
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS line_budget (
+            month TEXT PRIMARY KEY,
+            used INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS line_deferred (
+            recipient TEXT PRIMARY KEY,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL
+        );
+    """
+    
+    def __init__(self, monthly_quota: int, reserve_ratio: float, used: int = 0,
+                 db_path: Optional[str] = None):
+        """
+        Args:
+            monthly_quota: 每月可用推播則數（0 表示不限制）
+            reserve_ratio: 剩餘額度低於此比例時改為每日摘要
+            used: 本月已使用則數（有 db_path 時改為讀取保存的值）
+            db_path: 保存額度的 SQLite 資料庫路徑（選用）
+        """
+        self.monthly_quota = monthly_quota
+        self.reserve_ratio = reserve_ratio
+        self.used = used
+        self.month = date.today().strftime("%Y-%m")
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.executescript(self._SCHEMA)
+            row = self._conn.execute("SELECT used FROM line_budget WHERE month = ?", (self.month,)).fetchone()
+            self.used = row[0] if row else 0
+    
+    def _roll_month(self):
+        """內部函式：換月時歸零（呼叫者須持有 _lock）"""
+        current = date.today().strftime("%Y-%m")
+        if current != self.month:
+            self.month = current
+            self.used = 0
+    
+    def consume(self, count: int = 1):
+        """記錄已使用的推播則數"""
+        with self._lock:
+            self._roll_month()
+            self.used += count
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO line_budget (month, used) VALUES (?, ?) "
+                        "ON CONFLICT(month) DO UPDATE SET used = excluded.used",
+                        (self.month, self.used)
+                    )
+    
+    @property
+    def remaining(self) -> Optional[int]:
+        """本月剩餘則數（不限制時為 None）"""
+        with self._lock:
+            self._roll_month()
+            if self.monthly_quota <= 0:
+                return None
+            return max(0, self.monthly_quota - self.used)
+    
+    def is_low(self) -> bool:
+        """剩餘額度是否已低於保留比例"""
+        remaining = self.remaining
+        return remaining is not None and remaining <= self.monthly_quota * self.reserve_ratio
+    
+    def is_exhausted(self) -> bool:
+        """本月額度是否已用完"""
+        return self.remaining == 0
+    
+    def load_deferred(self) -> Dict[str, Tuple[str, int]]:
+        """保存的延後提醒數：收件者 → (日期, 則數)"""
+        if self._conn is None:
+            return {}
+        with self._lock:
+            rows = self._conn.execute("SELECT recipient, day, count FROM line_deferred").fetchall()
+        return {recipient: (day, count) for recipient, day, count in rows}
+    
+    def save_deferred(self, recipient: str, day: str, count: int):
+        """保存收件者延後到每日摘要的提醒數（0 表示已回報）"""
+        if self._conn is None:
+            return
+        with self._lock, self._conn:
+            if count:
+                self._conn.execute(
+                    "INSERT INTO line_deferred (recipient, day, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(recipient) DO UPDATE SET day = excluded.day, count = excluded.count",
+                    (recipient, day, count)
+                )
+            else:
+                self._conn.execute("DELETE FROM line_deferred WHERE recipient = ?", (recipient,))
+    
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+
+def parse_recipients(to: Union[str, Sequence[str]]) -> Tuple[str, ...]:
+    """
+    解析收件者清單
+    
+    Args:
+        to: 單一 ID、以逗號或 + 分隔的多個 ID，或 ID 序列
+    
+    Returns:
+        Tuple[str, ...]: 去除空白與重複後的收件者（保留原順序）
+    """
+    if isinstance(to, str):
+        to = re.split(r"[,+]", to)
+    return tuple(dict.fromkeys(recipient.strip() for recipient in to if recipient.strip()))
+
+
+class DeliveryReport:
+    """一次發送的逐一收件者結果"""
+    
+    def __init__(self, recipients: Tuple[str, ...]):
+        self.recipients = recipients
+        self.delivered: List[str] = []
+        self.queued: List[str] = []         # 已排入佇列或非同步送出，結果未知
+        self.failed: Dict[str, str] = {}    # 收件者 → 失敗原因
+        self.requests = 0                   # 實際發出的 HTTP 請求數
+    
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+class AlertWindow:
+    """單一收件者（或收件者清單）的提醒合併視窗狀態"""
+    
+    def __init__(self):
+        self.ends_at = 0.0
+        self.coalesced: List[datetime] = []
+        self.last_alert = (0, "")
+        self.digest_timer: Optional[threading.Timer] = None
+        self.deferred_today = 0
 
 
 class LineMessagingService:
-    """LINE Messaging API 服務"""
+    """
+    LINE Messaging API 服務
     
-    def __init__(self, channel_access_token: str, user_id: str):
+    收件者可為以逗號或 + 分隔的清單：使用者 ID 以 Multicast 每 500 位一個請求，
+    群組（C…）與聊天室（R…）ID 不支援 Multicast，各自以 Push 發送；多個請求並行送出。
+    """
+    
+    API_URL = "https://api.line.me/v2/bot/message/push"
+    # Multicast 單一請求的收件者上限
+    MULTICAST_LIMIT = 500
+    
+    def __init__(self, channel_access_token: str, user_id: str,
+                 api_url: Optional[str] = None, multicast_url: Optional[str] = None, timeout: float = 10,
+                 max_retries: int = 2, pool_size: int = 4,
+                 rate_per_hour: float = 6, burst: int = 2, coalesce_window: float = 300,
+                 monthly_quota: int = 200, quota_reserve: float = 0.2, state_path: Optional[str] = None):
         """
         初始化 LINE Messaging API 服務
         
         Args:
             channel_access_token: LINE Channel Access Token
-            user_id: 接收訊息的 LINE User ID
-            
+            user_id: 接收訊息的 LINE User ID（多位收件者以逗號分隔）
+            api_url: Push API 網址（預設為 LINE 官方網址，測試時可指向模擬伺服器）
+            multicast_url: Multicast API 網址（預設與 api_url 同一路徑下的 multicast）
+            timeout: 單次請求逾時（秒）
+            max_retries: 連線錯誤或 5xx 時的重試次數
+            pool_size: 連線池大小
+            rate_per_hour: 提醒推播每小時平均上限
+            burst: 提醒推播可連續發送的則數
+            coalesce_window: 合併視窗（秒），視窗內的後續提醒合併為一則摘要
+            monthly_quota: 每月推播額度（0 表示不限制）
+            quota_reserve: 剩餘額度低於此比例時，提醒改為每日摘要
+            state_path: 保存每月額度與延後提醒數的 SQLite 資料庫路徑（選用，未指定時只保存在記憶體）
+        
         如何取得 Token 和 User ID:
         1. 前往 LINE Developers Console: https://developers.line.biz/
         2. 建立 Provider 和 Messaging API Channel
@@ -27,168 +415,535 @@ class LineMessagingService:
         """
         self.channel_access_token = channel_access_token.strip()
         self.user_id = user_id.strip()
-        self.api_url = "https://api.line.me/v2/bot/message/push"
-        print("LINE: Messaging API 服務已初始化 (LIVE 模式)")
+        self.api_url = api_url or self.API_URL
+        self.multicast_url = multicast_url or self.api_url.rsplit("/", 1)[0] + "/multicast"
+        self.reply_url = self.api_url.rsplit("/", 1)[0] + "/reply"
+        self.timeout = timeout
+        self.pool_size = pool_size
+        
+        # 預先序列化的推播外框（依收件者快取），每次只需接上訊息物件
+        self._push_prefixes: Dict[str, bytes] = {}
+        self._push_suffix = b"]}"
+        
+        self.session = self._create_session(max_retries, pool_size)
+        self.spool = None
+        # 多個 Multicast / Push 請求並行送出用的執行緒池（第一次需要時建立）
+        self._fanout_pool: Optional[ThreadPoolExecutor] = None
+        self.last_delivery: Optional[DeliveryReport] = None
+        
+        # asyncio 模式的非同步 HTTP 傳輸（見 use_async_transport）
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_session = None
+        
+        # 提醒推播限流、合併與每月額度
+        self.alert_bucket = TokenBucket(rate_per_hour / 3600, burst)
+        self.budget = PushBudget(monthly_quota, quota_reserve, db_path=state_path)
+        self.coalesce_window = coalesce_window
+        self._alert_lock = threading.Lock()
+        self._report_lock = threading.Lock()
+        self._windows: Dict[str, AlertWindow] = {}
+        self.push_stats: Dict[str, int] = {
+            "alerts": 0,       # 收到的提醒次數
+            "pushed": 0,       # 立即推播的提醒
+            "coalesced": 0,    # 併入摘要的提醒
+            "digests": 0,      # 發出的合併摘要
+            "deferred": 0,     # 額度不足而改由每日摘要回報的提醒
+        }
+        # 重新啟動前已延後、尚未在每日摘要回報的提醒
+        for recipient, (day, count) in self.budget.load_deferred().items():
+            window = self._windows.setdefault(recipient, AlertWindow())
+            window.deferred_today = count
+            window.last_alert = (0, day)
+        logger.info("LINE: Messaging API 服務已初始化 (LIVE 模式)")
     
-    def send_alert(self, alert_count: int) -> bool:
+    def enable_spool(self, db_path: str, deadline: float = 86400,
+                     retry_base: float = 1.0, retry_max: float = 300.0):
         """
-        發送提醒訊息到 LINE
+        啟用持久化推播佇列：之後的推播只排入佇列，由背景執行緒投遞
         
         Args:
-            alert_count: 當日提醒次數
-            
+            db_path: SQLite 資料庫路徑
+            deadline: 每則訊息的投遞期限（秒）
+            retry_base: 第一次重試的基準等待時間（秒）
+            retry_max: 重試等待時間上限（秒）
+        """
+        from services.notification_spool import NotificationSpool
+        
+        self.spool = NotificationSpool(
+            db_path,
+            sender=self._send,
+            deadline=deadline,
+            retry_base=retry_base,
+            retry_max=retry_max
+        ).start()
+        logger.info(f"LINE: 已啟用持久化推播佇列 ({db_path})")
+    
+    def use_async_transport(self, loop: asyncio.AbstractEventLoop):
+        """
+        asyncio 模式：未啟用佇列時，推播改由事件迴圈上的 aiohttp 非同步送出
+        
+        未安裝 aiohttp 時，改為在事件迴圈的執行緒池中以 requests 送出。
+        
+        Args:
+            loop: 執行非同步請求的事件迴圈
+        """
+        self._loop = loop
+    
+    async def _send_async(self, body: bytes, retry_key: str, description: str) -> Optional[int]:
+        """
+        內部函式：以 aiohttp 非同步發送推播請求並記錄往返時間
+        
         Returns:
-            bool: 發送成功返回 True，失敗返回 False
+            Optional[int]: HTTP 狀態碼，網路錯誤時返回 None
         """
         try:
-            message = f"🚽 SmartLid 提醒\n\n今天已經是第 {alert_count} 次忘記放下馬桶蓋了！\n請養成良好習慣喔 😊"
-            
-            headers = {
-                "Authorization": f"Bearer {self.channel_access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "to": self.user_id,
-                "messages": [
-                    {
-                        "type": "text",
-                        "text": message
-                    }
-                ]
-            }
-            
-            print(f"📤 正在發送 LINE 通知（第 {alert_count} 次提醒）...")
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=10)
+            import aiohttp
+        except ImportError:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._send, body, retry_key, description
+            )
+        
+        started = time.perf_counter()
+        status = await self._post_async(aiohttp, body, retry_key, description)
+        self._observe_push(status, time.perf_counter() - started)
+        return status
+    
+    async def _post_async(self, aiohttp, body: bytes, retry_key: str, description: str) -> Optional[int]:
+        """內部函式：aiohttp 請求本體"""
+        if self._async_session is None:
+            self._async_session = aiohttp.ClientSession(
+                headers=dict(self.session.headers),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        
+        try:
+            async with self._async_session.post(
+                self._url_for(body), data=body, headers={"X-Line-Retry-Key": retry_key}
+            ) as response:
+                if response.status == 200:
+                    logger.info(f"✅ {description}發送成功！")
+                elif response.status == 409:
+                    logger.info(f"✅ {description}先前已送達")
+                    return 200
+                else:
+                    logger.error(f"❌ {description}發送失敗: HTTP {response.status}")
+                    logger.error(f"   錯誤訊息: {await response.text()}")
+                return response.status
+        
+        except asyncio.TimeoutError:
+            logger.error("❌ LINE API 請求超時")
+            return None
+        except aiohttp.ClientError as e:
+            logger.error(f"❌ LINE API 請求失敗: {e}")
+            return None
+    
+    async def close_async(self):
+        """關閉非同步 HTTP 連線（須在事件迴圈中呼叫）"""
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+    
+    def _create_session(self, max_retries: int, pool_size: int) -> requests.Session:
+        """建立具備 keep-alive 連線池、重試策略與預設認證標頭的 Session"""
+        session = requests.Session()
+        session.headers.update({
+            "Authorization": f"Bearer {self.channel_access_token}",
+            "Content-Type": "application/json"
+        })
+        
+        # 推播為 POST，搭配 X-Line-Retry-Key 才能安全重試而不重複發送
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    
+    def _build_push_body(self, messages: List[str], to: Optional[str] = None) -> bytes:
+        """以預先序列化的外框組合推播請求內容"""
+        to = to or self.user_id
+        prefix = self._push_prefixes.get(to)
+        if prefix is None:
+            prefix = f'{{"to":{json.dumps(to)},"messages":['.encode()
+            self._push_prefixes[to] = prefix
+        return prefix + ",".join(messages).encode("utf-8") + self._push_suffix
+    
+    def _push(self, messages: List[str], description: str, to: Optional[str] = None) -> bool:
+        """
+        內部函式：送出推播請求（啟用佇列時僅排入佇列）
+        
+        Args:
+            messages: 已序列化的訊息物件清單
+            description: 訊息描述（用於輸出）
+            to: 收件者 ID 或清單（預設為初始化時的 user_id）
+        
+        Returns:
+            bool: 發送成功（或已排入佇列/已非同步送出）返回 True，失敗返回 False；
+            多位收件者時任何一位失敗即返回 False，逐一結果見 last_delivery
+        """
+        recipients = parse_recipients(to or self.user_id)
+        if len(recipients) > 1:
+            return self.multicast(messages, description, recipients).ok
+        
+        body = self._build_push_body(messages, recipients[0] if recipients else None)
+        self.budget.consume()
+        if self.spool is not None:
+            self.spool.enqueue(body, description)
+            return True
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(
+                self._send_async(body, str(uuid.uuid4()), description), self._loop
+            )
+            return True
+        return self._send(body, str(uuid.uuid4()), description) == 200
+    
+    def multicast(self, messages: List[str], description: str,
+                  recipients: Union[str, Sequence[str]]) -> DeliveryReport:
+        """
+        發送給多位收件者：使用者每 500 位一個 Multicast 請求，群組與聊天室各一個 Push 請求，並行送出
+        
+        Multicast 因部分收件者 ID 無效而被拒絕（HTTP 400）時，排除回應中指出的收件者後重送一次。
+        啟用佇列或非同步傳輸時只排入佇列，收件者列在 queued。
+        
+        Args:
+            messages: 已序列化的訊息物件清單
+            description: 訊息描述（用於輸出）
+            recipients: 收件者清單
+        
+        Returns:
+            DeliveryReport: 逐一收件者的結果（同時保存在 last_delivery）
+        """
+        recipients = parse_recipients(recipients)
+        report = DeliveryReport(recipients)
+        users = [recipient for recipient in recipients if not recipient.startswith(("C", "R"))]
+        targets = [users[i:i + self.MULTICAST_LIMIT] for i in range(0, len(users), self.MULTICAST_LIMIT)]
+        targets += [[recipient] for recipient in recipients if recipient.startswith(("C", "R"))]
+        # 每月額度依收件者人數計算
+        self.budget.consume(len(recipients))
+        
+        if self.spool is not None or self._loop is not None:
+            for target in targets:
+                body = self._build_target_body(messages, target)
+                label = f"{description}（{len(target)} 位收件者）"
+                if self.spool is not None:
+                    self.spool.enqueue(body, label)
+                else:
+                    asyncio.run_coroutine_threadsafe(self._send_async(body, str(uuid.uuid4()), label), self._loop)
+            report.queued.extend(recipients)
+        elif len(targets) == 1:
+            self._deliver(messages, description, targets[0], report)
+        elif targets:
+            if self._fanout_pool is None:
+                self._fanout_pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="line-fanout")
+            list(self._fanout_pool.map(lambda target: self._deliver(messages, description, target, report), targets))
+        
+        metrics.LINE_RECIPIENTS.labels("delivered").inc(len(report.delivered))
+        metrics.LINE_RECIPIENTS.labels("failed").inc(len(report.failed))
+        for recipient, reason in list(report.failed.items())[:10]:
+            logger.warning(f"⚠️ {description}未送達 {recipient}: {reason}")
+        if len(report.failed) > 10:
+            logger.warning(f"⚠️ {description}另有 {len(report.failed) - 10} 位收件者未送達")
+        self.last_delivery = report
+        return report
+    
+    def _build_target_body(self, messages: List[str], target: List[str]) -> bytes:
+        """內部函式：單一收件者用 Push 外框，多位使用者用 Multicast 外框（to 為陣列）"""
+        if len(target) == 1:
+            return self._build_push_body(messages, target[0])
+        return (f'{{"to":{json.dumps(target)},"messages":['.encode() +
+                ",".join(messages).encode("utf-8") + self._push_suffix)
+    
+    def _deliver(self, messages: List[str], description: str, target: List[str], report: DeliveryReport):
+        """內部函式：送出一個 Multicast / Push 請求並記錄逐一收件者的結果（可在多個執行緒中同時呼叫）"""
+        errors: List[Tuple[int, str]] = []
+        status = self._send(self._build_target_body(messages, target), str(uuid.uuid4()), description, errors)
+        requests_made = 1
+        if status == 400 and errors and len(target) > 1:
+            # 回應指出無效的收件者（to[i]）：排除後重送其餘收件者
+            rejected = {target[index]: message for index, message in errors if 0 <= index < len(target)}
+            remaining = [recipient for recipient in target if recipient not in rejected]
+            with self._report_lock:
+                report.failed.update(rejected)
+            target = remaining
+            if remaining:
+                status = self._send(self._build_target_body(messages, remaining), str(uuid.uuid4()), description)
+                requests_made += 1
+        
+        with self._report_lock:
+            report.requests += requests_made
+            if not target:
+                return
+            if status == 200:
+                report.delivered.extend(target)
+            else:
+                reason = f"HTTP {status}" if status is not None else "連線失敗"
+                report.failed.update((recipient, reason) for recipient in target)
+    
+    def _url_for(self, body: bytes) -> str:
+        """內部函式：Multicast 的 to 為陣列，其餘為 Push（佇列重送時只保存請求內容）"""
+        return self.multicast_url if body.startswith(b'{"to":[') else self.api_url
+    
+    def _send(self, body: bytes, retry_key: str, description: str,
+              errors: Optional[List[Tuple[int, str]]] = None) -> Optional[int]:
+        """
+        內部函式：實際發送推播請求並記錄往返時間
+        
+        Args:
+            body: 完整的請求內容
+            retry_key: X-Line-Retry-Key，重送同一則訊息時必須相同
+            description: 訊息描述（用於輸出）
+            errors: 傳入時，HTTP 400 回應中指出的無效收件者 (to 索引, 原因) 會加入此清單
+        
+        Returns:
+            Optional[int]: HTTP 狀態碼，網路錯誤時返回 None
+        """
+        started = time.perf_counter()
+        status = self._post(body, retry_key, description, errors)
+        self._observe_push(status, time.perf_counter() - started)
+        return status
+    
+    @staticmethod
+    def _observe_push(status: Optional[int], elapsed: float):
+        """內部函式：更新推播結果計數與往返時間"""
+        metrics.LINE_PUSHES.labels("success" if status == 200 else "failure").inc()
+        metrics.LINE_ROUND_TRIP.observe(elapsed)
+    
+    def _post(self, body: bytes, retry_key: str, description: str,
+              errors: Optional[List[Tuple[int, str]]] = None) -> Optional[int]:
+        """內部函式：requests 請求本體"""
+        try:
+            response = self.session.post(
+                self._url_for(body),
+                data=body,
+                headers={"X-Line-Retry-Key": retry_key},
+                timeout=self.timeout
+            )
             
             if response.status_code == 200:
-                print("✅ LINE 通知發送成功！")
-                return True
+                logger.info(f"✅ {description}發送成功！")
+            elif response.status_code == 409:
+                # 相同 retry key 已被接受過：先前的請求其實已送達
+                logger.info(f"✅ {description}先前已送達")
+                return 200
             else:
-                print(f"❌ LINE 通知發送失敗: HTTP {response.status_code}")
-                print(f"   錯誤訊息: {response.text}")
-                return False
-                
+                logger.error(f"❌ {description}發送失敗: HTTP {response.status_code}")
+                logger.error(f"   錯誤訊息: {response.text}")
+                if response.status_code == 400 and errors is not None:
+                    errors.extend(self._invalid_recipients(response))
+            return response.status_code
+        
         except requests.exceptions.Timeout:
-            print("❌ LINE API 請求超時")
-            return False
+            logger.error("❌ LINE API 請求超時")
+            return None
         except requests.exceptions.RequestException as e:
-            print(f"❌ LINE API 請求失敗: {e}")
-            return False
+            logger.error(f"❌ LINE API 請求失敗: {e}")
+            return None
         except Exception as e:
-            print(f"❌ 發送 LINE 通知時發生錯誤: {e}")
-            return False
+            logger.error(f"❌ 發送{description}時發生錯誤: {e}")
+            return None
+    
+    @staticmethod
+    def _invalid_recipients(response: requests.Response) -> List[Tuple[int, str]]:
+        """內部函式：自 400 回應的 details 取出無效收件者的索引（property 為 to[i]）"""
+        try:
+            details = response.json().get("details", [])
+        except ValueError:
+            return []
+        invalid = []
+        for detail in details:
+            match = re.fullmatch(r"to\[(\d+)\]", detail.get("property", ""))
+            if match:
+                invalid.append((int(match.group(1)), detail.get("message", "無效的收件者")))
+        return invalid
     
-    def send_message(self, message: str) -> bool:
+    def send_message(self, message: str, to: Optional[str] = None) -> bool:
         """
         發送文字訊息到 LINE
         
         Args:
             message: 要發送的訊息內容
-            
+            to: 收件者 ID（選用）
+        
         Returns:
             bool: 發送成功返回 True，失敗返回 False
         """
+        return self._push([TEXT_TEMPLATE.render(text=message)], "LINE 訊息", to)
+    
+    def reply(self, reply_token: str, messages: List[str]) -> bool:
+        """
+        以 Reply API 回覆使用者傳來的訊息（免費，不計入每月推播額度）
+        
+        reply token 只能使用一次且僅短時間有效，因此不排入佇列也不重送。
+        
+        Args:
+            reply_token: Webhook 事件中的 replyToken
+            messages: 已序列化的訊息物件清單（最多 5 則）
+        
+        Returns:
+            bool: 回覆成功返回 True
+        """
+        body = (f'{{"replyToken":{json.dumps(reply_token)},"messages":['.encode() +
+                ",".join(messages).encode("utf-8") + self._push_suffix)
         try:
-            headers = {
-                "Authorization": f"Bearer {self.channel_access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "to": self.user_id,
-                "messages": [
-                    {
-                        "type": "text",
-                        "text": message
-                    }
-                ]
-            }
-            
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                logger.success(f"LINE 訊息發送成功: {message[:50]}...")
-                return True
-            else:
-                logger.error(f"LINE 訊息發送失敗: {response.status_code} - {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"發送 LINE 訊息時發生錯誤: {e}")
+            response = self.session.post(self.reply_url, data=body, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ LINE 回覆失敗: {e}")
+            metrics.LINE_REPLIES.labels("error").inc()
+            return False
+        if response.status_code != 200:
+            logger.warning(f"⚠️ LINE 回覆失敗: HTTP {response.status_code} {response.text}")
+            metrics.LINE_REPLIES.labels("rejected").inc()
             return False
+        metrics.LINE_REPLIES.labels("ok").inc()
+        return True
     
-    def send_flex_message(self, alt_text: str, flex_contents: dict) -> bool:
+    def send_flex_message(self, alt_text: str, flex_contents: dict, to: Optional[str] = None) -> bool:
         """
         發送 Flex Message（彈性訊息）
         
         Args:
             alt_text: 替代文字（當無法顯示 Flex Message 時顯示）
             flex_contents: Flex Message 的內容
-            
+            to: 收件者 ID（選用）
+        
         Returns:
             bool: 發送成功返回 True
         """
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.channel_access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "to": self.user_id,
-                "messages": [
-                    {
-                        "type": "flex",
-                        "altText": alt_text,
-                        "contents": flex_contents
-                    }
-                ]
-            }
-            
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                logger.success("Flex Message 發送成功")
-                return True
-            else:
-                logger.error(f"Flex Message 發送失敗: {response.status_code} - {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"發送 Flex Message 時發生錯誤: {e}")
-            return False
+        message = json.dumps({
+            "type": "flex",
+            "altText": alt_text,
+            "contents": flex_contents
+        }, ensure_ascii=False, separators=(",", ":"))
+        return self._push([message], "Flex Message ", to)
     
-    def send_alert(self, alert_count: int, today_date: str) -> bool:
+    def send_alert(self, alert_count: int, today_date: Optional[str] = None,
+                   to: Optional[str] = None) -> bool:
         """
         發送馬桶蓋提醒通知
         
+        同一收件者短時間內的連續提醒會合併成一則摘要；每月額度偏低時改由每日摘要回報。
+        
         Args:
             alert_count: 今日累計未落蓋次數
-            today_date: 日期字串
+            today_date: 日期字串（預設為今天）
+            to: 收件者 ID（預設為初始化時的 user_id）
+        
+        Returns:
+            bool: 發送成功（或已合併/延後）返回 True
+        """
+        if today_date is None:
+            today_date = date.today().isoformat()
+        # 收件者清單共用一個合併視窗
+        to = ",".join(parse_recipients(to or self.user_id))
+        
+        with self._alert_lock:
+            window = self._windows.setdefault(to, AlertWindow())
+            self.push_stats["alerts"] += 1
+            window.last_alert = (alert_count, today_date)
+            
+            if self.budget.is_low():
+                self.push_stats["deferred"] += 1
+                window.deferred_today += 1
+                self.budget.save_deferred(to, today_date, window.deferred_today)
+                logger.info(f"📉 LINE 本月額度剩餘 {self.budget.remaining} 則，第 {alert_count} 次提醒改於每日摘要回報")
+                return True
             
+            now = time.monotonic()
+            if now < window.ends_at or not self.alert_bucket.try_acquire():
+                self.push_stats["coalesced"] += 1
+                window.coalesced.append(datetime.now())
+                self._schedule_digest(to, max(window.ends_at - now, self.alert_bucket.time_until_available()))
+                logger.info(f"🧺 第 {alert_count} 次提醒已併入摘要（待發 {len(window.coalesced)} 則）")
+                return True
+            
+            window.ends_at = now + self.coalesce_window
+            self.push_stats["pushed"] += 1
+        
+        logger.info(f"📤 正在發送 LINE 通知（第 {alert_count} 次提醒）...")
+        message = ALERT_TEMPLATE.render(alert_count=alert_count, today_date=today_date)
+        return self._push([message], "LINE 通知", to)
+    
+    def _schedule_digest(self, to: str, delay: float):
+        """內部函式：安排合併視窗結束時發送摘要（呼叫者須持有 _alert_lock）"""
+        window = self._windows[to]
+        if window.digest_timer is not None:
+            return
+        window.digest_timer = threading.Timer(delay, self._flush_digest, args=(to,))
+        window.digest_timer.daemon = True
+        window.digest_timer.start()
+    
+    def _flush_digest(self, to: str):
+        """內部函式：發送合併摘要"""
+        with self._alert_lock:
+            window = self._windows[to]
+            window.digest_timer = None
+            if not window.coalesced:
+                return
+            
+            if self.budget.is_low():
+                # 額度不足：併入每日摘要
+                window.deferred_today += len(window.coalesced)
+                self.push_stats["deferred"] += len(window.coalesced)
+                self.budget.save_deferred(to, window.last_alert[1], window.deferred_today)
+                window.coalesced.clear()
+                return
+            
+            if not self.alert_bucket.try_acquire():
+                self._schedule_digest(to, self.alert_bucket.time_until_available())
+                return
+            
+            count = len(window.coalesced)
+            since = window.coalesced[0].strftime("%H:%M")
+            alert_count, today_date = window.last_alert
+            window.coalesced.clear()
+            window.ends_at = time.monotonic() + self.coalesce_window
+            self.push_stats["digests"] += 1
+        
+        logger.info(f"📤 正在發送 LINE 提醒摘要（合併 {count} 次提醒）...")
+        message = DIGEST_TEMPLATE.render(
+            count=count, since=since, alert_count=alert_count, today_date=today_date
+        )
+        self._push([message], "LINE 提醒摘要", to)
+    
+    def end_of_day(self, day: str, total_count: int, to: Optional[str] = None) -> bool:
+        """
+        每日結束時呼叫：若當日有因額度不足而延後的提醒，發送每日摘要
+        
+        Args:
+            day: 結束的日期字串
+            total_count: 當日總提醒次數
+            to: 收件者 ID（選用）
+        
         Returns:
-            bool: 發送成功返回 True
+            bool: 有發送摘要且成功時返回 True
         """
-        message = f"""⚠️ SmartLid 馬桶蓋提醒 ⚠️
-
-📅 日期: {today_date}
-🔔 今日累計未落蓋次數: {alert_count} 次
-
-請記得隨手將馬桶蓋放下喔！🚽
-養成良好衛生習慣 💪"""
+        to = ",".join(parse_recipients(to or self.user_id))
+        with self._alert_lock:
+            window = self._windows.get(to)
+            if window is None or window.deferred_today == 0:
+                return False
+            window.deferred_today = 0
+            self.budget.save_deferred(to, day, 0)
+        return self.send_daily_summary(day, total_count, to)
+    
+    def get_push_stats(self) -> Dict[str, int]:
+        """
+        取得推播統計
         
-        return self.send_message(message)
+        Returns:
+            Dict[str, int]: 各項計數，api_calls_saved 為省下的推播次數
+        """
+        with self._alert_lock:
+            stats = dict(self.push_stats)
+        stats["api_calls_saved"] = stats["alerts"] - stats["pushed"] - stats["digests"]
+        stats["month_used"] = self.budget.used
+        stats["month_remaining"] = self.budget.remaining
+        return stats
     
     def send_alert_flex(self, alert_count: int, today_date: str) -> bool:
         """
@@ -197,119 +952,36 @@ class LineMessagingService:
         Args:
             alert_count: 今日累計未落蓋次數
             today_date: 日期字串
-            
+        
         Returns:
             bool: 發送成功返回 True
         """
-        flex_contents = {
-            "type": "bubble",
-            "hero": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "⚠️ SmartLid 提醒",
-                        "weight": "bold",
-                        "size": "xl",
-                        "color": "#FF6B6B"
-                    }
-                ],
-                "backgroundColor": "#FFF3E0",
-                "paddingAll": "20px"
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "box",
-                        "layout": "baseline",
-                        "contents": [
-                            {
-                                "type": "text",
-                                "text": "📅",
-                                "size": "sm",
-                                "flex": 0
-                            },
-                            {
-                                "type": "text",
-                                "text": f"日期: {today_date}",
-                                "size": "sm",
-                                "color": "#666666",
-                                "margin": "md"
-                            }
-                        ]
-                    },
-                    {
-                        "type": "box",
-                        "layout": "baseline",
-                        "contents": [
-                            {
-                                "type": "text",
-                                "text": "🔔",
-                                "size": "sm",
-                                "flex": 0
-                            },
-                            {
-                                "type": "text",
-                                "text": f"今日累計: {alert_count} 次",
-                                "size": "md",
-                                "color": "#FF6B6B",
-                                "weight": "bold",
-                                "margin": "md"
-                            }
-                        ],
-                        "margin": "lg"
-                    },
-                    {
-                        "type": "separator",
-                        "margin": "lg"
-                    },
-                    {
-                        "type": "text",
-                        "text": "請記得隨手將馬桶蓋放下喔！🚽",
-                        "size": "sm",
-                        "color": "#666666",
-                        "wrap": True,
-                        "margin": "lg"
-                    },
-                    {
-                        "type": "text",
-                        "text": "養成良好衛生習慣 💪",
-                        "size": "sm",
-                        "color": "#4CAF50",
-                        "wrap": True,
-                        "margin": "md"
-                    }
-                ]
-            }
-        }
-        
-        return self.send_flex_message("SmartLid 馬桶蓋提醒", flex_contents)
+        message = ALERT_FLEX_TEMPLATE.render(alert_count=alert_count, today_date=today_date)
+        return self._push([message], "Flex Message ")
     
-    def send_daily_summary(self, date: str, total_count: int) -> bool:
+    def send_daily_summary(self, date: str, total_count: int, to: Optional[str] = None) -> bool:
         """
         發送每日統計摘要
         
         Args:
             date: 日期字串
             total_count: 當日總次數
-            
+            to: 收件者 ID（選用）
+        
         Returns:
             bool: 發送成功返回 True
         """
+        if self.budget.is_exhausted():
+            logger.warning(f"⚠️ LINE 本月額度已用完，略過 {date} 的每日報告")
+            return False
+        
         emoji = "✅" if total_count < 2 else "⚠️"
         comment = "今日表現良好！" if total_count < 2 else "請多加注意衛生習慣"
         
-        message = f"""📊 SmartLid 每日報告
-
-📅 日期: {date}
-📈 今日未落蓋次數: {total_count} 次
-
-{emoji} {comment}"""
-        
-        return self.send_message(message)
+        message = DAILY_SUMMARY_TEMPLATE.render(
+            date=date, total_count=total_count, emoji=emoji, comment=comment
+        )
+        return self._push([message], "每日報告", to)
     
     def test_connection(self) -> bool:
         """
@@ -320,6 +992,19 @@ class LineMessagingService:
         """
         logger.info("測試 LINE Messaging API 連線...")
         return self.send_message("🔧 SmartLid 系統測試訊息\n系統運作正常！")
+    
+    def close(self):
+        """停止推播佇列並關閉連線池"""
+        with self._alert_lock:
+            for window in self._windows.values():
+                if window.digest_timer is not None:
+                    window.digest_timer.cancel()
+        if self.spool is not None:
+            self.spool.stop()
+        if self._fanout_pool is not None:
+            self._fanout_pool.shutdown()
+        self.budget.close()
+        self.session.close()
 
 
 def test_line_messaging(channel_access_token: Optional[str] = None, user_id: Optional[str] = None):
@@ -329,14 +1014,16 @@ def test_line_messaging(channel_access_token: Optional[str] = None, user_id: Opt
     使用方式:
         python -c "from src.services.line_messaging import test_line_messaging; test_line_messaging('YOUR_TOKEN', 'YOUR_USER_ID')"
     """
-    import os
     from datetime import datetime
+    from config import Config
     
+    # 與主程式相同，讀取 .env 與環境變數合併後的設定
+    config = Config.current()
     if channel_access_token is None:
-        channel_access_token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "")
+        channel_access_token = config.LINE_CHANNEL_ACCESS_TOKEN
     
     if user_id is None:
-        user_id = os.getenv("LINE_USER_ID", "")
+        user_id = config.LINE_USER_ID
     
     if not channel_access_token or not user_id:
         print("❌ 錯誤: 請提供 LINE Channel Access Token 和 User ID")
@@ -0,0 +1,120 @@
+"""
+LINE Messaging API 本機模擬伺服器
+用於效能測試與離線驗證，不會真的發送訊息
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Set
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """模擬 LINE API 的請求處理器（支援 HTTP/1.1 keep-alive）"""
+    
+    protocol_version = "HTTP/1.1"
+    # keep-alive 下避免 Nagle 與延遲 ACK 互相等待造成約 40 ms 的假延遲
+    disable_nagle_algorithm = True
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        body = self.rfile.read(length)
+        stub: "LineStubServer" = self.server.stub
+        
+        if stub.latency > 0:
+            time.sleep(stub.latency)
+        
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = None
+        
+        with stub.lock:
+            stub.requests.append({
+                "path": self.path,
+                "headers": dict(self.headers),
+                "payload": payload,
+                "received": time.time(),
+            })
+            status = stub.status_code
+            details = []
+            if status == 200 and isinstance(payload, dict):
+                recipients = payload.get("to")
+                recipients = recipients if isinstance(recipients, list) else [recipients]
+                details = [{"message": "The user hasn't added the LINE Official Account as a friend",
+                            "property": f"to[{index}]"}
+                           for index, recipient in enumerate(recipients) if recipient in stub.invalid_recipients]
+        
+        if details:
+            # 模擬 LINE 對無效收件者的回應：整個請求被拒絕，details 指出是哪一個
+            status = 400
+            response = json.dumps({"message": "The request body has 1 error(s)", "details": details}).encode()
+        else:
+            response = b"{}" if status == 200 else json.dumps({"message": "stub error"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+    
+    def log_message(self, format, *args):
+        # 靜音：避免測試時輸出大量存取紀錄
+        pass
+
+
+class LineStubServer:
+    """LINE API 模擬伺服器（可作為 context manager 使用）"""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, status_code: int = 200):
+        """
+        Args:
+            host: 監聽位址
+            port: 監聽埠號（0 表示自動分配）
+            latency: 每個請求的模擬處理延遲（秒）
+            status_code: 回應的 HTTP 狀態碼
+        """
+        self.latency = latency
+        self.status_code = status_code
+        # 視為無效的收件者 ID（請求中含有時回應 HTTP 400 與 details）
+        self.invalid_recipients: Set[str] = set()
+        self.requests: List[dict] = []
+        self.lock = threading.Lock()
+        
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def base_url(self) -> str:
+        """伺服器根網址，例如 http://127.0.0.1:12345"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    @property
+    def push_url(self) -> str:
+        """對應 LINE Push API 的網址"""
+        return f"{self.base_url}/v2/bot/message/push"
+    
+    @property
+    def multicast_url(self) -> str:
+        """對應 LINE Multicast API 的網址"""
+        return f"{self.base_url}/v2/bot/message/multicast"
+    
+    def start(self) -> "LineStubServer":
+        """於背景執行緒啟動伺服器"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止伺服器"""
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self) -> "LineStubServer":
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
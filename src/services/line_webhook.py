@@ -0,0 +1,392 @@
+"""
+LINE Webhook 接收模組
+以 asyncio 在獨立執行緒中接收 LINE 平台的 Webhook：驗證 X-Line-Signature 後立即回應 200，
+再由執行緒池以快取的統計（事件紀錄彙總表、LiveStateHub）回答「今天」「本週」「狀態」查詢，
+透過免費的 Reply API 回覆。Webhook 不經過控制器或 GPIO 執行緒，也不使用推播額度。
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.dashboard import LiveStateHub, TTLCache
+from services.line_messaging import TEXT_TEMPLATE
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def verify_signature(channel_secret: bytes, body: bytes, signature: str) -> bool:
+    """
+    驗證 Webhook 簽章（以 Channel secret 對請求內容做 HMAC-SHA256，再以 Base64 編碼）
+    
+    Args:
+        channel_secret: Channel secret
+        body: 原始請求內容
+        signature: X-Line-Signature 標頭
+    
+    Returns:
+        bool: 簽章相符返回 True
+    """
+    expected = base64.b64encode(hmac.new(channel_secret, body, hashlib.sha256).digest())
+    # 以位元組比較：compare_digest 遇到非 ASCII 的字串會拋出 TypeError（標頭以 latin-1 解碼）
+    return hmac.compare_digest(expected, signature.encode("utf-8", errors="replace"))
+
+
+class StatsResponder:
+    """
+    依文字查詢產生回覆訊息
+    
+    「今天」「本週」讀取事件紀錄的每日彙總表，結果在 cache_ttl 秒內直接沿用；
+    「狀態」讀取 LiveStateHub 中各馬桶蓋的最新狀態（記憶體，不快取）。
+    """
+    
+    COMMANDS = {
+        "today": ("today", "今天", "今日"),
+        "week": ("week", "本週", "本周", "這週", "這周", "一週", "一周"),
+        "status": ("status", "狀態", "現在"),
+    }
+    
+    def __init__(self, event_store=None, state_hub: Optional[LiveStateHub] = None, cache_ttl: float = 30.0,
+                 today: Callable[[], date] = date.today):
+        """
+        Args:
+            event_store: 事件紀錄（提供彙總表查詢），None 時統計查詢回覆未啟用
+            state_hub: 即時狀態來源，None 時狀態查詢回覆未啟用
+            cache_ttl: 統計回覆的快取時間（秒）
+            today: 取得今日日期的函式
+        """
+        self.event_store = event_store
+        self.state_hub = state_hub
+        self.today = today
+        self.cache = TTLCache(cache_ttl)
+        self._local = threading.local()
+        self._keywords = {keyword: command for command, keywords in self.COMMANDS.items() for keyword in keywords}
+    
+    def parse(self, text: str) -> Optional[str]:
+        """將文字對應到查詢種類（today、week、status），無法辨識時返回 None"""
+        return self._keywords.get(text.strip().lower().lstrip("/"))
+    
+    def answer(self, text: str) -> str:
+        """
+        產生回覆（可在多個執行緒中同時呼叫）
+        
+        Returns:
+            str: 序列化後的 LINE 訊息物件
+        """
+        command = self.parse(text)
+        if command == "status":
+            return TEXT_TEMPLATE.render(text=self._status_text())
+        if command is None:
+            return TEXT_TEMPLATE.render(text="🤖 可以問我：今天、本週、狀態")
+        
+        today = self.today()
+        self._local.failed = False
+        body, _ = self.cache.get((command, today), lambda: TEXT_TEMPLATE.render(
+            text=self._today_text(today) if command == "today" else self._week_text(today)
+        ).encode("utf-8"), cacheable=lambda: not self._local.failed)
+        return body.decode("utf-8")
+    
+    def _reader(self) -> sqlite3.Connection:
+        """內部函式：每個執行緒一條唯讀連線（WAL 模式下不阻塞事件紀錄的寫入）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.event_store.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+    
+    def _totals(self, start: date, end: date) -> Dict[str, Dict[str, Any]]:
+        """內部函式：各馬桶蓋在日期區間內的彙總"""
+        try:
+            rows = self.event_store.rollup("day", start.isoformat(), end.isoformat(), conn=self._reader())
+        except sqlite3.Error:
+            # 資料庫尚未建立或連線失效：關閉連線，下次重新連線；這次的回覆不快取
+            conn = getattr(self._local, "conn", None)
+            if conn is not None:
+                conn.close()
+            self._local.conn = None
+            self._local.failed = True
+            rows = []
+        totals: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            lid_totals = totals.setdefault(row["lid"], {"opens": 0, "alerts": 0})
+            lid_totals["opens"] += row["opens"]
+            lid_totals["alerts"] += row["alerts"]
+        return totals
+    
+    def _summary_lines(self, totals: Dict[str, Dict[str, Any]], empty: str) -> List[str]:
+        """內部函式：各馬桶蓋的開蓋與提醒次數"""
+        if not totals:
+            return [empty]
+        lines = [f"🚽 {lid}：開蓋 {counts['opens']} 次｜提醒 {counts['alerts']} 次"
+                 for lid, counts in sorted(totals.items())]
+        lines.append(f"🔔 合計提醒 {sum(counts['alerts'] for counts in totals.values())} 次")
+        return lines
+    
+    def _today_text(self, today: date) -> str:
+        if self.event_store is None:
+            return "📊 統計功能未啟用"
+        return "\n".join([f"📊 今日統計（{today.isoformat()}）"] +
+                         self._summary_lines(self._totals(today, today), "今天還沒有紀錄"))
+    
+    def _week_text(self, today: date) -> str:
+        if self.event_store is None:
+            return "📊 統計功能未啟用"
+        start = today - timedelta(days=6)
+        return "\n".join([f"📊 近 7 日統計（{start.isoformat()} ~ {today.isoformat()}）"] +
+                         self._summary_lines(self._totals(start, today), "近 7 日沒有紀錄"))
+    
+    def _status_text(self) -> str:
+        if self.state_hub is None:
+            return "📡 即時狀態未啟用"
+        _, states = self.state_hub.latest()
+        if not states:
+            return "📡 尚未收到馬桶蓋狀態"
+        lines = ["📡 目前狀態"]
+        for state in sorted(states, key=lambda state: state["lid"]):
+            line = f"🚽 {state['lid']}：{'⬆️ 抬起' if state['open'] else '⬇️ 放下'}"
+            if state["countdown_active"]:
+                line += f"（{state['countdown_remaining']:.0f} 秒後提醒）"
+            lines.append(f"{line}｜今日提醒 {state['daily_alert_count']} 次")
+        return "\n".join(lines)
+
+
+class LineWebhookServer:
+    """
+    LINE Webhook 伺服器（asyncio，於背景執行緒執行自己的事件迴圈）
+    
+    事件迴圈只做解析、驗證簽章與去除重送的事件，隨即回應 200；查詢與 Reply API 請求
+    交給執行緒池，因此突發的大量 Webhook 不會讓回應變慢，也不會佔用控制器的執行緒。
+    """
+    
+    _REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+                405: "Method Not Allowed", 413: "Payload Too Large"}
+    
+    def __init__(self, channel_secret: str, line_service, responder: StatsResponder,
+                 host: str = "0.0.0.0", port: int = 8781, path: str = "/callback",
+                 workers: Optional[int] = None, record_path: Optional[str] = None,
+                 max_body: int = 1 << 20, idle_timeout: float = 60.0, dedupe_size: int = 4096):
+        """
+        Args:
+            channel_secret: Channel secret（驗證簽章用）
+            line_service: 提供 reply() 的 LineMessagingService
+            responder: 查詢回覆產生器
+            host: 監聽位址
+            port: 監聽埠號（0 表示自動分配）
+            path: Webhook 路徑
+            workers: 回覆執行緒數量，預設同 LINE 連線池大小
+            record_path: 將通過驗證的請求內容逐行附加到此檔案（重播測試用，選用）
+            max_body: 請求內容上限（位元組）
+            idle_timeout: keep-alive 連線閒置多久後關閉（秒）
+            dedupe_size: 記住多少個 webhookEventId 以略過重送的事件
+        """
+        self.channel_secret = channel_secret.encode("utf-8")
+        self.line_service = line_service
+        self.responder = responder
+        self.host = host
+        self.port = port
+        self.path = path
+        self.record_path = record_path
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        
+        self.stats: Dict[str, int] = {"requests": 0, "rejected": 0, "events": 0, "duplicates": 0,
+                                      "replies": 0, "reply_failed": 0}
+        self._stats_lock = threading.Lock()
+        self._record_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers or getattr(line_service, "pool_size", 4),
+                                            thread_name_prefix="line-webhook")
+        self._seen = deque(maxlen=dedupe_size)
+        self._seen_ids = set()
+        self._record_file = None
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._writers = set()
+        self._ready = threading.Event()
+        self._error: Optional[OSError] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}{self.path}"
+    
+    def start(self) -> "LineWebhookServer":
+        """於背景執行緒啟動伺服器（埠號無法使用時拋出 OSError）"""
+        self._thread = threading.Thread(target=self._run, name="smartlid-webhook", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+    
+    def stop(self, timeout: float = 5.0):
+        """停止接收，等待進行中的回覆完成"""
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        if self._record_file is not None:
+            self._record_file.close()
+    
+    def _run(self):
+        """背景執行緒：執行事件迴圈直到 stop()"""
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+    
+    async def _serve(self):
+        """事件迴圈主程式：開始監聽，stop() 後關閉所有連線"""
+        self._stopped = asyncio.Event()
+        try:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=256)
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        
+        await self._stopped.wait()
+        self._server.close()
+        # 關閉閒置的 keep-alive 連線，否則 wait_closed() 會等到閒置逾時
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """處理一條連線上的請求（支援 HTTP/1.1 keep-alive）"""
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                
+                length = int(headers.get("content-length", "0"))
+                if length > self.max_body:
+                    await self._respond(writer, 413, close=True)
+                    break
+                body = await reader.readexactly(length)
+                status = self._dispatch(method, target, headers, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except ValueError:
+            # 請求列、標頭或 Content-Length 格式錯誤（含超過 StreamReader 的單行上限）
+            try:
+                await self._respond(writer, 400, close=True)
+            except ConnectionError:
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+    
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, close: bool):
+        """內部函式：送出回應（內容固定為 {}）"""
+        head = f"HTTP/1.1 {status} {self._REASONS[status]}\r\nContent-Type: application/json\r\nContent-Length: 2\r\n"
+        if close:
+            head += "Connection: close\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n{}")
+        await writer.drain()
+        metrics.LINE_WEBHOOK_REQUESTS.labels(status).inc()
+    
+    def _dispatch(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> int:
+        """
+        內部函式：驗證並解析 Webhook，回覆工作交給執行緒池（在事件迴圈中執行，不可阻塞）
+        
+        Returns:
+            int: HTTP 狀態碼
+        """
+        if target.split("?", 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        self.stats["requests"] += 1
+        if not verify_signature(self.channel_secret, body, headers.get("x-line-signature", "")):
+            self.stats["rejected"] += 1
+            logger.warning("⚠️ LINE Webhook 簽章不符，已拒絕")
+            return 401
+        try:
+            events = json.loads(body)["events"]
+        except (ValueError, KeyError, TypeError):
+            return 400
+        
+        received = time.perf_counter()
+        jobs: List[Tuple[str, str]] = []
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            # 回應太慢時 LINE 會重送同一事件（webhookEventId 相同）
+            event_id = event.get("webhookEventId")
+            if event_id is not None:
+                if event_id in self._seen_ids:
+                    self.stats["duplicates"] += 1
+                    continue
+                if len(self._seen) == self._seen.maxlen:
+                    self._seen_ids.discard(self._seen[0])
+                self._seen.append(event_id)
+                self._seen_ids.add(event_id)
+            self.stats["events"] += 1
+            message = event.get("message") or {}
+            if event.get("type") == "message" and message.get("type") == "text" and event.get("replyToken"):
+                jobs.append((event["replyToken"], message["text"]))
+        
+        if jobs or self.record_path:
+            self._executor.submit(self._process, jobs, body if self.record_path else None, received)
+        return 200
+    
+    def _process(self, jobs: List[Tuple[str, str]], body: Optional[bytes], received: float):
+        """內部函式：在執行緒池中產生並送出回覆"""
+        try:
+            if body is not None:
+                self._record(body)
+            for reply_token, text in jobs:
+                try:
+                    message = self.responder.answer(text)
+                except Exception as e:
+                    logger.error(f"❌ 產生 LINE 回覆時發生錯誤: {e}")
+                    message = TEXT_TEMPLATE.render(text="⚠️ 暫時無法取得統計，請稍後再試")
+                ok = self.line_service.reply(reply_token, [message])
+                metrics.LINE_WEBHOOK_REPLY.observe(time.perf_counter() - received)
+                with self._stats_lock:
+                    self.stats["replies" if ok else "reply_failed"] += 1
+        except Exception as e:
+            logger.exception(f"❌ 處理 LINE Webhook 時發生錯誤: {e}")
+    
+    def _record(self, body: bytes):
+        """內部函式：以 JSON 字串逐行保存原始請求內容（重播時以 Channel secret 重新簽章）"""
+        with self._record_lock:
+            if self._record_file is None:
+                Path(self.record_path).parent.mkdir(parents=True, exist_ok=True)
+                self._record_file = open(self.record_path, "a", encoding="utf-8")
+            self._record_file.write(json.dumps(body.decode("utf-8"), ensure_ascii=False) + "\n")
+            self._record_file.flush()
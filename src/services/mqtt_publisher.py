@@ -0,0 +1,354 @@
+"""
+MQTT 發布模組
+將各馬桶蓋的狀態、事件與當日提醒次數發布到 <prefix>/<lid>/...，並提供 Home Assistant 自動探索。
+控制器只把狀態放入記憶體佇列；背景執行緒負責連線、批次以 QoS 1 送出，
+代理伺服器無法連線時先緩衝在記憶體，超過上限時溢出到 SQLite，重新連線後依序補送。
+paho-mqtt 只在啟用 MQTT 時才匯入。
+"""
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (主題, 內容, 是否保留)
+Message = Tuple[str, bytes, bool]
+
+
+class MqttPublisher:
+    """
+    MQTT 發布器
+    
+    主題:
+        <prefix>/status          在線狀態（online / offline，遺囑訊息）
+        <prefix>/<lid>/state     完整狀態 JSON（retained，緩衝時同一主題只保留最新一則）
+        <prefix>/<lid>/event     事件 JSON（event_type 為 lid_opened、lid_closed、alert、rollover、startup）
+    
+    事件訊息依序送出：記憶體最多緩衝 buffer_size 則，超過的較舊訊息移到 SQLite（最多 spool_size 則，
+    再超過時丟棄最舊的）。重新連線後先送 SQLite 中的訊息，再送記憶體中的，每批 batch_size 則
+    同時在途，整批收到 PUBACK 後才自緩衝移除；QoS 1 為至少一次，斷線重送時可能重複。
+    停止時尚未送出的事件訊息與各馬桶蓋的最新狀態都保存到 SQLite，下次啟動後先補送，
+    代理伺服器因此不會一直保留停止前較舊的狀態。
+    """
+    
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS mqtt_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            retain INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """
+    
+    def __init__(self, host: str, port: int = 1883, prefix: str = "smartlid", db_path: Optional[str] = None,
+                 buffer_size: int = 1000, spool_size: int = 10000, batch_size: int = 100,
+                 discovery_prefix: Optional[str] = "homeassistant", username: Optional[str] = None,
+                 password: Optional[str] = None, keepalive: int = 30, reconnect_min: float = 1.0,
+                 reconnect_max: float = 60.0, ack_timeout: float = 10.0):
+        """
+        Args:
+            host: 代理伺服器位址
+            port: 代理伺服器埠號
+            prefix: 主題前綴
+            db_path: 溢出緩衝使用的 SQLite 資料庫路徑，None 表示只緩衝在記憶體（超過上限即丟棄）
+            buffer_size: 記憶體中最多緩衝的事件訊息數量
+            spool_size: SQLite 中最多緩衝的事件訊息數量
+            batch_size: 每批同時在途的訊息數量
+            discovery_prefix: Home Assistant 探索主題前綴，None 表示不發布探索設定
+            username: 代理伺服器帳號（選用）
+            password: 代理伺服器密碼（選用）
+            keepalive: MQTT keepalive（秒）
+            reconnect_min: 重新連線的最短等待時間（秒）
+            reconnect_max: 重新連線的最長等待時間（秒）
+            ack_timeout: 等待整批 PUBACK 的期限（秒）
+        """
+        self.host = host
+        self.port = port
+        self.prefix = prefix.rstrip("/")
+        self.db_path = db_path
+        self.buffer_size = buffer_size
+        self.spool_size = spool_size
+        self.batch_size = batch_size
+        self.discovery_prefix = discovery_prefix
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.ack_timeout = ack_timeout
+        
+        self.stats: Dict[str, int] = {
+            "published": 0, "coalesced": 0, "spooled": 0, "dropped": 0, "connects": 0, "disconnects": 0
+        }
+        
+        self._incoming = deque()
+        self._events = deque()
+        self._retained: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lids: List[str] = []
+        self._announce = False
+        self._connected = threading.Event()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._client = None
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def status_topic(self) -> str:
+        return f"{self.prefix}/status"
+    
+    def start(self) -> "MqttPublisher":
+        """開始連線（背景重試，代理伺服器尚未啟動也不會阻塞）並啟動發布執行緒"""
+        import paho.mqtt.client as mqtt
+        
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{self.prefix}-{id(self):x}")
+        if self.username:
+            client.username_pw_set(self.username, self.password)
+        client.will_set(self.status_topic, "offline", qos=1, retain=True)
+        client.max_inflight_messages_set(self.batch_size)
+        client.reconnect_delay_set(self.reconnect_min, self.reconnect_max)
+        client.on_connect = self._on_connect
+        client.on_socket_open = self._on_socket_open
+        client.on_disconnect = self._on_disconnect
+        self._client = client
+        
+        client.connect_async(self.host, self.port, self.keepalive)
+        client.loop_start()
+        self._thread = threading.Thread(target=self._run, name="smartlid-mqtt", daemon=True)
+        self._thread.start()
+        return self
+    
+    def publish(self, event: str, state: Dict[str, Any]):
+        """
+        發布一個馬桶蓋的狀態與事件（LidController 的狀態監聽者，不阻塞）
+        
+        Args:
+            event: 事件種類
+            state: LidController.snapshot()
+        """
+        self._incoming.append((event, state, time.time()))
+        self._wakeup.set()
+    
+    def stop(self, timeout: float = 5.0):
+        """停止發布：尚未送出的事件訊息與最新狀態保存到 SQLite，發布離線狀態後中斷連線"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._client is not None:
+            if self._connected.is_set():
+                self._client.publish(self.status_topic, "offline", qos=1, retain=True).wait_for_publish(1.0)
+                self._connected.clear()
+            self._client.disconnect()
+            self._client.loop_stop()
+    
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        """內部函式：paho 網路執行緒的連線回呼"""
+        if reason_code.is_failure:
+            logger.warning(f"⚠️ MQTT 連線被拒絕: {reason_code}")
+            return
+        logger.info(f"📡 MQTT 已連線 {self.host}:{self.port}")
+        self.stats["connects"] += 1
+        self._announce = True
+        self._connected.set()
+        self._wakeup.set()
+    
+    @staticmethod
+    def _on_socket_open(client, userdata, sock):
+        """內部函式：關閉 Nagle，避免單則訊息與代理伺服器的延遲 ACK 互相等待"""
+        if hasattr(sock, "setsockopt"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        """內部函式：paho 網路執行緒的斷線回呼（paho 會自動重新連線）"""
+        if self._connected.is_set():
+            logger.warning(f"⚠️ MQTT 連線中斷，訊息改為緩衝: {reason_code}")
+            self.stats["disconnects"] += 1
+        self._connected.clear()
+    
+    def _connect_spool(self) -> Optional[sqlite3.Connection]:
+        """內部函式：建立溢出緩衝的資料庫連線並確保資料表存在"""
+        if self.db_path is None:
+            return None
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(self._SCHEMA)
+        conn.commit()
+        return conn
+    
+    def _run(self):
+        """發布執行緒主迴圈"""
+        conn = self._connect_spool()
+        try:
+            while not self._stopping:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                self._drain_incoming(conn)
+                if self._connected.is_set():
+                    self._flush(conn)
+            
+            # 結束前保存尚未送出的事件訊息與最新狀態（狀態排在事件之後，與 _flush 的順序相同）
+            self._drain_incoming(conn)
+            self._spill(conn, len(self._events))
+            retained = [(topic, payload, True) for topic, payload in self._retained.items()]
+            self._retained.clear()
+            self._spool(conn, retained)
+        except Exception as e:
+            logger.exception(f"❌ MQTT 發布執行緒失敗: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    def _drain_incoming(self, conn: Optional[sqlite3.Connection]):
+        """內部函式：將新的狀態轉成訊息放入緩衝，超過記憶體上限時溢出"""
+        while self._incoming:
+            event, state, ts = self._incoming.popleft()
+            lid = state["lid"]
+            if lid not in self._lids:
+                self._lids.append(lid)
+                self._announce = True
+            state_topic = f"{self.prefix}/{lid}/state"
+            if state_topic in self._retained:
+                self.stats["coalesced"] += 1
+                del self._retained[state_topic]
+            self._retained[state_topic] = json.dumps(dict(state, event=event, ts=ts), ensure_ascii=False).encode()
+            self._events.append((
+                f"{self.prefix}/{lid}/event",
+                json.dumps({"event_type": event, "ts": ts, "daily_alert_count": state["daily_alert_count"]}).encode(),
+                False
+            ))
+        if len(self._events) > self.buffer_size:
+            self._spill(conn, len(self._events) - self.buffer_size)
+    
+    def _spill(self, conn: Optional[sqlite3.Connection], count: int):
+        """內部函式：將最舊的 count 則事件訊息移到 SQLite（超過上限時丟棄最舊的）"""
+        if count <= 0:
+            return
+        self._spool(conn, [self._events.popleft() for _ in range(count)])
+    
+    def _spool(self, conn: Optional[sqlite3.Connection], rows: List[Message]):
+        """內部函式：將訊息依序寫入 SQLite（超過上限時丟棄最舊的；沒有資料庫時直接丟棄）"""
+        if not rows:
+            return
+        if conn is None:
+            self.stats["dropped"] += len(rows)
+            return
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT INTO mqtt_outbox (topic, payload, retain, created_at) VALUES (?, ?, ?, ?)",
+                [(topic, payload, int(retain), now) for topic, payload, retain in rows]
+            )
+            dropped = conn.execute(
+                "DELETE FROM mqtt_outbox WHERE id IN "
+                "(SELECT id FROM mqtt_outbox ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (self.spool_size,)
+            ).rowcount
+        self.stats["spooled"] += len(rows)
+        if dropped > 0:
+            self.stats["dropped"] += dropped
+            logger.warning(f"🗑️ MQTT 離線緩衝已滿，丟棄最舊的 {dropped} 則訊息")
+    
+    def _flush(self, conn: Optional[sqlite3.Connection]):
+        """內部函式：依序補送 SQLite、記憶體中的事件訊息與最新狀態，任何一批失敗即停止等待重新連線"""
+        if self._announce:
+            self._announce = False
+            if not self._send_batch(self._discovery_messages()):
+                self._announce = True
+                return
+        
+        while conn is not None and not self._stopping:
+            rows = conn.execute(
+                "SELECT id, topic, payload, retain FROM mqtt_outbox ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+            if not rows:
+                break
+            if not self._send_batch([(topic, bytes(payload), bool(retain)) for _, topic, payload, retain in rows]):
+                return
+            with conn:
+                conn.execute("DELETE FROM mqtt_outbox WHERE id <= ?", (rows[-1][0],))
+            # 補送期間的新事件留在記憶體中，超過上限時照常溢出
+            self._drain_incoming(conn)
+        
+        while self._events and not self._stopping:
+            batch = [self._events[i] for i in range(min(self.batch_size, len(self._events)))]
+            if not self._send_batch(batch):
+                return
+            for _ in batch:
+                self._events.popleft()
+        
+        while self._retained and not self._stopping:
+            batch = list(self._retained.items())[:self.batch_size]
+            if not self._send_batch([(topic, payload, True) for topic, payload in batch]):
+                return
+            for topic, payload in batch:
+                # 送出期間沒有被更新的才移除
+                if self._retained.get(topic) is payload:
+                    del self._retained[topic]
+    
+    def _send_batch(self, messages: List[Message]) -> bool:
+        """內部函式：整批送出（同時在途）並等待全部 PUBACK，全部成功時返回 True"""
+        infos = []
+        try:
+            for topic, payload, retain in messages:
+                infos.append(self._client.publish(topic, payload, qos=1, retain=retain))
+            deadline = time.monotonic() + self.ack_timeout
+            for info in infos:
+                info.wait_for_publish(max(0.0, deadline - time.monotonic()))
+            if not all(info.is_published() for info in infos):
+                return False
+        except (RuntimeError, ValueError) as e:
+            logger.debug(f"MQTT 送出失敗，稍後重送: {e}")
+            return False
+        self.stats["published"] += len(infos)
+        return True
+    
+    def _discovery_messages(self) -> List[Message]:
+        """內部函式：在線狀態與各馬桶蓋的 Home Assistant 探索設定"""
+        messages: List[Message] = [(self.status_topic, b"online", True)]
+        if self.discovery_prefix is None:
+            return messages
+        for lid in self._lids:
+            device = {
+                "identifiers": [f"{self.prefix}_{lid}"],
+                "name": f"SmartLid {lid}",
+                "manufacturer": "SmartLid",
+                "model": "SmartLid V7",
+            }
+            state_topic = f"{self.prefix}/{lid}/state"
+            entities = [
+                ("binary_sensor", "lid", {
+                    "name": "馬桶蓋", "device_class": "opening", "state_topic": state_topic,
+                    "value_template": "{{ 'ON' if value_json.open else 'OFF' }}",
+                }),
+                ("binary_sensor", "countdown", {
+                    "name": "倒數中", "device_class": "running", "state_topic": state_topic,
+                    "value_template": "{{ 'ON' if value_json.countdown_active else 'OFF' }}",
+                }),
+                ("sensor", "countdown_remaining", {
+                    "name": "倒數剩餘", "unit_of_measurement": "s", "device_class": "duration",
+                    "state_topic": state_topic, "value_template": "{{ value_json.countdown_remaining }}",
+                }),
+                ("sensor", "alerts_today", {
+                    "name": "今日提醒次數", "state_class": "total_increasing", "icon": "mdi:bell-alert",
+                    "state_topic": state_topic, "value_template": "{{ value_json.daily_alert_count }}",
+                }),
+                ("event", "event", {
+                    "name": "事件", "state_topic": f"{self.prefix}/{lid}/event",
+                    "event_types": ["lid_opened", "lid_closed", "alert", "rollover", "startup"],
+                }),
+            ]
+            for component, key, config in entities:
+                unique_id = f"{self.prefix}_{lid}_{key}"
+                config.update(unique_id=unique_id, device=device, availability_topic=self.status_topic)
+                topic = f"{self.discovery_prefix}/{component}/{unique_id}/config"
+                messages.append((topic, json.dumps(config, ensure_ascii=False).encode(), True))
+        return messages
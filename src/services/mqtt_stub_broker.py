@@ -0,0 +1,144 @@
+"""
+MQTT 代理伺服器本機模擬
+只實作發布端需要的 MQTT 3.1.1 封包（CONNECT / PUBLISH / PUBACK / PINGREQ / DISCONNECT），
+用於效能測試與斷線重連驗證，不轉送訊息給訂閱者
+"""
+import queue
+import socket
+import socketserver
+import threading
+import time
+from typing import List, Optional, Set
+
+
+class _StubHandler(socketserver.BaseRequestHandler):
+    """單一用戶端連線：讀取封包並回覆，PUBACK 由寫出執行緒延遲送出（模擬網路往返時間）"""
+    
+    def handle(self):
+        broker: "MqttStubBroker" = self.server.broker
+        sock: socket.socket = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("rb")
+        outgoing = queue.Queue()
+        writer = threading.Thread(target=self._write, args=(sock, outgoing), daemon=True)
+        writer.start()
+        with broker.lock:
+            broker.clients.add(sock)
+        try:
+            while True:
+                header = reader.read(1)
+                if not header:
+                    return
+                body = reader.read(self._remaining_length(reader))
+                kind = header[0] >> 4
+                if kind == 1:  # CONNECT
+                    with broker.lock:
+                        broker.connections += 1
+                    outgoing.put((0.0, b"\x20\x02\x00\x00"))
+                elif kind == 3:  # PUBLISH
+                    qos = (header[0] >> 1) & 0x03
+                    topic_length = int.from_bytes(body[:2], "big")
+                    topic = body[2:2 + topic_length].decode("utf-8")
+                    offset = 2 + topic_length
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        outgoing.put((time.monotonic() + broker.ack_latency, b"\x40\x02" + packet_id))
+                    with broker.lock:
+                        broker.messages.append({
+                            "topic": topic, "payload": body[offset:], "qos": qos, "retain": bool(header[0] & 0x01)
+                        })
+                elif kind == 12:  # PINGREQ
+                    outgoing.put((0.0, b"\xd0\x00"))
+                elif kind == 14:  # DISCONNECT
+                    return
+        except OSError:
+            return
+        finally:
+            outgoing.put(None)
+            with broker.lock:
+                broker.clients.discard(sock)
+    
+    @staticmethod
+    def _remaining_length(reader) -> int:
+        """內部函式：解析可變長度的剩餘長度欄位"""
+        value, shift = 0, 0
+        while True:
+            byte = reader.read(1)
+            if not byte:
+                raise OSError("連線已關閉")
+            value |= (byte[0] & 0x7F) << shift
+            if not byte[0] & 0x80:
+                return value
+            shift += 7
+    
+    @staticmethod
+    def _write(sock: socket.socket, outgoing: queue.Queue):
+        """內部函式：依排定時間依序寫出回覆（延遲固定，因此先進先出即為時間順序）"""
+        while True:
+            item = outgoing.get()
+            if item is None:
+                return
+            due, packet = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                sock.sendall(packet)
+            except OSError:
+                return
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class MqttStubBroker:
+    """MQTT 代理伺服器模擬（可作為 context manager 使用）"""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ack_latency: float = 0.0):
+        """
+        Args:
+            host: 監聽位址
+            port: 監聽埠號（0 表示自動分配）
+            ack_latency: 每則 QoS 1 訊息的 PUBACK 延遲（秒）
+        """
+        self.ack_latency = ack_latency
+        self.messages: List[dict] = []
+        self.connections = 0
+        self.clients: Set[socket.socket] = set()
+        self.lock = threading.Lock()
+        
+        self._server = _Server((host, port), _StubHandler)
+        self._server.broker = self
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def address(self):
+        """(主機, 埠號)"""
+        return self._server.server_address[:2]
+    
+    def start(self) -> "MqttStubBroker":
+        """於背景執行緒啟動伺服器"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止伺服器並中斷所有連線（模擬代理伺服器離線）"""
+        self._server.shutdown()
+        self._server.server_close()
+        with self.lock:
+            clients = list(self.clients)
+        for sock in clients:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    def __enter__(self) -> "MqttStubBroker":
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
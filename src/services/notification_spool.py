@@ -0,0 +1,188 @@
+"""
+推播訊息持久化佇列模組
+以 SQLite 保存待送訊息，由背景執行緒依序投遞並以指數退避重試
+"""
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationSpool:
+    """
+    持久化推播佇列
+    
+    enqueue() 僅將訊息放入記憶體佇列並喚醒背景執行緒，不做任何 I/O；
+    背景執行緒隨即寫入 SQLite（WAL 模式），因此程序異常終止時最多只會遺失
+    尚未落盤的數毫秒內訊息。訊息依加入順序投遞，佇列頭失敗時後續訊息一併等待。
+    """
+    
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            body BLOB NOT NULL,
+            retry_key TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            deadline REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL
+        )
+    """
+    
+    def __init__(self, db_path: str, sender: Callable[[bytes, str, str], Optional[int]],
+                 deadline: float = 86400, retry_base: float = 1.0, retry_max: float = 300.0):
+        """
+        初始化推播佇列
+        
+        Args:
+            db_path: SQLite 資料庫路徑
+            sender: 投遞函式 (body, retry_key, description) -> HTTP 狀態碼，網路錯誤時為 None
+            deadline: 每則訊息的投遞期限（秒），逾期即放棄
+            retry_base: 第一次重試的基準等待時間（秒）
+            retry_max: 重試等待時間上限（秒）
+        """
+        self.db_path = db_path
+        self.sender = sender
+        self.deadline = deadline
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        
+        self.stats: Dict[str, int] = {
+            "enqueued": 0, "delivered": 0, "retried": 0, "dropped": 0, "expired": 0
+        }
+        
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> "NotificationSpool":
+        """啟動背景投遞執行緒（重新啟動時會接續投遞資料庫中未送達的訊息）"""
+        self._thread = threading.Thread(target=self._run, name="smartlid-spool", daemon=True)
+        self._thread.start()
+        return self
+    
+    def enqueue(self, body: bytes, description: str = "", deadline: Optional[float] = None):
+        """
+        加入待送訊息（不阻塞）
+        
+        Args:
+            body: 完整的請求內容
+            description: 訊息描述（用於輸出）
+            deadline: 本則訊息的投遞期限（秒），預設使用佇列設定
+        """
+        now = time.time()
+        ttl = self.deadline if deadline is None else deadline
+        self._pending.append((description, body, str(uuid.uuid4()), now, now + ttl))
+        self.stats["enqueued"] += 1
+        self._wakeup.set()
+    
+    def stop(self, timeout: float = 5.0):
+        """停止背景執行緒，尚未送出的訊息保留在資料庫中"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """內部函式：建立資料庫連線並確保資料表存在"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(self._SCHEMA)
+        conn.commit()
+        return conn
+    
+    def _flush_pending(self, conn: sqlite3.Connection):
+        """內部函式：將記憶體中的新訊息以單一交易寫入資料庫"""
+        rows = []
+        while self._pending:
+            description, body, retry_key, created_at, deadline = self._pending.popleft()
+            rows.append((description, body, retry_key, created_at, deadline, created_at))
+        if rows:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO notification_outbox "
+                    "(description, body, retry_key, created_at, deadline, next_attempt_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+    
+    def _backoff(self, attempts: int) -> float:
+        """內部函式：指數退避加上隨機抖動（等待時間落在 [delay/2, delay]）"""
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    def _run(self):
+        """背景執行緒主迴圈"""
+        conn = self._connect()
+        try:
+            while not self._stopping:
+                self._wakeup.clear()
+                self._flush_pending(conn)
+                
+                head = conn.execute(
+                    "SELECT id, description, body, retry_key, deadline, attempts, next_attempt_at "
+                    "FROM notification_outbox ORDER BY id LIMIT 1"
+                ).fetchone()
+                if head is None:
+                    self._wakeup.wait()
+                    continue
+                
+                row_id, description, body, retry_key, deadline, attempts, next_attempt_at = head
+                now = time.time()
+                
+                if now > deadline:
+                    logger.warning(f"⌛ {description}已超過投遞期限，放棄發送")
+                    self._delete(conn, row_id)
+                    self.stats["expired"] += 1
+                    continue
+                
+                if next_attempt_at > now:
+                    self._wakeup.wait(min(next_attempt_at, deadline) - now)
+                    continue
+                
+                try:
+                    status = self.sender(bytes(body), retry_key, description)
+                except Exception as e:
+                    logger.exception(f"❌ 投遞{description}時發生錯誤: {e}")
+                    status = None
+                
+                if status is not None and 200 <= status < 300:
+                    self._delete(conn, row_id)
+                    self.stats["delivered"] += 1
+                elif status is not None and status < 500 and status != 429:
+                    # 4xx（429 除外）重送也不會成功，直接丟棄
+                    logger.warning(f"🗑️ {description}被拒絕（HTTP {status}），自佇列移除")
+                    self._delete(conn, row_id)
+                    self.stats["dropped"] += 1
+                else:
+                    attempts += 1
+                    delay = self._backoff(attempts)
+                    logger.warning(f"🔁 {description}將於 {delay:.1f} 秒後重試（第 {attempts} 次）")
+                    with conn:
+                        conn.execute(
+                            "UPDATE notification_outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                            (attempts, time.time() + delay, row_id)
+                        )
+                    self.stats["retried"] += 1
+            
+            # 結束前保存尚未落盤的訊息
+            self._flush_pending(conn)
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, row_id: int):
+        """內部函式：自佇列移除訊息"""
+        with conn:
+            conn.execute("DELETE FROM notification_outbox WHERE id = ?", (row_id,))
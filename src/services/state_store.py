@@ -0,0 +1,143 @@
+"""
+控制器狀態保存模組
+以 SQLite 保存每個馬桶蓋的最新狀態（每日計數與倒數期限），重新啟動時直接載入
+"""
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """
+    馬桶蓋狀態快照
+    
+    每個馬桶蓋只有一列，狀態轉換時以 UPSERT 覆寫，啟動時一次查詢即可還原，
+    不需要掃描歷史事件。save() 只更新記憶體並喚醒背景執行緒；同一馬桶蓋在寫入前
+    的多次更新只保留最後一次。每次寫入都以 synchronous=FULL 落盤。
+    """
+    
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS lid_state (
+            lid TEXT PRIMARY KEY,
+            daily_alert_count INTEGER NOT NULL,
+            last_reset_date TEXT NOT NULL,
+            countdown_deadline REAL,
+            updated_at REAL NOT NULL
+        )
+    """
+    
+    def __init__(self, db_path: str):
+        """
+        初始化狀態快照
+        
+        Args:
+            db_path: SQLite 資料庫路徑
+        """
+        self.db_path = db_path
+        self._dirty: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> "StateStore":
+        """啟動背景寫入執行緒"""
+        self._thread = threading.Thread(target=self._run, name="smartlid-state", daemon=True)
+        self._thread.start()
+        return self
+    
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        載入所有馬桶蓋的最新狀態
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: 馬桶蓋名稱 → daily_alert_count、last_reset_date、
+            countdown_deadline（time.time() 時間點，無倒數時為 None）
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT lid, daily_alert_count, last_reset_date, countdown_deadline FROM lid_state"
+            ).fetchall()
+        finally:
+            conn.close()
+        return {
+            lid: {
+                "daily_alert_count": count,
+                "last_reset_date": last_reset_date,
+                "countdown_deadline": deadline,
+            }
+            for lid, count, last_reset_date, deadline in rows
+        }
+    
+    def save(self, lid: str, daily_alert_count: int, last_reset_date: str,
+             countdown_deadline: Optional[float]):
+        """
+        更新馬桶蓋狀態（不阻塞）
+        
+        Args:
+            lid: 馬桶蓋名稱
+            daily_alert_count: 當日提醒次數
+            last_reset_date: 計數所屬日期（ISO 格式）
+            countdown_deadline: 倒數期限（time.time() 時間點），無倒數時為 None
+        """
+        with self._lock:
+            self._dirty[lid] = (lid, daily_alert_count, last_reset_date, countdown_deadline, time.time())
+        self._wakeup.set()
+    
+    def stop(self, timeout: float = 5.0):
+        """停止背景執行緒，結束前寫入尚未保存的狀態"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """內部函式：建立資料庫連線並確保資料表存在"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute(self._SCHEMA)
+        conn.commit()
+        return conn
+    
+    def _write_dirty(self, conn: sqlite3.Connection):
+        """內部函式：寫入所有已變更的狀態"""
+        with self._lock:
+            rows = list(self._dirty.values())
+            self._dirty.clear()
+        if rows:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO lid_state "
+                    "(lid, daily_alert_count, last_reset_date, countdown_deadline, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(lid) DO UPDATE SET "
+                    "daily_alert_count = excluded.daily_alert_count, "
+                    "last_reset_date = excluded.last_reset_date, "
+                    "countdown_deadline = excluded.countdown_deadline, "
+                    "updated_at = excluded.updated_at",
+                    rows
+                )
+    
+    def _run(self):
+        """背景執行緒主迴圈"""
+        conn = self._connect()
+        try:
+            while not self._stopping:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                try:
+                    self._write_dirty(conn)
+                except sqlite3.Error as e:
+                    logger.exception(f"❌ 保存控制器狀態失敗: {e}")
+            
+            self._write_dirty(conn)
+        finally:
+            conn.close()
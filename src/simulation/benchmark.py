@@ -0,0 +1,1385 @@
+"""
+提醒熱路徑效能測試模組
+以模擬硬體與本機 LINE 模擬伺服器量測開合事件、計時器、提醒動作與推播的延遲，結果輸出為 JSON；
+另收錄各元件的個別效能測試（benchmark_* 函式，結果直接輸出）
+
+使用方式:
+    cd src && python -m simulation.benchmark
+    cd src && python -m simulation.benchmark --output before.json
+    cd src && python -m simulation.benchmark --output after.json --baseline before.json
+    cd src && python -c "from simulation.benchmark import benchmark_lids; benchmark_lids()"
+    cd src && python -c "from simulation.benchmark import benchmark_line_messaging; benchmark_line_messaging()"
+    cd src && python -c "from simulation.benchmark import benchmark_scheduler; benchmark_scheduler()"
+    cd src && python -c "from simulation.benchmark import benchmark_debounce; benchmark_debounce()"
+    cd src && python -c "from simulation.benchmark import benchmark_event_store; benchmark_event_store()"
+    cd src && python -c "from simulation.benchmark import benchmark_logging; benchmark_logging()"
+    cd src && python -c "from simulation.benchmark import benchmark_startup; benchmark_startup()"
+    cd src && python -c "from simulation.benchmark import benchmark_closed_loop; benchmark_closed_loop()"
+    cd src && python -c "from simulation.benchmark import benchmark_pwm_idle; benchmark_pwm_idle()"
+    cd src && python -c "from simulation.benchmark import benchmark_dashboard; benchmark_dashboard()"
+    cd src && python -c "from simulation.benchmark import benchmark_mqtt; benchmark_mqtt()"
+    cd src && python -c "from simulation.benchmark import benchmark_fleet_gateway; benchmark_fleet_gateway()"
+    cd src && python -c "from simulation.benchmark import benchmark_line_multicast; benchmark_line_multicast()"
+    cd src && python -c "from simulation.benchmark import benchmark_line_webhook; benchmark_line_webhook()"
+    cd src && python -c "from simulation.benchmark import benchmark_line_webhook; benchmark_line_webhook('data/webhook.jsonl')"
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import Config
+from controllers.action_executor import ActionExecutor
+from controllers.lid_controller import LidController
+from controllers.servo_controller import ServoController
+from sensors.reed_switch import ReedSwitch
+from simulation.drivers import SimAudioController, SimInputDevice, SimLineService, SimPWM
+from utils.scheduler import DeadlineScheduler
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    """內部函式：將秒數樣本整理為毫秒統計"""
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def _memory() -> Dict[str, int]:
+    """內部函式：目前與峰值常駐記憶體（KB）"""
+    memory = {"max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    memory["rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return memory
+
+
+@contextlib.contextmanager
+def _quiet(level: int = logging.INFO):
+    """內部函式：量測期間停用 level（含）以下的記錄，隱藏控制器的一般輸出"""
+    previous = logging.root.manager.disable
+    logging.disable(level)
+    try:
+        yield
+    finally:
+        logging.disable(previous)
+
+
+def _create_lid(reed: ReedSwitch, scheduler: DeadlineScheduler, executor: ActionExecutor,
+                servo_scale: float, sound_length: float, on_alert=None, name: str = "bench") -> LidController:
+    """內部函式：以模擬硬體建立單一馬桶蓋控制器"""
+    servo = ServoController(
+        pin=reed.pin,
+        duty_rest=Config.SERVO_DUTY_REST,
+        duty_push=Config.SERVO_DUTY_PUSH,
+        move_time=Config.SERVO_MOVE_TIME * servo_scale,
+        stabilize_time=Config.SERVO_STABILIZE_TIME * servo_scale,
+        push_hold_time=Config.SERVO_PUSH_HOLD_TIME * servo_scale,
+        pwm=SimPWM(reed.pin)
+    )
+    audio = SimAudioController(sound_length=sound_length)
+    return LidController(name, reed, servo, audio, SimLineService(), scheduler, executor,
+                         "alert1.mp3", "alert2.mp3", on_alert=on_alert)
+
+
+def bench_edge_callback(iterations: int = 200, stable_time: float = 0.0) -> Dict[str, Any]:
+    """
+    開合事件延遲：自腳位電位改變到 on_lid_opened 完成（含啟動倒數）
+    
+    Args:
+        iterations: 開合次數
+        stable_time: 防彈跳穩定時間（秒）；結果另列扣除穩定時間後的處理延遲
+    """
+    scheduler = DeadlineScheduler().start()
+    executor = ActionExecutor()
+    reed = ReedSwitch(0, stable_time=stable_time, device=SimInputDevice(0))
+    lid = _create_lid(reed, scheduler, executor, servo_scale=0.0, sound_length=0.0)
+    lid.bind()
+    
+    handled = threading.Event()
+    stamps: List[float] = []
+    
+    def timed(handler):
+        def wrapper(event=None):
+            handler(event)
+            stamps.append(time.perf_counter())
+            handled.set()
+        return wrapper
+    
+    reed.when_activated = timed(lid.on_lid_opened)
+    reed.when_deactivated = timed(lid.on_lid_closed)
+    
+    latencies = []
+    for _ in range(iterations):
+        for value in (1, 0):
+            handled.clear()
+            started = time.perf_counter()
+            reed.device.drive(value)
+            handled.wait(stable_time + 1.0)
+            if value == 1:
+                latencies.append(stamps[-1] - started)
+    
+    reed.cleanup()
+    scheduler.stop()
+    executor.shutdown()
+    
+    result = _summarize(latencies)
+    if stable_time > 0:
+        result["processing"] = _summarize([latency - stable_time for latency in latencies])
+    return result
+
+
+def bench_alert_path(iterations: int = 30, timeout: float = 0.05, servo_scale: float = 0.1,
+                     sound_length: float = 0.05) -> Dict[str, Any]:
+    """
+    提醒路徑：計時器觸發誤差、各動作啟動延遲與伺服馬達動作時間
+    
+    Args:
+        iterations: 提醒次數
+        timeout: 開蓋逾時（秒）
+        servo_scale: 伺服馬達時間參數的縮放比例（縮短測試時間）
+        sound_length: 模擬音效長度（秒）
+    """
+    scheduler = DeadlineScheduler().start()
+    executor = ActionExecutor()
+    reed = ReedSwitch(1, stable_time=0.0, device=SimInputDevice(1))
+    
+    done = threading.Event()
+    batches = []
+    
+    def on_alert(lid, batch):
+        batches.append(batch)
+        done.set()
+    
+    lid = _create_lid(reed, scheduler, executor, servo_scale, sound_length, on_alert=on_alert)
+    lid.bind()
+    
+    jitter: List[float] = []
+    trigger = lid.trigger_alert_and_push
+    
+    def timed_trigger(deadline=None):
+        if deadline is not None:
+            jitter.append(time.monotonic() - deadline)
+        trigger(deadline)
+    
+    lid.trigger_alert_and_push = timed_trigger
+    
+    with Config.override(LID_OPEN_TIMEOUT=timeout):
+        for _ in range(iterations):
+            done.clear()
+            reed.device.drive(1)
+            done.wait(timeout + 30)
+            reed.device.drive(0)
+    
+    reed.cleanup()
+    scheduler.stop()
+    executor.shutdown()
+    
+    starts: Dict[str, List[float]] = {}
+    servo_times: List[float] = []
+    for batch in batches:
+        for name, result in batch.results.items():
+            latency = result.latency_from(batch.origin)
+            if latency is not None:
+                starts.setdefault(name, []).append(latency)
+        servo = batch.results.get("servo")
+        if servo is not None and servo.duration is not None:
+            servo_times.append(servo.duration)
+    
+    nominal = (Config.SERVO_MOVE_TIME * 3 + Config.SERVO_STABILIZE_TIME + Config.SERVO_PUSH_HOLD_TIME) * servo_scale
+    return {
+        "timer_jitter": _summarize(jitter),
+        "action_start": {name: _summarize(samples) for name, samples in starts.items()},
+        "servo_sequence": {
+            "nominal_ms": nominal * 1000,
+            **_summarize(servo_times),
+            "overhead": _summarize([duration - nominal for duration in servo_times]),
+        },
+    }
+
+
+def bench_line(iterations: int = 200, concurrency: int = 4, latency: float = 0.0) -> Dict[str, Any]:
+    """
+    LINE 推播：對本機模擬伺服器量測單則延遲與並行吞吐量
+    
+    Args:
+        iterations: 發送則數（延遲與吞吐量各一輪）
+        concurrency: 並行發送的執行緒數
+        latency: 模擬伺服器的處理延遲（秒）
+    """
+    from services.line_messaging import ALERT_TEMPLATE, LineMessagingService
+    from services.line_stub_server import LineStubServer
+    
+    with LineStubServer(latency=latency) as stub:
+        service = LineMessagingService("benchmark-token", "Ubenchmark", api_url=stub.push_url,
+                                       pool_size=concurrency, monthly_quota=0)
+        
+        def push(i: int) -> float:
+            started = time.perf_counter()
+            service._push([ALERT_TEMPLATE.render(alert_count=i, today_date="2025-01-01")], "")
+            return time.perf_counter() - started
+        
+        sequential = [push(i) for i in range(iterations)]
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(push, range(iterations)))
+        elapsed = time.perf_counter() - started
+        service.close()
+        received = len(stub.requests)
+    
+    return {
+        "latency": _summarize(sequential),
+        "throughput_per_s": iterations / elapsed,
+        "concurrency": concurrency,
+        "server_received": received,
+    }
+
+
+def benchmark_lids(lid_counts=(1, 10, 100, 500, 1000), timeout: float = 0.2,
+                   rounds: int = 5, target_p99: float = 0.05) -> int:
+    """
+    多馬桶蓋容量測試：以模擬裝置驅動 N 個馬桶蓋，量測計時器到期至動作啟動的延遲
+    
+    Args:
+        lid_counts: 要測試的馬桶蓋數量
+        timeout: 模擬的開蓋逾時（秒），取代 LID_OPEN_TIMEOUT
+        rounds: 每個馬桶蓋的開蓋次數
+        target_p99: 目標 p99 延遲（秒）
+    
+    Returns:
+        int: 符合目標的最大馬桶蓋數
+    """
+    capacity = 0
+    
+    print(f"\n📊 多馬桶蓋容量測試（逾時 {timeout} 秒，目標 p99 {target_p99 * 1000:.0f} ms）")
+    with Config.override(LID_OPEN_TIMEOUT=timeout):
+        for count in lid_counts:
+            samples = []
+            lock = threading.Lock()
+            
+            def on_alert(lid, batch):
+                with lock:
+                    for result in batch.results.values():
+                        latency = result.latency_from(batch.origin)
+                        if latency is not None:
+                            samples.append(latency)
+            
+            scheduler = DeadlineScheduler(max_workers=4).start()
+            executor = ActionExecutor(max_workers=min(32, 3 * count))
+            lids = []
+            for i in range(count):
+                reed = ReedSwitch(i, stable_time=0, device=SimInputDevice(i))
+                lid = _create_lid(reed, scheduler, executor, servo_scale=0.0, sound_length=0.0,
+                                  on_alert=on_alert, name=f"lid{i}")
+                lid.bind()
+                lids.append(lid)
+            
+            with _quiet():
+                for _ in range(rounds):
+                    for lid in lids:
+                        lid.reed_switch.device.drive(1)
+                        # 約一半的馬桶蓋在逾時前放下
+                        if random.random() < 0.5:
+                            close_after = random.uniform(0, timeout * 0.8)
+                        else:
+                            close_after = timeout * 1.5
+                        scheduler.schedule(close_after, lid.reed_switch.device.drive, 0)
+                    time.sleep(timeout * 2)
+                time.sleep(timeout)
+                
+                for lid in lids:
+                    lid.cleanup()
+                scheduler.stop()
+                executor.shutdown()
+            
+            samples.sort()
+            if samples:
+                p50 = samples[len(samples) // 2]
+                p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+                within = p99 <= target_p99
+                if within:
+                    capacity = count
+                print(f"   {count:>5} 個: 動作啟動延遲 p50 {p50 * 1000:6.2f} ms | p99 {p99 * 1000:6.2f} ms "
+                      f"| 樣本 {len(samples)} {'✅' if within else '❌'}")
+    
+    print(f"   → 符合目標的最大馬桶蓋數: {capacity}")
+    return capacity
+
+
+def benchmark_line_messaging(iterations: int = 200, latency: float = 0.0):
+    """
+    對本機 LINE 模擬伺服器比較「每次 requests.post」與「連線池 + 預先序列化」的單則延遲
+    
+    Args:
+        iterations: 每種模式發送的訊息數
+        latency: 模擬伺服器的處理延遲（秒）
+    """
+    import statistics
+    import requests
+    from services.line_messaging import ALERT_TEMPLATE, LineMessagingService
+    from services.line_stub_server import LineStubServer
+    
+    def summarize(label: str, samples: List[float]):
+        samples = sorted(samples)
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"{label:<14} 平均 {statistics.mean(samples) * 1000:7.2f} ms | "
+              f"中位數 {statistics.median(samples) * 1000:7.2f} ms | p95 {p95 * 1000:7.2f} ms")
+    
+    with LineStubServer(latency=latency) as stub:
+        token, user_id = "benchmark-token", "Ubenchmark"
+        
+        # 舊做法：每次建立標頭、序列化 payload，並以新連線送出
+        legacy = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+            payload = {"to": user_id, "messages": [{"type": "text", "text": f"第 {i} 次提醒"}]}
+            requests.post(stub.push_url, headers=headers, json=payload, timeout=10)
+            legacy.append(time.perf_counter() - started)
+        
+        # 新做法：共用連線池與預先序列化樣板
+        service = LineMessagingService(token, user_id, api_url=stub.push_url)
+        pooled = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            service._push([ALERT_TEMPLATE.render(alert_count=i, today_date="2025-01-01")], "")
+            pooled.append(time.perf_counter() - started)
+        service.close()
+    
+    print(f"\n📊 LINE 推播單則延遲（{iterations} 則，模擬伺服器延遲 {latency * 1000:.0f} ms）")
+    summarize("requests.post", legacy)
+    summarize("Session", pooled)
+    return {"legacy": legacy, "pooled": pooled}
+
+
+def benchmark_scheduler(count: int = 10000, delay: float = 0.5, spread: float = 2.0):
+    """
+    排程器效能測試：大量排程、取消一半，並量測實際觸發誤差
+    
+    Args:
+        count: 排程任務數量
+        delay: 第一個任務的延遲秒數
+        spread: 任務期限分散的時間範圍（秒）
+    """
+    scheduler = DeadlineScheduler().start()
+    lateness: List[float] = []
+    done = threading.Event()
+    expected = count - count // 2
+    lock = threading.Lock()
+    
+    def on_fire(deadline: float):
+        with lock:
+            lateness.append(time.monotonic() - deadline)
+            if len(lateness) == expected:
+                done.set()
+    
+    started = time.perf_counter()
+    tasks = []
+    base = time.monotonic() + delay
+    for i in range(count):
+        deadline = base + spread * i / count
+        tasks.append(scheduler.schedule_at(deadline, on_fire, deadline))
+    arm_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for task in tasks[::2]:
+        task.cancel()
+    cancel_time = time.perf_counter() - started
+    
+    done.wait(delay + spread + 10)
+    scheduler.stop()
+    
+    lateness.sort()
+    print(f"\n📊 期限排程器（{count} 個任務，取消 {count // 2} 個）")
+    print(f"   排程: 每個 {arm_time / count * 1e6:.2f} µs | 取消: 每個 {cancel_time / (count // 2) * 1e6:.2f} µs")
+    if lateness:
+        print(f"   觸發誤差: 中位數 {lateness[len(lateness) // 2] * 1000:.2f} ms | "
+              f"p99 {lateness[int(len(lateness) * 0.99) - 1] * 1000:.2f} ms | 觸發 {len(lateness)} 個")
+    return lateness
+
+
+def benchmark_debounce(transitions: int = 200, max_bounces: int = 12,
+                       stable_time: float = 0.02, glitch_ratio: float = 0.2):
+    """
+    防彈跳測試：以 gpiozero 模擬腳位送入合成的接點抖動，統計省下的回呼次數
+    
+    Args:
+        transitions: 實際開合次數
+        max_bounces: 每次開合最多的抖動邊緣數
+        stable_time: 防彈跳穩定時間（秒）
+        glitch_ratio: 額外插入「抖動後回到原狀態」雜訊的比例
+    """
+    from gpiozero import Device
+    from gpiozero.pins.mock import MockFactory
+    
+    original_factory = Device.pin_factory
+    Device.pin_factory = MockFactory()
+    pin_number = 17
+    try:
+        reed = ReedSwitch(pin_number, stable_time=stable_time)
+        pin = Device.pin_factory.pin(pin_number)
+        events = []
+        settled = threading.Event()
+        
+        def on_event(event):
+            events.append(event)
+            settled.set()
+        
+        reed.when_activated = on_event
+        reed.when_deactivated = on_event
+        
+        def drive(level: int):
+            if level:
+                pin.drive_high()
+            else:
+                pin.drive_low()
+        
+        def chatter(level: int, target: int, bounces: int):
+            """自 level 起送出 bounces 個抖動邊緣，最後停在 target"""
+            for _ in range(bounces):
+                level = 1 - level
+                drive(level)
+                time.sleep(random.uniform(0.0001, stable_time / 4))
+            if level != target:
+                drive(target)
+        
+        state = reed.value
+        for _ in range(transitions):
+            if random.random() < glitch_ratio:
+                # 短暫雜訊：離開後又回到原狀態
+                chatter(state, state, random.randrange(2, max_bounces + 1, 2))
+                time.sleep(stable_time * 2)
+            
+            state = 1 - state
+            settled.clear()
+            chatter(1 - state, state, random.randint(1, max_bounces))
+            settled.wait(stable_time * 10)
+        
+        time.sleep(stable_time * 2)
+        reed.cleanup()
+    finally:
+        Device.pin_factory.close()
+        Device.pin_factory = original_factory
+    
+    stats = reed.stats
+    delays = sorted(event.settle_delay for event in events)
+    avoided = stats["raw_edges"] - stats["emitted"]
+    print(f"\n📊 磁簧開關防彈跳（{transitions} 次開合，穩定時間 {stable_time * 1000:.0f} ms）")
+    print(f"   原始邊緣: {stats['raw_edges']} | 發出事件: {stats['emitted']} | "
+          f"省下回呼: {avoided} ({avoided / max(1, stats['raw_edges']) * 100:.1f}%)")
+    print(f"   合併抖動: {stats['bounces']} | 濾除雜訊: {stats['glitches']} | "
+          f"事件正確: {'✅' if stats['emitted'] == transitions else '❌'}")
+    if delays:
+        print(f"   穩定判定延遲: 中位數 {delays[len(delays) // 2] * 1000:.1f} ms | 最大 {delays[-1] * 1000:.1f} ms")
+    return stats
+
+
+def benchmark_event_store(db_path: Optional[str] = None, seconds: float = 5.0,
+                          batch_size: int = 100, flush_interval: float = 1.0):
+    """
+    事件紀錄效能測試：持續寫入，量測 record() 呼叫延遲與實際落盤的每秒筆數
+    
+    在 Raspberry Pi 上執行時，預設資料庫與 DB_PATH 位於同一個儲存裝置（SD 卡）。
+    
+    Args:
+        db_path: 測試用資料庫路徑（預設為 DB_PATH 同目錄下的暫存檔，結束後刪除）
+        seconds: 持續寫入的時間（秒）
+        batch_size: 批次寫入數量
+        flush_interval: 最長寫入間隔（秒）
+    """
+    from services.event_store import EventStore
+    
+    path = Path(db_path) if db_path else Path(Config.DB_PATH).with_name("event_store_benchmark.db")
+    store = EventStore(str(path), batch_size=batch_size, flush_interval=flush_interval).start()
+    
+    latencies = []
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        call_started = time.perf_counter()
+        store.record(EventStore.ACTION, "bench", value=count, duration=0.001, status="done",
+                     detail={"name": "servo"})
+        latencies.append(time.perf_counter() - call_started)
+        count += 1
+        # 每 1000 筆讓出一次 CPU，模擬實際事件之間的間隔
+        if count % 1000 == 0:
+            time.sleep(0)
+    store.flush(timeout=60)
+    elapsed = time.perf_counter() - started
+    store.stop()
+    
+    stats = store.stats
+    latencies.sort()
+    print(f"\n📊 事件紀錄（{path}，批次 {batch_size} 筆 / {flush_interval} 秒）")
+    print(f"   record() 延遲: 中位數 {latencies[len(latencies) // 2] * 1e6:.2f} µs | "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e6:.2f} µs")
+    print(f"   落盤: {stats['written']} 筆 / {elapsed:.1f} 秒 = {stats['written'] / elapsed:,.0f} 筆/秒 | "
+          f"{stats['batches']} 批，平均每批 {stats['write_time'] / max(1, stats['batches']) * 1000:.2f} ms")
+    print(f"   未寫入（緩衝區溢出）: {stats['recorded'] - stats['written']} 筆")
+    
+    if not db_path:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+    return stats
+
+
+def benchmark_logging(iterations: int = 2000, write_latency: float = 0.001):
+    """
+    比較同步 print 與佇列日誌在呼叫端的耗時：主控台以每次寫入延遲 write_latency 秒的
+    輸出模擬 journald 或序列主控台
+    """
+    import io
+    import tempfile
+    from utils import log
+    
+    class _SlowConsole(io.StringIO):
+        def write(self, text):
+            time.sleep(write_latency)
+            return super().write(text)
+    
+    def measure(emit) -> float:
+        started = time.perf_counter()
+        for i in range(iterations):
+            emit(f"[偵測][lid{i % 10}] 訊號 HIGH (1): 馬桶蓋抬起！")
+        return (time.perf_counter() - started) / iterations
+    
+    with contextlib.redirect_stdout(_SlowConsole()):
+        print_cost = measure(print)
+    
+    logger = logging.getLogger("benchmark")
+    with tempfile.TemporaryDirectory() as logs_dir, contextlib.redirect_stdout(_SlowConsole()):
+        log.setup_logging(level="INFO", logs_dir=Path(logs_dir), console=True)
+        try:
+            log_cost = measure(logger.info)
+            dropped = log._handler.dropped
+        finally:
+            log.shutdown_logging()
+    
+    print(f"\n📊 日誌呼叫端耗時（{iterations} 筆，主控台寫入延遲 {write_latency * 1000:.1f} ms）")
+    print(f"   同步 print: {print_cost * 1e6:8.1f} µs/筆")
+    print(f"   佇列日誌:   {log_cost * 1e6:8.1f} µs/筆（丟棄 {dropped} 筆）")
+    return {"print": print_cost, "queue": log_cost, "dropped": dropped}
+
+
+def benchmark_startup():
+    """
+    啟動時間分析：主程式的匯入耗時，以及模擬硬體下各初始化階段的時間軸
+    """
+    import tempfile
+    from utils.profiling import StartupProfile, profile_imports
+    
+    print("\n📊 匯入耗時（python -X importtime，累計）")
+    for name, seconds in profile_imports("main"):
+        print(f"   {name:<32} {seconds * 1000:7.1f} ms")
+    
+    from main import SmartLidController
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        overrides = {
+            "HARDWARE_BACKEND": "sim",
+            "DB_PATH": str(Path(data_dir) / "smartlid.db"),
+            "METRICS_ENABLED": False,
+        }
+        with Config.override(**overrides), _quiet():
+            profile = StartupProfile(time.perf_counter())
+            controller = SmartLidController(profile=profile)
+            with contextlib.suppress(SystemExit):
+                controller.cleanup()
+    
+    print()
+    print(profile.report())
+    armed = profile.finish_time("reed_switches")
+    ready = profile.finish_time("ready")
+    if armed is not None and ready is not None:
+        print(f"   → 磁簧開關於 {armed * 1000:.1f} ms 開始監測，全部就緒於 {ready * 1000:.1f} ms")
+    return profile
+
+
+def benchmark_closed_loop(cycles: int = 20, time_scale: float = 0.2, stuck_ratio: float = 0.1, seed: int = 7):
+    """
+    開迴路與閉迴路推蓋比較：以模擬腳位在推動後隨機時間放下蓋子，統計馬達實際作動時間
+    
+    Args:
+        cycles: 推蓋次數
+        time_scale: 時間參數的縮放比例（縮短測試時間，結果換算回實際秒數）
+        stuck_ratio: 蓋子卡住、推動後不會放下的比例
+        seed: 亂數種子（兩種模式使用相同的落蓋時間）
+    """
+    from controllers.servo_controller import LidCloseTimeout
+    
+    timing = {
+        "duty_rest": Config.SERVO_DUTY_REST,
+        "duty_push": Config.SERVO_DUTY_PUSH,
+        "move_time": Config.SERVO_MOVE_TIME * time_scale,
+        "stabilize_time": Config.SERVO_STABILIZE_TIME * time_scale,
+        "push_hold_time": Config.SERVO_PUSH_HOLD_TIME * time_scale,
+        "close_timeout": Config.SERVO_CLOSE_TIMEOUT * time_scale,
+    }
+    
+    def run(closed_loop: bool):
+        rng = random.Random(seed)
+        reed = ReedSwitch(0, stable_time=0.0, device=SimInputDevice(0, value=1))
+        servo = ServoController(0, pwm=SimPWM(0), lid_sensor=reed if closed_loop else None, **timing)
+        results = []
+        for _ in range(cycles):
+            reed.device.drive(1)
+            timer = None
+            if rng.random() >= stuck_ratio:
+                # 推動後 0.2 ~ 1.5 秒（縮放前）蓋子放下
+                fall_at = timing["move_time"] + timing["stabilize_time"] + rng.uniform(0.2, 1.5) * time_scale
+                timer = threading.Timer(fall_at, reed.device.drive, (0,))
+                timer.start()
+            try:
+                results.append(servo.push_lid_down())
+            except LidCloseTimeout as e:
+                results.append(e.cycle)
+            if timer is not None:
+                timer.join()
+        servo.cleanup()
+        reed.cleanup()
+        return results
+    
+    # 卡住時的逾時警告屬預期結果，只保留錯誤
+    with _quiet(logging.WARNING):
+        open_loop, closed_loop = run(False), run(True)
+    
+    def summary(results):
+        times = sorted(cycle.actuation_time / time_scale for cycle in results)
+        return sum(times) / len(times), times[int(len(times) * 0.95) - 1 if len(times) > 1 else 0]
+    
+    open_mean, open_p95 = summary(open_loop)
+    closed_mean, closed_p95 = summary(closed_loop)
+    outcomes: Dict[str, int] = {}
+    for cycle in closed_loop:
+        outcomes[cycle.outcome] = outcomes.get(cycle.outcome, 0) + 1
+    
+    print(f"\n📊 伺服馬達推蓋（{cycles} 次，卡住比例 {stuck_ratio:.0%}，換算為實際秒數）")
+    print(f"   開迴路: 平均 {open_mean:.2f} 秒 | p95 {open_p95:.2f} 秒")
+    print(f"   閉迴路: 平均 {closed_mean:.2f} 秒 | p95 {closed_p95:.2f} 秒 | "
+          f"作動時間減少 {(1 - closed_mean / open_mean) * 100:.0f}%")
+    print(f"   閉迴路結果: {', '.join(f'{outcome} {count}' for outcome, count in sorted(outcomes.items()))}")
+    return {"open_loop": open_loop, "closed_loop": closed_loop}
+
+
+def benchmark_pwm_idle(seconds: float = 5.0, backends=("sim", "software", "hardware"), pin: int = 18):
+    """
+    閒置 CPU 量測：比較「常駐 PWM」（舊版在初始化時 start(0)）與「動作時才啟動」在閒置期間的
+    行程 CPU 時間。sim 後端以模擬執行緒重現 RPi.GPIO 軟體 PWM 每週期兩次的喚醒；
+    software / hardware 後端需在 Raspberry Pi 上執行，無法使用時略過。
+    
+    Args:
+        seconds: 每次量測的閒置時間（秒）
+        backends: 要量測的後端
+        pin: 使用的 GPIO 針腳
+    """
+    from controllers.pwm_backend import HardwarePWM, SoftwarePWM
+    
+    factories = {
+        "sim": lambda: SimPWM(pin, 50, emulate_thread=True),
+        "software": lambda: SoftwarePWM(pin, 50),
+        "hardware": lambda: HardwarePWM(pin, 50),
+    }
+    
+    def idle_cpu(pwm, always_on: bool) -> float:
+        if always_on:
+            pwm.start(0)
+        started = time.process_time()
+        time.sleep(seconds)
+        used = time.process_time() - started
+        pwm.stop()
+        return used
+    
+    results: Dict[str, Optional[Dict[str, float]]] = {}
+    print(f"\n📊 PWM 閒置 CPU（每項閒置 {seconds:.0f} 秒，行程 CPU 時間佔比）")
+    for name in backends:
+        try:
+            pwm = factories[name]()
+            # 先啟停一次，確認後端可用並排除初始化成本
+            pwm.start(0)
+            pwm.stop()
+        except (ImportError, RuntimeError, OSError, ValueError) as e:
+            print(f"   {name:<9} 無法使用，略過: {e}")
+            results[name] = None
+            continue
+        try:
+            always_on = idle_cpu(pwm, always_on=True)
+            on_demand = idle_cpu(pwm, always_on=False)
+        finally:
+            pwm.close()
+        results[name] = {"always_on": always_on / seconds, "on_demand": on_demand / seconds}
+        print(f"   {name:<9} 常駐: {always_on / seconds * 100:6.3f}% | 動作時才啟動: {on_demand / seconds * 100:6.3f}%")
+    return results
+
+
+def benchmark_dashboard(history_days=(30, 365, 365 * 3), lids: int = 4, requests_per_endpoint: int = 200):
+    """
+    儀表板查詢測試：以不同長度的歷史彙總資料量測各端點 p95（不經快取），以及快取命中與 304 的回應時間
+    
+    Args:
+        history_days: 要比較的歷史天數
+        lids: 馬桶蓋數量
+        requests_per_endpoint: 每個端點的請求次數
+    """
+    import os
+    import tempfile
+    from datetime import timedelta
+    from services.dashboard import LiveStateHub, create_app
+    from services.event_store import EventStore
+    
+    end = date.today()
+    columns = EventStore._ROLLUP_COLUMNS
+    placeholders = ", ".join("?" * (len(columns) + 2))
+    
+    def p95(samples: List[float]) -> float:
+        samples = sorted(samples)
+        return samples[int(len(samples) * 0.95) - 1] * 1000
+    
+    print(f"\n📊 儀表板查詢（{lids} 個馬桶蓋，每端點 {requests_per_endpoint} 次，不經快取的 p95）")
+    results = {}
+    for days in history_days:
+        with tempfile.TemporaryDirectory() as data_dir:
+            store = EventStore(os.path.join(data_dir, "smartlid.db"))
+            conn = store._connect()
+            hourly_rows, daily_rows = [], []
+            for offset in range(days):
+                day = (end - timedelta(days=offset)).isoformat()
+                for lid in range(lids):
+                    hours = [[random.randint(0, 3), 0, 0.0, random.randint(0, 1), 0, 0] for _ in range(24)]
+                    for hour, counts in enumerate(hours):
+                        counts[1], counts[2] = counts[0], counts[0] * random.uniform(30, 300)
+                        hourly_rows.append((f"{day}T{hour:02d}", f"lid{lid}", *counts))
+                    daily_rows.append((day, f"lid{lid}", *[sum(values) for values in zip(*hours)]))
+            with conn:
+                conn.executemany(f"INSERT INTO hourly_stats VALUES ({placeholders})", hourly_rows)
+                conn.executemany(f"INSERT INTO daily_stats VALUES ({placeholders})", daily_rows)
+            conn.close()
+            
+            client = create_app(store, LiveStateHub(), cache_ttl=0).test_client()
+            timings = {}
+            for path in ("/api/hourly", "/api/daily?days=30", "/api/daily?days=365", "/api/lids?days=365"):
+                samples = []
+                for _ in range(requests_per_endpoint):
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    samples.append(time.perf_counter() - started)
+                    assert response.status_code == 200
+                timings[path] = p95(samples)
+            results[days] = timings
+            print(f"   歷史 {days:>5} 天（{len(hourly_rows):>7} 小時列）: " +
+                  " | ".join(f"{path} {value:.2f} ms" for path, value in timings.items()))
+            
+            # 快取命中與條件式請求
+            cached = create_app(store, LiveStateHub(), cache_ttl=60).test_client()
+            etag = cached.get("/api/daily?days=365").headers["ETag"]
+            hit, not_modified = [], []
+            for _ in range(requests_per_endpoint):
+                started = time.perf_counter()
+                cached.get("/api/daily?days=365")
+                hit.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                assert cached.get("/api/daily?days=365", headers={"If-None-Match": etag}).status_code == 304
+                not_modified.append(time.perf_counter() - started)
+    print(f"   快取命中 p95 {p95(hit):.2f} ms | 304 p95 {p95(not_modified):.2f} ms")
+    return results
+
+
+def benchmark_mqtt(events: int = 2000, lids: int = 4, ack_latency: float = 0.002, outage_events: int = 3000):
+    """
+    MQTT 發布測試（使用本機代理伺服器模擬）：
+    1. 吞吐量：比較逐則等待 PUBACK（batch_size=1）與批次在途（batch_size=100）
+    2. 離線緩衝：代理伺服器離線期間發布，超過記憶體上限的部分溢出到 SQLite，
+       重新啟動代理伺服器後量測補送時間並確認每個馬桶蓋的事件順序與數量
+    
+    Args:
+        events: 吞吐量測試的狀態數量（每則產生一則事件訊息與一則狀態訊息）
+        lids: 馬桶蓋數量
+        ack_latency: 模擬的 PUBACK 延遲（秒）
+        outage_events: 離線期間發布的狀態數量
+    """
+    import os
+    import statistics
+    import tempfile
+    from services.mqtt_publisher import MqttPublisher
+    from services.mqtt_stub_broker import MqttStubBroker
+    
+    def state(i: int) -> Dict[str, Any]:
+        return {"lid": f"lid{i % lids}", "open": i % 2 == 0, "countdown_active": False,
+                "countdown_remaining": 0.0, "daily_alert_count": i // lids, "day": "2026-01-01"}
+    
+    def wait_until(condition, timeout: float = 60.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+    
+    def event_count(broker: MqttStubBroker) -> int:
+        with broker.lock:
+            return sum(1 for message in broker.messages if message["topic"].endswith("/event"))
+    
+    print(f"\n📊 MQTT 發布（{lids} 個馬桶蓋，模擬 PUBACK 延遲 {ack_latency * 1000:.0f} ms）")
+    results: Dict[str, float] = {}
+    for batch_size in (1, 100):
+        with MqttStubBroker(ack_latency=ack_latency) as broker:
+            host, port = broker.address
+            # 緩衝足以容納整個突發量，只量測送出路徑
+            publisher = MqttPublisher(host, port, buffer_size=events, batch_size=batch_size,
+                                      discovery_prefix=None).start()
+            wait_until(publisher._connected.is_set)
+            costs = []
+            started = time.perf_counter()
+            for i in range(events):
+                call_started = time.perf_counter()
+                publisher.publish("lid_opened", state(i))
+                costs.append(time.perf_counter() - call_started)
+            wait_until(lambda: event_count(broker) >= events)
+            elapsed = time.perf_counter() - started
+            publisher.stop()
+        results[f"batch_{batch_size}"] = events / elapsed
+        print(f"   batch_size={batch_size:<3} {events / elapsed:8.0f} 則/秒 | "
+              f"publish() p99 {statistics.quantiles(costs, n=100)[98] * 1e6:.1f} µs")
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        db_path = os.path.join(data_dir, "smartlid.db")
+        broker = MqttStubBroker(ack_latency=ack_latency).start()
+        host, port = broker.address
+        publisher = MqttPublisher(host, port, db_path=db_path, buffer_size=500, reconnect_min=0.1,
+                                  reconnect_max=0.5).start()
+        wait_until(publisher._connected.is_set)
+        broker.stop()
+        wait_until(lambda: not publisher._connected.is_set())
+        
+        for i in range(outage_events):
+            publisher.publish("alert", state(i))
+        wait_until(lambda: publisher.stats["spooled"] >= outage_events - publisher.buffer_size)
+        spooled = publisher.stats["spooled"]
+        
+        broker = MqttStubBroker(host, port, ack_latency=ack_latency).start()
+        restarted = time.perf_counter()
+        delivered = wait_until(lambda: event_count(broker) >= outage_events)
+        drained = time.perf_counter() - restarted
+        publisher.stop()
+        broker.stop()
+        
+        in_order = True
+        for lid in range(lids):
+            # QoS 1 斷線重送可能重複，只比較第一次收到的順序
+            counts = list(dict.fromkeys(json.loads(message["payload"])["daily_alert_count"]
+                                        for message in broker.messages
+                                        if message["topic"] == f"smartlid/lid{lid}/event"))
+            in_order &= counts == list(range(len(range(lid, outage_events, lids))))
+        results["outage_drain_seconds"] = drained
+        print(f"   離線 {outage_events} 則（溢出到 SQLite {spooled} 則）→ 重新連線後 {drained:.2f} 秒補送完成 | "
+              f"{'順序與數量正確 ✅' if delivered and in_order else '有遺漏或亂序 ❌'}")
+    return results
+
+
+def benchmark_fleet_gateway(nodes: int = 300, events_per_frame: int = 20, connections: int = 16,
+                            seconds: float = 10.0, duplicate_ratio: float = 0.05, notify_ratio: float = 0.01):
+    """
+    車隊閘道負載測試：模擬節點以 keep-alive 連線持續上傳框架（部分框架重送以驗證去重），
+    量測持續吞吐量（事件/秒）與請求延遲（自送出到收到已提交的 ack）。
+    通知經共用的 LineMessagingService 送到本機 LINE 模擬伺服器。
+    閘道與模擬節點在同一個行程中；在單核心機器上即為單核心的結果。
+    
+    Args:
+        nodes: 模擬節點數量
+        events_per_frame: 每個框架的事件數量
+        connections: 同時上傳的連線數
+        seconds: 測試時間（秒）
+        duplicate_ratio: 重送上一個框架的比例
+        notify_ratio: 事件中通知請求的比例
+    """
+    import http.client
+    import os
+    import sqlite3
+    import statistics
+    import tempfile
+    from services.fleet_gateway import FleetGateway, FleetGatewayServer
+    from services.line_messaging import LineMessagingService
+    from services.line_stub_server import LineStubServer
+    
+    kinds = ["lid_opened", "lid_closed", "alert"]
+    
+    with tempfile.TemporaryDirectory() as data_dir, LineStubServer() as stub:
+        line_service = LineMessagingService("benchmark-token", "Ubenchmark", api_url=stub.push_url,
+                                            rate_per_hour=3600 * 1000, burst=1000, coalesce_window=0,
+                                            monthly_quota=0)
+        gateway = FleetGateway(os.path.join(data_dir, "fleet.db"), line_service).start()
+        server = FleetGatewayServer(gateway, "127.0.0.1", 0).start()
+        host, port = server._server.server_address[:2]
+        
+        sequences = {f"node{i:03d}": 0 for i in range(nodes)}
+        lock = threading.Lock()
+        latencies: List[float] = []
+        sent = {"events": 0, "unique": 0}
+        deadline = time.monotonic() + seconds
+        
+        def frame_for(node: str) -> bytes:
+            with lock:
+                start = sequences[node]
+                sequences[node] = start + events_per_frame
+            now = time.time()
+            events = []
+            for seq in range(start + 1, start + events_per_frame + 1):
+                if random.random() < notify_ratio:
+                    events.append([seq, now, "notify_alert", None, 2, "2026-01-01", f"U{node}"])
+                else:
+                    events.append([seq, now, random.choice(kinds), "lid1", seq % 5, "2026-01-01", None])
+            return json.dumps({"node": node, "events": events}, separators=(",", ":")).encode()
+        
+        def client(index: int):
+            connection = http.client.HTTPConnection(host, port)
+            own_nodes = [node for i, node in enumerate(sequences) if i % connections == index]
+            previous = None
+            while time.monotonic() < deadline:
+                duplicate = previous is not None and random.random() < duplicate_ratio
+                body = previous if duplicate else frame_for(random.choice(own_nodes))
+                started = time.perf_counter()
+                connection.request("POST", "/v1/frames", body, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                assert response.status == 200
+                with lock:
+                    latencies.append(elapsed)
+                    sent["events"] += events_per_frame
+                    sent["unique"] += 0 if duplicate else events_per_frame
+                previous = body
+            connection.close()
+        
+        workers = [threading.Thread(target=client, args=(i,)) for i in range(connections)]
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        
+        # 等待通知送完
+        time.sleep(0.5)
+        server.stop()
+        gateway.stop()
+        line_service.close()
+        conn = sqlite3.connect(os.path.join(data_dir, "fleet.db"))
+        stored = conn.execute("SELECT COUNT(*) FROM fleet_events").fetchone()[0]
+        conn.close()
+    
+    quantiles = statistics.quantiles(latencies, n=100)
+    stats = gateway.stats
+    print(f"\n📊 車隊閘道負載（{nodes} 個節點、{connections} 條連線、每框架 {events_per_frame} 筆、{seconds:.0f} 秒，"
+          f"CPU 核心 {os.cpu_count()}）")
+    print(f"   持續吞吐: {sent['events'] / elapsed:,.0f} 事件/秒（{len(latencies) / elapsed:,.0f} 框架/秒）"
+          f" | 行程 CPU {cpu / elapsed * 100:.0f}%")
+    print(f"   請求延遲: p50 {quantiles[49] * 1000:.2f} ms | p99 {quantiles[98] * 1000:.2f} ms")
+    print(f"   每次提交平均 {stats['frames'] / max(1, stats['commits']):.1f} 個框架 | 去除重複 {stats['duplicates']} 筆"
+          f" | 寫入 {stored}/{sent['unique']} 筆 {'✅' if stored == sent['unique'] else '❌'}"
+          f" | LINE 通知 {stats['notifications']} 則（模擬伺服器收到 {len(stub.requests)} 則）")
+    return {"events_per_second": sent["events"] / elapsed, "p50": quantiles[49], "p99": quantiles[98]}
+
+
+def benchmark_line_multicast(counts: Sequence[int] = (1, 10, 50, 200, 1000), latency: float = 0.02,
+                             sequential_limit: int = 200):
+    """
+    比較「逐一 Push」與「Multicast 分組 + 並行」發送給 N 位收件者的 HTTP 請求數與耗時，並驗證逐一收件者的失敗回報
+    
+    Args:
+        counts: 收件者人數
+        latency: 模擬伺服器的處理延遲（秒）
+        sequential_limit: 逐一 Push 只測到此人數（避免耗時過久）
+    """
+    from services.line_messaging import ALERT_TEMPLATE, LineMessagingService
+    from services.line_stub_server import LineStubServer
+    
+    message = ALERT_TEMPLATE.render(alert_count=3, today_date="2025-01-01")
+    results = {}
+    with LineStubServer(latency=latency) as stub:
+        service = LineMessagingService("benchmark-token", "Ubenchmark", api_url=stub.push_url)
+        print(f"\n📊 LINE 多位收件者發送（模擬伺服器延遲 {latency * 1000:.0f} ms）")
+        print(f"{'人數':>6} | {'逐一 Push':>20} | {'Multicast':>20}")
+        for count in counts:
+            recipients = [f"U{index:032x}" for index in range(count)]
+            row = {}
+            if count <= sequential_limit:
+                stub.requests.clear()
+                started = time.perf_counter()
+                for recipient in recipients:
+                    service._push([message], "", recipient)
+                row["sequential"] = (len(stub.requests), time.perf_counter() - started)
+            stub.requests.clear()
+            started = time.perf_counter()
+            report = service.multicast([message], "", recipients)
+            row["multicast"] = (len(stub.requests), time.perf_counter() - started)
+            assert report.ok and len(report.delivered) == count
+            results[count] = row
+            
+            cells = [f"{row[mode][0]:5d} 請求 {row[mode][1] * 1000:8.1f} ms" if mode in row else f"{'—':>20}"
+                     for mode in ("sequential", "multicast")]
+            print(f"{count:>6} | {cells[0]} | {cells[1]}")
+        
+        # 失敗回報：兩位無效使用者與一個群組混在 600 位收件者中
+        recipients = [f"U{index:032x}" for index in range(600)] + ["Cgroup"]
+        stub.invalid_recipients = {recipients[3], recipients[550]}
+        stub.requests.clear()
+        report = service.multicast([message], "", recipients)
+        assert sorted(report.failed) == sorted(stub.invalid_recipients)
+        assert len(report.delivered) == len(recipients) - 2 and "Cgroup" in report.delivered
+        print(f"\n✅ 失敗回報：{len(report.delivered)} 位送達、{len(report.failed)} 位無效，"
+              f"共 {report.requests} 個請求（{len(stub.requests)} 個到達伺服器）")
+        service.close()
+    return results
+
+
+def load_recorded_payloads(path: str) -> List[bytes]:
+    """讀取 record_path 保存的請求內容"""
+    with open(path, encoding="utf-8") as recorded:
+        return [json.loads(line).encode("utf-8") for line in recorded if line.strip()]
+
+
+def _synthetic_payloads(count: int, seed: int = 1) -> List[bytes]:
+    """內部函式：產生 LINE 格式的 Webhook 請求內容（每個 1～3 個事件，約 4% 為重送）"""
+    rng = random.Random(seed)
+    texts = ("今天", "本週", "狀態", "today", "Status", "你好")
+    payloads: List[bytes] = []
+    for index in range(count):
+        if payloads and index % 25 == 24:
+            # 模擬 LINE 重送：內容相同，只有 isRedelivery 不同
+            payloads.append(payloads[rng.randrange(len(payloads))].replace(
+                b'"isRedelivery":false', b'"isRedelivery":true'))
+            continue
+        events = []
+        for _ in range(rng.randint(1, 3)):
+            user = f"U{rng.getrandbits(128):032x}"
+            events.append({
+                "type": "message",
+                "message": {"type": "text", "id": str(rng.getrandbits(60)), "text": rng.choice(texts)},
+                "webhookEventId": str(uuid.UUID(int=rng.getrandbits(128))),
+                "deliveryContext": {"isRedelivery": False},
+                "timestamp": int(time.time() * 1000),
+                "source": {"type": "user", "userId": user},
+                "replyToken": f"{rng.getrandbits(128):032x}",
+                "mode": "active",
+            })
+        payloads.append(json.dumps({"destination": "Ubenchmark", "events": events},
+                                   ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    return payloads
+
+
+def _replay_client(pipe, payloads: List[bytes], secret: str, burst: int, interval: float, latency: float):
+    """
+    內部函式：重播用的用戶端與 LINE 模擬伺服器（在另一個程序中執行，不與 Webhook 伺服器爭用 GIL）
+    
+    以 asyncio 維持 burst 條 keep-alive 連線送出請求。經由 pipe 先送出模擬伺服器的 Push 網址，
+    收到 (Webhook 網址, 預期回覆數) 後開始重播，最後送回
+    (各請求回應 200 的延遲（秒）, replyToken → 送出時間（time.time()）, 錯誤簽章請求的狀態碼, 模擬伺服器收到的請求)。
+    """
+    from urllib.parse import urlsplit
+    from services.line_stub_server import LineStubServer
+    
+    stub = LineStubServer(latency=latency).start()
+    pipe.send(stub.push_url)
+    url, expected_replies = pipe.recv()
+    target = urlsplit(url)
+    
+    async def post(connection, payload: bytes, signature: Optional[str] = None) -> Tuple[int, float]:
+        reader, writer = connection
+        signature = signature or base64.b64encode(hmac.new(secret.encode(), payload, hashlib.sha256).digest()).decode()
+        started = time.perf_counter()
+        writer.write(f"POST {target.path} HTTP/1.1\r\nHost: {target.netloc}\r\nContent-Type: application/json\r\n"
+                     f"X-Line-Signature: {signature}\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        return status, time.perf_counter() - started
+    
+    async def replay():
+        connections = [await asyncio.open_connection(target.hostname, target.port) for _ in range(burst)]
+        acks: List[float] = []
+        sent: Dict[str, float] = {}
+        for offset in range(0, len(payloads), burst):
+            chunk = payloads[offset:offset + burst]
+            now = time.time()
+            for payload in chunk:
+                for event in json.loads(payload)["events"]:
+                    sent.setdefault(event.get("replyToken"), now)
+            for status, elapsed in await asyncio.gather(*map(post, connections, chunk)):
+                assert status == 200, status
+                acks.append(elapsed)
+            await asyncio.sleep(interval)
+        rejected = [status for status, _ in await asyncio.gather(
+            *(post(connection, payload, "invalid") for connection, payload in zip(connections, payloads[:5])))]
+        for _, writer in connections:
+            writer.close()
+        return acks, sent, rejected
+    
+    acks, sent, rejected = asyncio.run(replay())
+    deadline = time.monotonic() + 30
+    while len(stub.requests) < expected_replies and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stub.stop()
+    pipe.send((acks, sent, rejected, stub.requests))
+
+
+def benchmark_line_webhook(payloads_path: Optional[str] = None, requests_count: int = 1000, burst: int = 50,
+                           interval: float = 0.5, latency: float = 0.02, workers: int = 8,
+                           target_p99_ms: float = 50.0):
+    """
+    重播 Webhook 請求：以突發並行的方式送入伺服器，量測回應 200 的延遲與回覆送達的延遲，
+    並驗證每個事件只回覆一次、內容對應查詢、重送的事件被略過、錯誤簽章被拒絕
+    
+    用戶端在另一個程序中執行；同時在伺服器程序以 5 ms 週期睡眠的執行緒，
+    量測突發期間一般執行緒（如控制器）被延遲的程度。
+    
+    Args:
+        payloads_path: 錄製的請求內容（LINE_WEBHOOK_RECORD_PATH），未指定時使用合成的請求
+        requests_count: 合成請求的數量
+        burst: 同時送出的請求數
+        interval: 每次突發之間的間隔（秒）
+        latency: 模擬 LINE API 的處理延遲（秒）
+        workers: 回覆執行緒數量（同 LINE 連線池大小）
+        target_p99_ms: 回應 200 的 p99 目標（毫秒）
+    """
+    import multiprocessing
+    import tempfile
+    from services.dashboard import LiveStateHub
+    from services.event_store import EventStore
+    from services.line_messaging import LineMessagingService
+    from services.line_webhook import LineWebhookServer, StatsResponder
+    
+    def percentile(samples: List[float], q: float) -> float:
+        samples = sorted(samples)
+        return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+    
+    payloads = load_recorded_payloads(payloads_path) if payloads_path else _synthetic_payloads(requests_count)
+    secret = "benchmark-secret"
+    
+    # 預期每個事件（依 webhookEventId）恰好回覆一次
+    responder = StatsResponder()
+    expected: Dict[str, Optional[str]] = {}
+    seen_events = set()
+    for payload in payloads:
+        for event in json.loads(payload)["events"]:
+            if event.get("webhookEventId") in seen_events:
+                continue
+            seen_events.add(event.get("webhookEventId"))
+            if event.get("type") == "message" and event["message"].get("type") == "text":
+                expected[event["replyToken"]] = responder.parse(event["message"]["text"])
+    headers_for = {None: "可以問我", "today": "今日統計", "week": "近 7 日統計", "status": "目前狀態"}
+    
+    pipe, child_pipe = multiprocessing.Pipe()
+    client = multiprocessing.Process(target=_replay_client, daemon=True,
+                                     args=(child_pipe, payloads, secret, burst, interval, latency))
+    client.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        event_store = EventStore(str(Path(tmp) / "events.db")).start()
+        state_hub = LiveStateHub()
+        for index, lid in enumerate(("1F", "2F", "3F", "4F")):
+            for _ in range(10 + index):
+                event_store.record(EventStore.LID_OPENED, lid)
+            for _ in range(index):
+                event_store.record(EventStore.ALERT, lid, status="stage1")
+            state_hub.publish("lid_closed", {"lid": lid, "open": index == 0, "countdown_active": index == 0,
+                                             "countdown_remaining": 42.0, "daily_alert_count": index,
+                                             "day": date.today().isoformat()})
+        event_store.flush()
+        
+        service = LineMessagingService("benchmark-token", "Ubenchmark", api_url=pipe.recv(), pool_size=workers)
+        server = LineWebhookServer(secret, service, StatsResponder(event_store, state_hub), host="127.0.0.1",
+                                   port=0, workers=workers).start()
+        
+        # 控制器執行緒的代理：週期睡眠，量測被延遲的時間
+        lag: List[float] = []
+        probing = threading.Event()
+        
+        def probe():
+            while not probing.is_set():
+                started = time.perf_counter()
+                time.sleep(0.005)
+                lag.append(time.perf_counter() - started - 0.005)
+        
+        probe_thread = threading.Thread(target=probe, daemon=True)
+        probe_thread.start()
+        
+        started = time.perf_counter()
+        pipe.send((server.url, len(expected)))
+        acks, sent, rejected, stub_requests = pipe.recv()
+        elapsed = time.perf_counter() - started
+        client.join()
+        probing.set()
+        probe_thread.join()
+        server.stop()
+        service.close()
+        event_store.stop()
+    
+    replies = {request["payload"]["replyToken"]: request for request in stub_requests}
+    assert len(stub_requests) == len(expected) == len(replies), (len(stub_requests), len(expected))
+    for token, command in expected.items():
+        text = replies[token]["payload"]["messages"][0]["text"]
+        assert headers_for[command] in text, (command, text)
+    assert rejected == [401] * 5, rejected
+    reply_latency = [replies[token]["received"] - sent[token] for token in expected]
+    
+    ack_p99 = percentile(acks, 0.99)
+    print(f"\n📊 LINE Webhook 重播（{len(payloads)} 個請求、{len(expected)} 則回覆，每 {interval * 1000:.0f} ms 突發 "
+          f"{burst} 個，模擬 LINE API 延遲 {latency * 1000:.0f} ms）")
+    print(f"   回應 200: p50 {percentile(acks, 0.5):6.2f} ms | p99 {ack_p99:6.2f} ms "
+          f"{'✅' if ack_p99 <= target_p99_ms else '❌'}（目標 p99 ≤ {target_p99_ms:.0f} ms）｜"
+          f"{len(payloads) / elapsed:,.0f} 請求/秒")
+    print(f"   回覆送達: p50 {percentile(reply_latency, 0.5):6.1f} ms | p99 {percentile(reply_latency, 0.99):6.1f} ms")
+    print(f"   週期執行緒延遲: p99 {percentile(lag, 0.99):6.2f} ms | 最大 {max(lag) * 1000:6.2f} ms")
+    print(f"   重送略過 {server.stats['duplicates']} 個事件｜錯誤簽章拒絕 {server.stats['rejected']} 個｜"
+          f"快取命中 {server.responder.cache.stats['hits']} / 未命中 {server.responder.cache.stats['misses']}")
+    return {"ack": acks, "reply": reply_latency, "lag": lag, "stats": dict(server.stats)}
+
+
+def run_benchmarks(output: Optional[str] = None, baseline: Optional[str] = None,
+                   iterations: int = 200) -> Dict[str, Any]:
+    """
+    執行完整的熱路徑效能測試並輸出 JSON
+    
+    Args:
+        output: 結果 JSON 路徑（預設為 LOGS_DIR/benchmarks/benchmark-<時間>.json）
+        baseline: 先前結果的 JSON 路徑（選用），提供時列出差異並記錄於 report["regressions"]
+        iterations: 開合與推播的測試次數
+    """
+    memory_before = _memory()
+    started = time.perf_counter()
+    with _quiet():
+        results = {
+            "edge_callback": bench_edge_callback(iterations),
+            "edge_callback_debounced": bench_edge_callback(iterations // 4, stable_time=Config.REED_STABLE_TIME),
+            "alert_path": bench_alert_path(),
+            "line": bench_line(iterations),
+        }
+    results["memory"] = {"before": memory_before, "after": _memory()}
+    
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "elapsed_s": time.perf_counter() - started,
+        "results": results,
+    }
+    
+    path = Path(output) if output else (
+        Config.LOGS_DIR / "benchmarks" / f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    
+    edge, alert, line = results["edge_callback"], results["alert_path"], results["line"]
+    print(f"\n📊 提醒熱路徑效能測試（{report['elapsed_s']:.1f} 秒）→ {path}")
+    print(f"   開合事件: p50 {edge['p50_ms']:.3f} ms | p99 {edge['p99_ms']:.3f} ms")
+    print(f"   計時器誤差: p50 {alert['timer_jitter']['p50_ms']:.3f} ms | p99 {alert['timer_jitter']['p99_ms']:.3f} ms")
+    for name, stats in alert["action_start"].items():
+        print(f"   {name:<6} 啟動延遲: p50 {stats['p50_ms']:.3f} ms | p99 {stats['p99_ms']:.3f} ms")
+    print(f"   馬達動作額外時間: p50 {alert['servo_sequence']['overhead']['p50_ms']:.2f} ms")
+    print(f"   LINE 推播: p50 {line['latency']['p50_ms']:.2f} ms | {line['throughput_per_s']:.0f} 則/秒")
+    print(f"   常駐記憶體: {results['memory']['after'].get('rss_kb', 0) / 1024:.1f} MB")
+    
+    if baseline:
+        report["regressions"] = compare_results(baseline, str(path))
+    return report
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """內部函式：將巢狀結果攤平為 路徑 → 數值"""
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare_results(baseline_path: str, current_path: str, tolerance: float = 0.10,
+                    min_delta_ms: float = 0.05) -> List[str]:
+    """
+    比較兩次結果，列出變化超過 tolerance 的指標
+    
+    延遲（*_ms）與記憶體（*_kb）增加、吞吐量（*_per_s）下降視為退步。
+    
+    Args:
+        baseline_path: 先前結果的 JSON 路徑
+        current_path: 本次結果的 JSON 路徑
+        tolerance: 變化比例門檻
+        min_delta_ms: 延遲指標的最小絕對差（毫秒）
+    
+    Returns:
+        List[str]: 退步的指標路徑
+    """
+    baseline = _flatten(json.loads(Path(baseline_path).read_text())["results"])
+    current = _flatten(json.loads(Path(current_path).read_text())["results"])
+    
+    regressions = []
+    print(f"\n📈 與基準比較（{baseline_path}，門檻 {tolerance:.0%}）")
+    for path, value in current.items():
+        old = baseline.get(path)
+        if not old or not (path.endswith("_ms") or path.endswith("_kb") or path.endswith("_per_s")):
+            continue
+        change = (value - old) / abs(old)
+        # 次毫秒等級的延遲受排程雜訊影響大，絕對差小於 min_delta_ms 時不列出
+        if abs(change) < tolerance or (path.endswith("_ms") and abs(value - old) < min_delta_ms):
+            continue
+        worse = change < 0 if path.endswith("_per_s") else change > 0
+        if worse:
+            regressions.append(path)
+        print(f"   {'❌' if worse else '✅'} {path}: {old:.3f} → {value:.3f} ({change:+.0%})")
+    if not regressions:
+        print("   沒有退步的指標")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartLid 提醒熱路徑效能測試")
+    parser.add_argument("--output", help="結果 JSON 路徑")
+    parser.add_argument("--baseline", help="用於比較的先前結果 JSON 路徑")
+    parser.add_argument("--iterations", type=int, default=200, help="開合與推播的測試次數")
+    args = parser.parse_args()
+    report = run_benchmarks(args.output, args.baseline, args.iterations)
+    # 有退步的指標時以非零狀態結束，方便在腳本中判斷
+    sys.exit(1 if report.get("regressions") else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+模擬硬體驅動模組
+提供與 gpiozero 輸入裝置、RPi.GPIO PWM、pygame 音效及 LINE 服務相容的模擬實作，
+讓控制邏輯可在一般 Linux 環境中執行與測試
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SimInputDevice:
+    """模擬的數位輸入腳位（介面同 gpiozero.DigitalInputDevice 中 ReedSwitch 使用的部分）"""
+    
+    def __init__(self, pin: int, value: int = 0):
+        """
+        Args:
+            pin: 模擬的 GPIO 針腳號碼
+            value: 初始電位
+        """
+        self.pin = pin
+        self.value = value
+        self.when_activated: Optional[Callable] = None
+        self.when_deactivated: Optional[Callable] = None
+        self._changed = threading.Condition()
+    
+    @property
+    def is_active(self) -> bool:
+        return self.value == 1
+    
+    def drive(self, value: int):
+        """
+        設定電位；電位改變時在呼叫端執行緒中同步觸發對應的回調函數
+        
+        Args:
+            value: 1 = HIGH，0 = LOW
+        """
+        with self._changed:
+            if value == self.value:
+                return
+            self.value = value
+            self._changed.notify_all()
+        callback = self.when_activated if value == 1 else self.when_deactivated
+        if callback is not None:
+            callback()
+    
+    def drive_high(self):
+        self.drive(1)
+    
+    def drive_low(self):
+        self.drive(0)
+    
+    def wait_for_active(self, timeout: Optional[float] = None) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self.value == 1, timeout)
+    
+    def wait_for_inactive(self, timeout: Optional[float] = None) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self.value == 0, timeout)
+    
+    def close(self):
+        self.when_activated = None
+        self.when_deactivated = None
+
+
+class SimPWM:
+    """
+    模擬的 PWM 輸出（介面同 RPi.GPIO.PWM），記錄每次佔空比變更
+    
+    emulate_thread=True 時，start() 到 stop() 之間以背景執行緒重現 RPi.GPIO 軟體 PWM
+    每個週期喚醒兩次的負載，用於量測閒置 CPU。
+    """
+    
+    def __init__(self, pin: int, frequency: float = 50, clock: Callable[[], float] = time.monotonic,
+                 emulate_thread: bool = False):
+        """
+        Args:
+            pin: 模擬的 GPIO 針腳號碼
+            frequency: PWM 頻率（Hz）
+            clock: 記錄變更時間使用的時鐘
+            emulate_thread: 是否以背景執行緒模擬軟體 PWM
+        """
+        self.pin = pin
+        self.frequency = frequency
+        self.clock = clock
+        self.emulate_thread = emulate_thread
+        self.duty_cycle = 0.0
+        self.running = False
+        self.starts = 0
+        # (時間, 佔空比)；只保留最近的變更，避免長時間模擬時記憶體增長
+        self.history = deque(maxlen=1000)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self, duty_cycle: float):
+        self.running = True
+        self.starts += 1
+        self.ChangeDutyCycle(duty_cycle)
+        if self.emulate_thread and self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._toggle_loop, name=f"smartlid-softpwm{self.pin}",
+                                            daemon=True)
+            self._thread.start()
+    
+    def _toggle_loop(self):
+        """模擬軟體 PWM 執行緒：每個週期在高、低電位各等待一次"""
+        while not self._stopped.is_set():
+            period = 1.0 / self.frequency
+            high = period * self.duty_cycle / 100
+            for wait in (high, period - high):
+                if wait > 0:
+                    time.sleep(wait)
+    
+    def ChangeDutyCycle(self, duty_cycle: float):
+        self.duty_cycle = duty_cycle
+        self.history.append((self.clock(), duty_cycle))
+    
+    def ChangeFrequency(self, frequency: float):
+        self.frequency = frequency
+    
+    def stop(self):
+        self.running = False
+        self.duty_cycle = 0.0
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+    
+    def close(self):
+        self.stop()
+
+
+class SimAudioController:
+    """
+    模擬的音效控制器（介面同 AudioController）
+    
+    realtime=True 時依 sound_length 實際等待，模擬真實的播放時間；
+    False 時立即返回，用於虛擬時鐘重播。
+    """
+    
+    def __init__(self, sound_files: Optional[Iterable[str]] = None, sound_length: float = 2.0,
+                 realtime: bool = True):
+        """
+        Args:
+            sound_files: 預先載入的音效檔案清單（僅記錄）
+            sound_length: 每個音效的模擬長度（秒）
+            realtime: 是否實際等待播放時間
+        """
+        self.sound_length = sound_length
+        self.realtime = realtime
+        self.played: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        logger.info("HW: 模擬音效系統已初始化。")
+        if sound_files:
+            self.preload(sound_files)
+    
+    def preload(self, filenames: Iterable[str]) -> int:
+        return len(list(filenames))
+    
+    def unload(self, filenames: Iterable[str]) -> int:
+        return len(list(filenames))
+    
+    def _count(self, filename: str):
+        with self._lock:
+            self.played[filename] = self.played.get(filename, 0) + 1
+    
+    def play_sound(self, filename: str, blocking: bool = True,
+                   cancel_event: Optional[threading.Event] = None) -> bool:
+        """模擬播放音效"""
+        self._count(filename)
+        if blocking and self.realtime:
+            waiter = cancel_event if cancel_event is not None else threading.Event()
+            if waiter.wait(self.sound_length):
+                return False
+        return True
+    
+    async def play_sound_async(self, filename: str) -> bool:
+        """模擬播放音效（asyncio 版本）"""
+        self._count(filename)
+        if self.realtime:
+            await asyncio.sleep(self.sound_length)
+        return True
+    
+    def play_alert1(self, sound_file: str, cancel_event: Optional[threading.Event] = None) -> bool:
+        return self.play_sound(sound_file, blocking=True, cancel_event=cancel_event)
+    
+    def play_alert2(self, sound_file: str, cancel_event: Optional[threading.Event] = None) -> bool:
+        return self.play_sound(sound_file, blocking=True, cancel_event=cancel_event)
+    
+    def stop(self):
+        pass
+    
+    def cleanup(self):
+        logger.info("HW: 模擬音效系統已清理。")
+
+
+class SimLineService:
+    """模擬的 LINE 通知服務（介面同 LineMessagingService 中控制器使用的部分），只記錄呼叫"""
+    
+    def __init__(self):
+        self.alerts: List[tuple] = []
+        self.summaries: List[tuple] = []
+        self._lock = threading.Lock()
+    
+    def send_alert(self, alert_count: int, today_date: Optional[str] = None, to: Optional[str] = None) -> bool:
+        with self._lock:
+            self.alerts.append((alert_count, today_date, to))
+        return True
+    
+    def end_of_day(self, day: str, total_count: int, to: Optional[str] = None) -> bool:
+        with self._lock:
+            self.summaries.append((day, total_count, to))
+        return True
+    
+    def send_daily_summary(self, date: str, total_count: int, to: Optional[str] = None) -> bool:
+        return self.end_of_day(date, total_count, to)
+    
+    def enable_spool(self, *args, **kwargs):
+        pass
+    
+    def use_async_transport(self, loop):
+        pass
+    
+    def get_push_stats(self) -> Dict[str, int]:
+        return {"alerts": len(self.alerts), "summaries": len(self.summaries)}
+    
+    def close(self):
+        pass
+    
+    async def close_async(self):
+        pass
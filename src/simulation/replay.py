@@ -0,0 +1,337 @@
+"""
+事件重播模組
+以虛擬時鐘將錄製或合成的開合事件送入 SmartLidController，加速驗證計時、計數與提醒邏輯
+"""
+import contextlib
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from controllers.action_executor import ActionExecutor, InlineExecutor
+from controllers.lid_controller import LidController
+from main import SmartLidController
+from simulation.drivers import SimAudioController, SimLineService
+from utils.scheduler import VirtualScheduler
+
+# 事件格式：(虛擬時間秒數, 馬桶蓋名稱, 電位)，時間 0 為起始日的午夜
+TraceEvent = Tuple[float, str, int]
+
+
+def synthetic_trace(lids: int = 20, days: int = 14, opens_per_day: int = 15,
+                    forget_ratio: float = 0.1, timeout: float = 60, seed: int = 1) -> List[TraceEvent]:
+    """
+    產生合成的開合事件
+    
+    Args:
+        lids: 馬桶蓋數量
+        days: 天數
+        opens_per_day: 每個馬桶蓋每天的開蓋次數
+        forget_ratio: 忘記放下（開蓋超過逾時）的比例
+        timeout: 開蓋逾時（秒），用於決定開蓋時間長短
+        seed: 亂數種子（相同種子產生相同事件）
+    
+    Returns:
+        List[TraceEvent]: 依時間排序的事件
+    """
+    rng = random.Random(seed)
+    trace: List[TraceEvent] = []
+    for index in range(lids):
+        name = f"lid{index + 1}"
+        available_at = 0.0
+        for day in range(days):
+            day_start = day * 86400
+            # 開蓋集中在 06:00–23:00
+            for opened_at in sorted(rng.uniform(day_start + 6 * 3600, day_start + 23 * 3600)
+                                    for _ in range(opens_per_day)):
+                if opened_at < available_at:
+                    continue
+                if rng.random() < forget_ratio:
+                    hold = rng.uniform(timeout * 1.05, timeout * 30)
+                else:
+                    hold = rng.uniform(3, timeout * 0.9)
+                trace.append((opened_at, name, 1))
+                trace.append((opened_at + hold, name, 0))
+                available_at = opened_at + hold + 1
+    trace.sort(key=lambda event: event[0])
+    return trace
+
+
+def trace_from_event_store(db_path: Optional[str] = None) -> Tuple[date, List[TraceEvent]]:
+    """
+    由事件紀錄（EventStore 的 lid_events）讀取實際的開合事件
+    
+    Args:
+        db_path: SQLite 資料庫路徑（預設為 DB_PATH）
+    
+    Returns:
+        Tuple[date, List[TraceEvent]]: 起始日期與依時間排序的事件
+    """
+    conn = sqlite3.connect(db_path or Config.DB_PATH)
+    try:
+        rows = conn.execute(
+            "SELECT ts, lid, kind FROM lid_events WHERE kind IN ('lid_opened', 'lid_closed') ORDER BY ts"
+        ).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return date.today(), []
+    
+    start_date = datetime.fromtimestamp(rows[0][0]).date()
+    midnight = datetime.combine(start_date, datetime.min.time()).timestamp()
+    return start_date, [(ts - midnight, lid, 1 if kind == "lid_opened" else 0) for ts, lid, kind in rows]
+
+
+class _ReplayLid(LidController):
+    """記錄每次提醒結果與處理成本的馬桶蓋控制器"""
+    
+    def __init__(self, *args, recorder: List[Dict[str, Any]], **kwargs):
+        super().__init__(*args, on_alert=self._on_replay_alert, **kwargs)
+        self.recorder = recorder
+        self._batch = None
+    
+    def _on_replay_alert(self, lid, batch):
+        self._batch = batch
+    
+    def trigger_alert_and_push(self, deadline: Optional[float] = None):
+        self._batch = None
+        started = time.perf_counter()
+        super().trigger_alert_and_push(deadline)
+        cost = time.perf_counter() - started
+        if self._batch is not None:
+            self.recorder.append({
+                "lid": self.name,
+                "fired_at": self.clock(),
+                "deadline": deadline,
+                "stage": "stage2" if "line" in self._batch.results else "stage1",
+                "cost": cost,
+                "latencies": {
+                    name: result.latency_from(self._batch.origin)
+                    for name, result in self._batch.results.items()
+                },
+            })
+
+
+class ReplayController(SmartLidController):
+    """以虛擬時鐘、模擬硬體與同步動作執行的 SmartLidController"""
+    
+    def __init__(self, start_date: date):
+        """
+        Args:
+            start_date: 虛擬時間 0 所對應的日期
+        """
+        self.start_date = start_date
+        self.alerts: List[Dict[str, Any]] = []
+        super().__init__()
+    
+    def _create_scheduler(self):
+        return VirtualScheduler()
+    
+    def _create_audio(self, sound_files):
+        return SimAudioController(sound_files=sound_files, realtime=False)
+    
+    def _create_line_service(self):
+        return SimLineService()
+    
+    def _create_action_executor(self, lid_count: int) -> ActionExecutor:
+        return ActionExecutor(clock=self.scheduler.clock, pool=InlineExecutor())
+    
+    def _create_lid(self, **kwargs) -> LidController:
+        return _ReplayLid(recorder=self.alerts, today=self.virtual_today, **kwargs)
+    
+    def virtual_today(self) -> date:
+        """虛擬時鐘對應的日期"""
+        return self.start_date + timedelta(days=int(self.scheduler.now // 86400))
+
+
+def _expected_alerts(trace: List[TraceEvent], timeout: float, threshold: int,
+                     start_date: date) -> List[Tuple[str, float, str]]:
+    """內部函式：由事件直接推算應發生的提醒 (馬桶蓋, 時間, 階段)"""
+    opened: Dict[str, float] = {}
+    end = trace[-1][0] + timeout + 1 if trace else 0
+    fires: List[Tuple[str, float]] = []
+    for t, lid, value in trace:
+        if value == 1 and lid not in opened:
+            opened[lid] = t
+        elif value == 0 and lid in opened:
+            opened_at = opened.pop(lid)
+            if t - opened_at >= timeout:
+                fires.append((lid, opened_at + timeout))
+    for lid, opened_at in opened.items():
+        if opened_at + timeout <= end:
+            fires.append((lid, opened_at + timeout))
+    
+    fires.sort(key=lambda fire: fire[1])
+    daily: Dict[Tuple[str, date], int] = {}
+    expected = []
+    for lid, fired_at in fires:
+        day = start_date + timedelta(days=int(fired_at // 86400))
+        daily[(lid, day)] = daily.get((lid, day), 0) + 1
+        expected.append((lid, fired_at, "stage1" if daily[(lid, day)] < threshold else "stage2"))
+    return expected
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    """內部函式：中位數、p99 與最大值"""
+    if not samples:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+    samples = sorted(samples)
+    return {
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "max": samples[-1],
+    }
+
+
+def replay_trace(trace: List[TraceEvent], timeout: float = 60, threshold: int = 2,
+                 start_date: Optional[date] = None) -> Dict[str, Any]:
+    """
+    以虛擬時鐘重播開合事件，驗證計時準確度、提醒次數與階段，並量測各階段處理時間
+    
+    控制器使用模擬硬體（防彈跳關閉、馬達時間為 0、音效立即結束）與模擬 LINE 服務，
+    提醒動作在計時器回呼中同步執行。
+    
+    Args:
+        trace: 依時間排序的事件
+        timeout: 開蓋逾時（秒），取代 LID_OPEN_TIMEOUT
+        threshold: Stage 2 門檻，取代 DAILY_ALERT_THRESHOLD
+        start_date: 虛擬時間 0 所對應的日期（預設為今天）
+    
+    Returns:
+        Dict[str, Any]: 重播報告
+    """
+    start_date = start_date or date.today()
+    lid_names = sorted({lid for _, lid, _ in trace})
+    edge_costs: List[float] = []
+    
+    overrides = {
+        "HARDWARE_BACKEND": "sim",
+        "REED_STABLE_TIME": 0.0,
+        "SERVO_MOVE_TIME": 0.0,
+        "SERVO_STABILIZE_TIME": 0.0,
+        "SERVO_PUSH_HOLD_TIME": 0.0,
+        # 伺服馬達以實際時間等待蓋子放下，虛擬時間重播中使用開迴路
+        "SERVO_CLOSED_LOOP": False,
+        "LID_OPEN_TIMEOUT": timeout,
+        "DAILY_ALERT_THRESHOLD": threshold,
+        "EVENT_STORE_ENABLED": False,
+        "STATE_STORE_ENABLED": False,
+        "METRICS_ENABLED": False,
+        "LIDS": ",".join(f"{name}:{index}:{index}" for index, name in enumerate(lid_names)),
+    }
+    started = time.perf_counter()
+    with Config.override(**overrides), open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        controller = ReplayController(start_date)
+        for lid in controller.lids.values():
+            lid.bind()
+            lid.check_initial_state()
+        
+        for t, name, value in trace:
+            controller.scheduler.advance_to(t)
+            device = controller.lids[name].reed_switch.device
+            edge_started = time.perf_counter()
+            device.drive(value)
+            edge_costs.append(time.perf_counter() - edge_started)
+        end = trace[-1][0] + timeout + 1 if trace else 0
+        controller.scheduler.advance_to(end)
+    elapsed = time.perf_counter() - started
+    
+    # 比對實際與推算的提醒（各馬桶蓋依時間順序逐一配對）
+    expected = _expected_alerts(trace, timeout, threshold, start_date)
+    expected_by_lid: Dict[str, List[Tuple[float, str]]] = {}
+    for lid, fired_at, stage in expected:
+        expected_by_lid.setdefault(lid, []).append((fired_at, stage))
+    actual_by_lid: Dict[str, List[Dict[str, Any]]] = {}
+    for alert in controller.alerts:
+        actual_by_lid.setdefault(alert["lid"], []).append(alert)
+    
+    errors: List[float] = []
+    missed = spurious = wrong_stage = 0
+    for lid in set(expected_by_lid) | set(actual_by_lid):
+        wanted, fired = expected_by_lid.get(lid, []), actual_by_lid.get(lid, [])
+        i = j = 0
+        while i < len(wanted) and j < len(fired):
+            diff = fired[j]["fired_at"] - wanted[i][0]
+            if abs(diff) <= 1.0:
+                errors.append(abs(diff))
+                if fired[j]["stage"] != wanted[i][1]:
+                    wrong_stage += 1
+                i += 1
+                j += 1
+            elif diff < 0:
+                spurious += 1
+                j += 1
+            else:
+                missed += 1
+                i += 1
+        missed += len(wanted) - i
+        spurious += len(fired) - j
+    
+    stage_costs: Dict[str, List[float]] = {"stage1": [], "stage2": []}
+    action_latencies: Dict[str, List[float]] = {}
+    for alert in controller.alerts:
+        stage_costs[alert["stage"]].append(alert["cost"])
+        for name, latency in alert["latencies"].items():
+            if latency is not None:
+                action_latencies.setdefault(name, []).append(latency)
+    
+    virtual_span = end
+    report = {
+        "lids": len(lid_names),
+        "events": len(trace),
+        "virtual_days": virtual_span / 86400,
+        "elapsed": elapsed,
+        "speedup": virtual_span / elapsed if elapsed > 0 else 0.0,
+        "alerts": {
+            "expected": len(expected),
+            "actual": len(controller.alerts),
+            "stage1": len(stage_costs["stage1"]),
+            "stage2": len(stage_costs["stage2"]),
+            "missed": missed,
+            "spurious": spurious,
+            "wrong_stage": wrong_stage,
+            "line_pushes": len(controller.line_service.alerts),
+            "daily_summaries": len(controller.line_service.summaries),
+        },
+        "timer_error": _percentiles(errors),
+        "edge_cost": _percentiles(edge_costs),
+        "stage_cost": {stage: _percentiles(costs) for stage, costs in stage_costs.items()},
+        "action_latency": {name: _percentiles(samples) for name, samples in action_latencies.items()},
+    }
+    
+    alerts = report["alerts"]
+    correct = not (alerts["missed"] or alerts["spurious"] or alerts["wrong_stage"])
+    print(f"\n📊 事件重播（{report['lids']} 個馬桶蓋，{report['virtual_days']:.1f} 天，{report['events']} 個事件）")
+    print(f"   耗時 {elapsed:.2f} 秒 | 加速 {report['speedup']:,.0f} 倍")
+    print(f"   提醒: 預期 {alerts['expected']} | 實際 {alerts['actual']} "
+          f"(階段1 {alerts['stage1']} / 階段2 {alerts['stage2']}) | "
+          f"遺漏 {alerts['missed']} | 多餘 {alerts['spurious']} | 階段錯誤 {alerts['wrong_stage']} "
+          f"{'✅' if correct else '❌'}")
+    print(f"   計時誤差（虛擬時間）: 最大 {report['timer_error']['max'] * 1000:.3f} ms")
+    print(f"   開合事件處理: p50 {report['edge_cost']['p50'] * 1e6:.1f} µs | "
+          f"p99 {report['edge_cost']['p99'] * 1e6:.1f} µs")
+    for stage, costs in report["stage_cost"].items():
+        print(f"   {stage} 提醒處理: p50 {costs['p50'] * 1e6:.1f} µs | p99 {costs['p99'] * 1e6:.1f} µs")
+    return report
+
+
+def benchmark_replay(lids: int = 20, days: int = 14, opens_per_day: int = 15, seed: int = 1):
+    """
+    合成事件重播測試
+    
+    使用方式:
+        cd src && python -c "from simulation.replay import benchmark_replay; benchmark_replay()"
+    
+    Args:
+        lids: 馬桶蓋數量
+        days: 天數
+        opens_per_day: 每個馬桶蓋每天的開蓋次數
+        seed: 亂數種子
+    """
+    timeout = 60
+    trace = synthetic_trace(lids, days, opens_per_day, timeout=timeout, seed=seed)
+    return replay_trace(trace, timeout=timeout)
@@ -0,0 +1,133 @@
+"""
+設定檔監看模組
+以 Linux inotify 監看 .env 所在目錄（不輪詢），檔案被寫入、取代或刪除後呼叫回呼
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+
+# 編輯器常以「寫入暫存檔再改名」的方式存檔，因此監看目錄而非檔案本身
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class ConfigWatcher:
+    """
+    .env 變更監看器
+    
+    背景執行緒阻塞在 select() 上等待 inotify 事件；連續的事件在 settle 秒內合併為
+    一次回呼，避免編輯器存檔時的多個事件重複重新載入。
+    """
+    
+    def __init__(self, paths: Iterable[Path], on_change: Callable[[], None], settle: float = 0.2):
+        """
+        Args:
+            paths: 要監看的檔案（可尚未存在，監看其所在目錄）
+            on_change: 檔案變更後的回呼（在監看執行緒中呼叫）
+            settle: 合併連續事件的等待時間（秒）
+        """
+        self.paths = [Path(path).resolve() for path in paths]
+        self.on_change = on_change
+        self.settle = settle
+        self._fd: Optional[int] = None
+        self._watches: Dict[int, Path] = {}
+        self._wakeup_r, self._wakeup_w = None, None
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> "ConfigWatcher":
+        """
+        開始監看
+        
+        Raises:
+            OSError: 系統不支援 inotify（非 Linux）或無法監看目錄
+        """
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("找不到 libc，無法使用 inotify")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("系統不支援 inotify")
+        
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        for directory in {path.parent for path in self.paths}:
+            if not directory.is_dir():
+                continue
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), f"無法監看 {directory}")
+            self._watches[wd] = directory
+        
+        self._fd = fd
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="smartlid-config-watch", daemon=True)
+        self._thread.start()
+        logger.info(f"🔍 監看設定檔: {', '.join(str(path) for path in self.paths)}")
+        return self
+    
+    def _read_events(self) -> bool:
+        """內部函式：讀出目前所有事件，返回是否有監看的檔案受影響"""
+        data = os.read(self._fd, 64 * 1024)
+        matched = False
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            directory = self._watches.get(wd)
+            if directory is not None and directory / name in self.paths:
+                matched = True
+        return matched
+    
+    def _run(self):
+        """監看執行緒主迴圈"""
+        readers = [self._fd, self._wakeup_r]
+        while True:
+            ready, _, _ = select.select(readers, [], [])
+            if self._wakeup_r in ready:
+                return
+            if not self._read_events():
+                continue
+            
+            # 合併 settle 秒內的後續事件
+            while True:
+                ready, _, _ = select.select(readers, [], [], self.settle)
+                if self._wakeup_r in ready:
+                    return
+                if not ready:
+                    break
+                self._read_events()
+            
+            try:
+                self.on_change()
+            except Exception as e:
+                logger.exception(f"❌ 設定檔變更處理失敗: {e}")
+    
+    def stop(self):
+        """停止監看並釋放 inotify"""
+        if self._thread is None:
+            return
+        os.write(self._wakeup_w, b"\0")
+        self._thread.join(timeout=1.0)
+        for fd in (self._fd, self._wakeup_r, self._wakeup_w):
+            os.close(fd)
+        self._thread = None
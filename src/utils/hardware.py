@@ -0,0 +1,79 @@
+"""
+硬體後端模組
+依 Config.HARDWARE_BACKEND 建立真實（gpio）或模擬（sim）的磁簧開關、伺服馬達與音效控制器；
+硬體函式庫只在使用時才匯入，模擬後端不需要 gpiozero、RPi.GPIO 或 pygame
+"""
+from typing import Iterable, Optional
+
+from config import Config
+
+
+def is_simulated() -> bool:
+    """是否使用模擬硬體後端"""
+    return Config.HARDWARE_BACKEND == "sim"
+
+
+def create_reed_switch(pin: int, stable_time: float):
+    """
+    建立磁簧開關
+    
+    Args:
+        pin: GPIO 針腳號碼
+        stable_time: 防彈跳穩定時間（秒）
+    """
+    from sensors.reed_switch import ReedSwitch
+    
+    device = None
+    if is_simulated():
+        from simulation.drivers import SimInputDevice
+        device = SimInputDevice(pin)
+    return ReedSwitch(pin=pin, stable_time=stable_time, device=device)
+
+
+def create_servo(pin: int, lid_sensor=None, **timing):
+    """
+    建立伺服馬達控制器
+    
+    Args:
+        pin: GPIO 針腳號碼
+        lid_sensor: 同一馬桶蓋的磁簧開關（選用），指定時使用閉迴路控制
+        **timing: 傳給 ServoController 的佔空比與時間參數
+    """
+    from controllers.servo_controller import ServoController
+    
+    return ServoController(pin=pin, pwm=create_pwm(pin), lid_sensor=lid_sensor, **timing)
+
+
+def create_pwm(pin: int, frequency: float = 50):
+    """
+    依 Config.SERVO_PWM_BACKEND 建立伺服馬達的 PWM 輸出（模擬後端一律使用 SimPWM）
+    
+    Args:
+        pin: GPIO 針腳號碼
+        frequency: PWM 頻率（Hz）
+    """
+    if is_simulated():
+        from simulation.drivers import SimPWM
+        return SimPWM(pin, frequency)
+    
+    from controllers.pwm_backend import HardwarePWM, SoftwarePWM
+    
+    backends = {"software": SoftwarePWM, "hardware": HardwarePWM}
+    if Config.SERVO_PWM_BACKEND not in backends:
+        raise ValueError(f"未知的 PWM 後端: {Config.SERVO_PWM_BACKEND}（可用: {', '.join(backends)}）")
+    return backends[Config.SERVO_PWM_BACKEND](pin, frequency)
+
+
+def create_audio(sound_files: Optional[Iterable[str]] = None):
+    """
+    建立音效控制器
+    
+    Args:
+        sound_files: 啟動時預先載入的音效檔案清單
+    """
+    if is_simulated():
+        from simulation.drivers import SimAudioController
+        return SimAudioController(sound_files=sound_files)
+    
+    from controllers.audio_controller import AudioController
+    return AudioController(sound_files=sound_files)
@@ -0,0 +1,136 @@
+"""
+非阻塞日誌模組
+熱路徑（GPIO 回呼、計時器執行緒）只把紀錄排入佇列；背景執行緒負責格式化，
+並寫入主控台與 Config.LOGS_DIR 中依大小輪替的 JSON Lines 檔案
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Optional
+
+from config import Config
+
+# LogRecord 的標準屬性；其餘（extra=...）視為結構化欄位輸出
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆紀錄輸出為一行 JSON"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """佇列已滿時丟棄紀錄並計數，絕不阻塞呼叫端"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合併訊息參數並固定例外文字；時間與 JSON 格式化留給背景執行緒
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BlockingStopQueueListener(QueueListener):
+    """停止時等待佇列有空間再放入結束標記（佇列已滿時 put_nowait 會失敗）"""
+    
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[_NonBlockingQueueHandler] = None
+_lock = threading.Lock()
+
+
+def setup_logging(level: Optional[str] = None, logs_dir: Optional[Path] = None,
+                  console: bool = True) -> logging.Logger:
+    """
+    設定全域日誌（重複呼叫時直接返回）
+    
+    Args:
+        level: 日誌等級（預設為 Config.LOG_LEVEL，DEBUG=True 時為 DEBUG）
+        logs_dir: 日誌目錄（預設為 Config.LOGS_DIR）
+        console: 是否同時輸出至主控台
+    
+    Returns:
+        logging.Logger: 根 logger
+    """
+    global _listener, _handler
+    root = logging.getLogger()
+    with _lock:
+        if _listener is not None:
+            return root
+        
+        logs_dir = Path(logs_dir or Config.LOGS_DIR)
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        file_handler = RotatingFileHandler(
+            logs_dir / "smartlid.jsonl",
+            maxBytes=Config.LOG_MAX_BYTES,
+            backupCount=Config.LOG_BACKUP_COUNT,
+            encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers = [file_handler]
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(logging.Formatter("%(message)s"))
+            handlers.append(console_handler)
+        
+        _handler = _NonBlockingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+        root.addHandler(_handler)
+        root.setLevel((level or Config.LOG_LEVEL).upper())
+        
+        _listener = _BlockingStopQueueListener(_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """寫出佇列中剩餘的紀錄並停止背景執行緒"""
+    global _listener, _handler
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger().removeHandler(_handler)
+        if _handler.dropped:
+            print(f"⚠️ 日誌佇列已滿，共丟棄 {_handler.dropped} 筆紀錄", file=sys.stderr)
+        _listener = None
+        _handler = None
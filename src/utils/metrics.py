@@ -0,0 +1,316 @@
+"""
+效能指標模組
+程序內的計數器、量測值與直方圖，以 Prometheus 文字格式經由本機 HTTP 提供抓取
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class _Metric:
+    """指標基底類別：依標籤值建立並快取子項目"""
+    
+    kind = ""
+    
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 registry: Optional["MetricsRegistry"] = None):
+        """
+        Args:
+            name: 指標名稱
+            help_text: 說明文字
+            labelnames: 標籤名稱
+            registry: 註冊的指標集合（預設為 REGISTRY）
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+    
+    def labels(self, *values) -> object:
+        """取得指定標籤值的子項目（同一組標籤值只建立一次，可保存後重複使用）"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    @staticmethod
+    def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+        """內部函式：產生 {名稱="值",...} 標籤字串"""
+        if not names:
+            return ""
+        pairs = ",".join(
+            f'{name}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+            for name, value in zip(names, values)
+        )
+        return "{" + pairs + "}"
+    
+    def render(self) -> List[str]:
+        """產生 Prometheus 文字格式的各行"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+    
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{self._format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class _CounterValue:
+    """計數器的單一子項目"""
+    
+    __slots__ = ("_value", "_lock")
+    
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+    
+    def get(self) -> float:
+        return self._value
+
+
+class _GaugeValue:
+    """量測值的單一子項目（可設定為抓取時才計算的函式）"""
+    
+    __slots__ = ("_value", "_function")
+    
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+    
+    def set(self, value: float):
+        self._value = value
+    
+    def set_function(self, function: Callable[[], float]):
+        """抓取時呼叫 function 取得目前值，熱路徑上不需要任何更新"""
+        self._function = function
+    
+    def get(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class _HistogramValue:
+    """直方圖的單一子項目"""
+    
+    __slots__ = ("_buckets", "_counts", "_sum", "_lock")
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+    
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Counter(_Metric):
+    """只增不減的計數器"""
+    
+    kind = "counter"
+    
+    def _new_child(self):
+        return _CounterValue()
+    
+    def inc(self, amount: float = 1.0):
+        """無標籤時直接累加"""
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """可任意設定的量測值"""
+    
+    kind = "gauge"
+    
+    def _new_child(self):
+        return _GaugeValue()
+    
+    def set(self, value: float):
+        """無標籤時直接設定"""
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """分桶統計的直方圖"""
+    
+    kind = "histogram"
+    
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional["MetricsRegistry"] = None):
+        """
+        Args:
+            buckets: 各分桶的上限（秒），會自動排序
+        """
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+    
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+    
+    def observe(self, value: float):
+        """無標籤時直接記錄"""
+        self.labels().observe(value)
+    
+    def _render_child(self, values: Tuple[str, ...], child: _HistogramValue) -> List[str]:
+        counts, total = child.snapshot()
+        names = self.labelnames + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = self._format_labels(names, values + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = self._format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _format_value(value: float) -> str:
+    """內部函式：Prometheus 數值格式"""
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """指標集合"""
+    
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+    
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+    
+    def render(self) -> bytes:
+        """產生完整的 Prometheus 文字格式內容"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# 預設的指標集合
+REGISTRY = MetricsRegistry()
+
+# === SmartLid 指標 ===
+LID_OPENS = Counter("smartlid_lid_opens_total", "馬桶蓋開啟次數", ("lid",))
+LID_CLOSES = Counter("smartlid_lid_closes_total", "馬桶蓋放下次數", ("lid",))
+ALERTS = Counter("smartlid_alerts_total", "提醒次數", ("lid", "stage"))
+LINE_PUSHES = Counter("smartlid_line_pushes_total", "LINE 推播請求結果", ("result",))
+LINE_RECIPIENTS = Counter("smartlid_line_recipients_total", "LINE 多位收件者發送的逐一結果", ("result",))
+LINE_REPLIES = Counter("smartlid_line_replies_total", "LINE 回覆請求結果", ("result",))
+LINE_WEBHOOK_REQUESTS = Counter("smartlid_line_webhook_requests_total", "LINE Webhook 請求的回應狀態碼", ("status",))
+SERVO_OUTCOMES = Counter("smartlid_servo_cycles_total", "伺服馬達推蓋結果", ("lid", "outcome"))
+
+LID_OPEN_DURATION = Histogram(
+    "smartlid_lid_open_duration_seconds", "每次開蓋的時間", ("lid",),
+    buckets=(5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
+# 自倒數期限到第一個提醒動作啟動，只剩計時器與執行緒池的延遲；
+# 以開蓋時排定的期限為準，分桶與設定無關，重新載入 LID_OPEN_TIMEOUT 後仍然適用
+ALERT_OVERHEAD = Histogram(
+    "smartlid_alert_overhead_seconds", "自倒數期限到提醒動作啟動的時間", ("lid",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+SERVO_CYCLE = Histogram(
+    "smartlid_servo_cycle_seconds", "伺服馬達推蓋動作的實際作動時間", ("lid",),
+    buckets=(0.1, 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 5, 6, 10)
+)
+LINE_ROUND_TRIP = Histogram("smartlid_line_round_trip_seconds", "LINE 推播請求往返時間")
+LINE_WEBHOOK_REPLY = Histogram("smartlid_line_webhook_reply_seconds", "自收到 LINE Webhook 到回覆送達的時間")
+
+COUNTDOWN_ACTIVE = Gauge("smartlid_countdown_active", "倒數計時是否進行中（1 = 是）", ("lid",))
+COUNTDOWN_REMAINING = Gauge("smartlid_countdown_remaining_seconds", "倒數計時剩餘秒數", ("lid",))
+DAILY_ALERT_COUNT = Gauge("smartlid_daily_alert_count", "當日提醒次數", ("lid",))
+
+
+def _metrics_handler():
+    """內部函式：建立抓取端點的請求處理類別（http.server 只在啟用端點時才匯入）"""
+    from http.server import BaseHTTPRequestHandler
+    
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        """Prometheus 抓取端點"""
+        
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = self.server.registry.render()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            # 靜音：抓取頻繁，不輸出存取紀錄
+            pass
+    
+    return _MetricsHandler
+
+
+class MetricsServer:
+    """提供 /metrics 的輕量 HTTP 伺服器（背景執行緒）"""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108, registry: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            host: 監聽位址
+            port: 監聽埠號（0 表示自動分配）
+            registry: 提供的指標集合（預設為 REGISTRY）
+        """
+        from http.server import ThreadingHTTPServer
+        
+        self._server = ThreadingHTTPServer((host, port), _metrics_handler())
+        self._server.daemon_threads = True
+        self._server.registry = registry if registry is not None else REGISTRY
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+    
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="smartlid-metrics", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,114 @@
+"""
+啟動效能分析模組
+記錄匯入與各初始化階段的耗時（含所在執行緒），啟動完成後輸出時間軸報告
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+# 本模組被匯入的時間點，作為未指定起點時的基準
+_IMPORTED_AT = time.perf_counter()
+
+
+class StartupProfile:
+    """啟動時間軸：每個階段記錄 (名稱, 開始, 結束, 執行緒)，時間皆相對於起點"""
+    
+    def __init__(self, origin: Optional[float] = None):
+        """
+        Args:
+            origin: 起點（time.perf_counter()），預設為本模組被匯入的時間
+        """
+        self.origin = origin if origin is not None else _IMPORTED_AT
+        self.phases: List[Tuple[str, float, float, str]] = []
+        self._lock = threading.Lock()
+    
+    def elapsed(self) -> float:
+        """自起點經過的時間（秒）"""
+        return time.perf_counter() - self.origin
+    
+    def record(self, name: str, started: float, finished: Optional[float] = None):
+        """
+        記錄一個階段
+        
+        Args:
+            name: 階段名稱
+            started: 開始時間（time.perf_counter()）
+            finished: 結束時間，預設為現在
+        """
+        finished = finished if finished is not None else time.perf_counter()
+        with self._lock:
+            self.phases.append((name, started - self.origin, finished - self.origin,
+                                threading.current_thread().name))
+    
+    @contextmanager
+    def phase(self, name: str):
+        """以 with 區塊記錄一個階段"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+    
+    def timed(self, name: str, function: Callable) -> Callable:
+        """包裝函式，呼叫時記錄為一個階段（用於提交至執行緒池）"""
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    
+    def finish_time(self, name: str) -> Optional[float]:
+        """指定階段的結束時間（相對於起點，秒）"""
+        for phase_name, _, finished, _ in self.phases:
+            if phase_name == name:
+                return finished
+        return None
+    
+    def report(self) -> str:
+        """依完成時間排序的時間軸報告"""
+        lines = ["⏱️ 啟動時間軸（自起點起算）:"]
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[2])
+        for name, started, finished, thread in phases:
+            lines.append(f"   {name:<22} {started * 1000:8.1f} → {finished * 1000:8.1f} ms "
+                         f"({(finished - started) * 1000:7.1f} ms) [{thread}]")
+        return "\n".join(lines)
+
+
+def profile_imports(module: str = "main", top: int = 15) -> List[Tuple[str, float]]:
+    """
+    以 python -X importtime 在子程序中量測匯入模組的耗時
+    
+    Args:
+        module: 要匯入的模組
+        top: 返回累計耗時最長的前幾項
+    
+    Returns:
+        List[Tuple[str, float]]: (模組名稱, 累計耗時秒數)，依耗時排序
+    """
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+    
+    src_dir = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")])))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=src_dir
+    )
+    # 子模組先於父模組輸出：暫存第一層匯入，遇到目標模組本身時保留
+    timings, children = [], []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1e6))
+        elif depth == 0:
+            if name.strip() == module:
+                timings = children + [(module, int(cumulative) / 1e6)]
+            children = []
+    timings.sort(key=lambda timing: timing[1], reverse=True)
+    return timings[:top]
@@ -0,0 +1,268 @@
+"""
+期限排程器模組
+以單一執行緒與最小堆積管理所有倒數期限，取代每次開蓋建立 threading.Timer
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTask:
+    """已排程的期限任務"""
+    
+    __slots__ = ("deadline", "callback", "args", "cancelled", "fired", "_scheduler")
+    
+    def __init__(self, scheduler: "DeadlineScheduler", deadline: float, callback: Callable, args: tuple):
+        self._scheduler = scheduler
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.fired = False
+    
+    def cancel(self) -> bool:
+        """
+        取消任務
+        
+        Returns:
+            bool: 任務尚未執行且成功取消返回 True
+        """
+        return self._scheduler.cancel(self)
+
+
+class DeadlineScheduler:
+    """
+    單執行緒期限排程器
+    
+    - 排程：O(log n)，推入最小堆積
+    - 取消：O(1)，僅標記；已取消項目在到期彈出時丟棄，數量過半時整批重建堆積
+    - 使用 time.monotonic()，不受系統時間調整影響
+    - 回呼在固定大小的執行緒池中執行，單一回呼阻塞不會延誤其他期限
+    """
+    
+    def __init__(self, max_workers: int = 2, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化排程器
+        
+        Args:
+            max_workers: 執行回呼的執行緒數量
+            clock: 單調時鐘函式
+        """
+        self.clock = clock
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smartlid-timer")
+    
+    def start(self) -> "DeadlineScheduler":
+        """啟動排程執行緒"""
+        with self._condition:
+            if self._running:
+                return self
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="smartlid-scheduler", daemon=True)
+        self._thread.start()
+        return self
+    
+    def schedule(self, delay: float, callback: Callable, *args) -> ScheduledTask:
+        """
+        於 delay 秒後執行回呼
+        
+        Args:
+            delay: 延遲秒數
+            callback: 回呼函式
+        
+        Returns:
+            ScheduledTask: 可用於取消的任務物件
+        """
+        return self.schedule_at(self.clock() + delay, callback, *args)
+    
+    def schedule_at(self, deadline: float, callback: Callable, *args) -> ScheduledTask:
+        """
+        於指定的單調時鐘時間點執行回呼
+        
+        Args:
+            deadline: 以 clock() 為基準的到期時間
+            callback: 回呼函式
+        
+        Returns:
+            ScheduledTask: 可用於取消的任務物件
+        """
+        task = ScheduledTask(self, deadline, callback, args)
+        with self._condition:
+            heapq.heappush(self._heap, (deadline, next(self._counter), task))
+            # 新任務成為最早期限時，喚醒排程執行緒重新計算等待時間
+            if self._heap[0][2] is task:
+                self._condition.notify()
+        return task
+    
+    def cancel(self, task: ScheduledTask) -> bool:
+        """
+        取消任務
+        
+        Returns:
+            bool: 任務尚未執行且成功取消返回 True
+        """
+        with self._condition:
+            if task.cancelled or task.fired:
+                return False
+            task.cancelled = True
+            self._cancelled += 1
+            # 已取消項目過多時重建堆積，避免記憶體隨抖動無限增長
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+            return True
+    
+    @property
+    def pending(self) -> int:
+        """尚未到期且未取消的任務數量"""
+        with self._condition:
+            return len(self._heap) - self._cancelled
+    
+    def _run(self):
+        """排程執行緒主迴圈"""
+        with self._condition:
+            while self._running:
+                # 丟棄堆積頂端已取消的項目
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                
+                deadline, _, task = self._heap[0]
+                remaining = deadline - self.clock()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                
+                heapq.heappop(self._heap)
+                # 標記為已觸發，之後的 cancel() 會返回 False
+                task.fired = True
+                self._pool.submit(self._invoke, task)
+    
+    @staticmethod
+    def _invoke(task: ScheduledTask):
+        """在執行緒池中執行回呼"""
+        try:
+            task.callback(*task.args)
+        except Exception as e:
+            logger.exception(f"❌ 排程任務執行失敗: {e}")
+    
+    def stop(self):
+        """停止排程執行緒並捨棄所有未到期任務"""
+        with self._condition:
+            self._running = False
+            self._heap.clear()
+            self._cancelled = 0
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LoopScheduler:
+    """
+    以 asyncio 事件迴圈計時器實作的排程器（介面同 DeadlineScheduler）
+    
+    事件迴圈預設使用 time.monotonic()，因此期限可直接沿用；回呼在事件迴圈執行緒上執行。
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        """
+        Args:
+            loop: 事件迴圈
+        """
+        self.loop = loop
+        self.clock = time.monotonic
+    
+    def start(self) -> "LoopScheduler":
+        return self
+    
+    def schedule(self, delay: float, callback: Callable, *args) -> asyncio.TimerHandle:
+        """於 delay 秒後執行回呼（須在事件迴圈執行緒呼叫）"""
+        return self.loop.call_later(delay, callback, *args)
+    
+    def schedule_at(self, deadline: float, callback: Callable, *args) -> asyncio.TimerHandle:
+        """於指定的單調時鐘時間點執行回呼（須在事件迴圈執行緒呼叫）"""
+        return self.loop.call_at(self.loop.time() + (deadline - self.clock()), callback, *args)
+    
+    def stop(self):
+        """事件迴圈計時器隨迴圈結束，無需額外處理"""
+        pass
+
+
+class VirtualScheduler:
+    """
+    虛擬時鐘排程器（介面同 DeadlineScheduler，用於模擬與重播）
+    
+    時間只在呼叫 advance_to() 時前進，到期的回呼依期限順序在呼叫端執行緒中同步執行，
+    因此數週的事件可在數秒內重播完畢，且結果可重現。
+    """
+    
+    def __init__(self, start: float = 0.0):
+        """
+        Args:
+            start: 虛擬時鐘的起始時間（秒）
+        """
+        self.now = start
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+    
+    def clock(self) -> float:
+        """目前的虛擬時間"""
+        return self.now
+    
+    def start(self) -> "VirtualScheduler":
+        return self
+    
+    def schedule(self, delay: float, callback: Callable, *args) -> ScheduledTask:
+        """於 delay 虛擬秒後執行回呼"""
+        return self.schedule_at(self.now + delay, callback, *args)
+    
+    def schedule_at(self, deadline: float, callback: Callable, *args) -> ScheduledTask:
+        """於指定的虛擬時間執行回呼"""
+        task = ScheduledTask(self, deadline, callback, args)
+        heapq.heappush(self._heap, (deadline, next(self._counter), task))
+        return task
+    
+    def cancel(self, task: ScheduledTask) -> bool:
+        """取消任務（已取消項目在到期彈出時丟棄）"""
+        if task.cancelled or task.fired:
+            return False
+        task.cancelled = True
+        return True
+    
+    @property
+    def pending(self) -> int:
+        """尚未到期且未取消的任務數量"""
+        return sum(1 for entry in self._heap if not entry[2].cancelled)
+    
+    def advance_to(self, when: float):
+        """將虛擬時間推進至 when，依序執行期間內到期的所有回呼"""
+        while self._heap and self._heap[0][0] <= when:
+            deadline, _, task = heapq.heappop(self._heap)
+            if task.cancelled:
+                continue
+            self.now = max(self.now, deadline)
+            task.fired = True
+            DeadlineScheduler._invoke(task)
+        self.now = max(self.now, when)
+    
+    def stop(self):
+        """捨棄所有未到期任務"""
+        self._heap.clear()
@@ -0,0 +1,27 @@
+"""
+測試共用設定
+模組以 src 為匯入根目錄（與 cd src && python main.py 相同），此處將 src 加入 sys.path
+
+執行方式:
+    python -m pytest
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+
+@pytest.fixture
+def wait_until():
+    """等待背景執行緒達成條件：wait_until(condition, timeout) -> bool"""
+    def wait(condition, timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+    return wait
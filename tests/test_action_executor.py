@@ -0,0 +1,67 @@
+"""提醒動作執行器：並行啟動與各動作的期限"""
+import threading
+
+from controllers.action_executor import ActionExecutor
+from utils.scheduler import DeadlineScheduler
+
+
+def _slow(cancelled: list):
+    def action(cancel_event: threading.Event):
+        cancelled.append(cancel_event.wait(5))
+        return "slow"
+    return action
+
+
+def test_actions_start_concurrently():
+    executor = ActionExecutor(max_workers=3)
+    started = threading.Barrier(3, timeout=2)
+    batch = executor.execute({name: lambda event: started.wait() for name in ("audio", "servo", "line")})
+    results = batch.wait()
+    executor.shutdown()
+    
+    assert [result.status for result in results] == ["done"] * 3
+
+
+def test_expired_action_is_cancelled_without_affecting_others():
+    executor = ActionExecutor(max_workers=3)
+    scheduler = DeadlineScheduler().start()
+    cancelled = []
+    settled = threading.Event()
+    batch = executor.execute(
+        {"line": _slow(cancelled), "audio": lambda event: "played"},
+        deadlines={"line": 0.05, "audio": 1.0},
+    )
+    batch.arm_deadlines(scheduler)
+    batch.add_done_callback(lambda batch: settled.set())
+    
+    assert settled.wait(2)
+    assert batch.results["line"].status == "timeout"
+    assert batch.results["audio"].status == "done"
+    assert batch.cancel_events["line"].is_set()
+    assert not batch.cancel_events["audio"].is_set()
+    executor.shutdown()
+    scheduler.stop()
+
+
+def test_wait_expires_overdue_action():
+    executor = ActionExecutor(max_workers=2)
+    cancelled = []
+    batch = executor.execute({"servo": _slow(cancelled), "audio": lambda event: None},
+                             deadlines={"servo": 0.05})
+    statuses = {result.name: result.status for result in batch.wait()}
+    executor.shutdown()
+    
+    assert statuses == {"servo": "timeout", "audio": "done"}
+    assert batch.cancel_events["servo"].is_set()
+
+
+def test_cancel_sets_every_action_event():
+    executor = ActionExecutor(max_workers=2)
+    cancelled = []
+    batch = executor.execute({"servo": _slow(cancelled), "line": _slow(cancelled)})
+    batch.cancel()
+    batch.wait()
+    executor.shutdown()
+    
+    assert all(event.is_set() for event in batch.cancel_events.values())
+    assert cancelled == [True, True]
@@ -0,0 +1,62 @@
+"""網頁儀表板：統計回應的快取與 ETag、查詢失敗時不快取"""
+import sqlite3
+from datetime import date
+
+import pytest
+
+pytest.importorskip("flask")
+
+from services.dashboard import create_app  # noqa: E402
+
+
+class _Store:
+    """可切換為查詢失敗（連線失效）的事件紀錄"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.failing = False
+        self.connections = []
+    
+    def rollup(self, granularity, start, end, lid=None, conn=None):
+        self.connections.append(conn)
+        if self.failing:
+            raise sqlite3.OperationalError("disk I/O error")
+        return [{"day": start, "lid": "lid1", "opens": 3, "alerts": 1}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    db_path = str(tmp_path / "smartlid.db")
+    sqlite3.connect(db_path).close()
+    return _Store(db_path)
+
+
+def _client(store):
+    app = create_app(store, cache_ttl=60, today=lambda: date(2026, 1, 1))
+    return app, app.test_client()
+
+
+def test_repeated_query_is_cached_with_etag(store):
+    app, client = _client(store)
+    response = client.get("/api/daily?days=1")
+    assert response.status_code == 200
+    assert response.get_json()["rows"][0]["alerts"] == 1
+    
+    cached = client.get("/api/daily?days=1", headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+    assert len(store.connections) == 1
+    assert app.config["CACHE"].stats == {"hits": 1, "misses": 1}
+
+
+def test_failed_query_is_not_cached_and_connection_is_closed(store):
+    _, client = _client(store)
+    store.failing = True
+    assert client.get("/api/daily?days=1").get_json()["rows"] == []
+    
+    store.failing = False
+    assert len(client.get("/api/daily?days=1").get_json()["rows"]) == 1
+    
+    failed, retried = store.connections
+    assert failed is not retried
+    with pytest.raises(sqlite3.ProgrammingError):
+        failed.execute("SELECT 1")
@@ -0,0 +1,172 @@
+"""車隊上傳：待送區在閘道確認後才刪除、重送框架去重、格式錯誤的框架被拒絕、通知在閘道重新啟動後補送"""
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from services.fleet_gateway import FleetGateway, FleetGatewayServer
+from services.fleet_uploader import FleetUploader
+
+
+class _RecordingLine:
+    """記錄閘道呼叫的 LINE 服務"""
+    
+    def __init__(self):
+        self.sent = []
+    
+    def send_alert(self, alert_count, today_date=None, to=None):
+        self.sent.append(("alert", alert_count, to))
+        return True
+    
+    def end_of_day(self, day, total_count, to=None):
+        self.sent.append(("end_of_day", total_count, to))
+        return True
+    
+    def send_daily_summary(self, date, total_count, to=None):
+        self.sent.append(("summary", total_count, to))
+        return True
+
+
+def _outbox_size(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM fleet_outbox").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _event(seq: int, kind: str = "lid_opened") -> list:
+    return [seq, time.time(), kind, "lid1", 0, "2026-01-01", None]
+
+
+@pytest.fixture
+def gateway(tmp_path):
+    line = _RecordingLine()
+    gateway = FleetGateway(str(tmp_path / "fleet.db"), line).start()
+    yield gateway
+    gateway.stop()
+
+
+def test_uploader_empties_outbox_once_acked(gateway, tmp_path, wait_until):
+    server = FleetGatewayServer(gateway, "127.0.0.1", 0, token="secret").start()
+    outbox = str(tmp_path / "node.db")
+    uploader = FleetUploader(server.url, "node1", outbox, token="secret", flush_interval=0.02).start()
+    for count in range(5):
+        uploader.publish("lid_opened", {"lid": "lid1", "daily_alert_count": count, "day": "2026-01-01"})
+    uploader.notify("alert", "Uowner", 3, "2026-01-01")
+    
+    assert wait_until(lambda: uploader.stats["uploaded"] == 6)
+    assert wait_until(lambda: gateway.line_service.sent == [("alert", 3, "Uowner")])
+    uploader.stop()
+    server.stop()
+    
+    assert gateway.stats["events"] == 6
+    assert _outbox_size(outbox) == 0
+    assert [node["events"] for node in gateway.nodes()] == [6]
+
+
+def test_resent_frames_are_acked_but_not_stored_twice(gateway):
+    frame = [_event(1), _event(2), _event(3, "notify_alert")]
+    
+    assert gateway.ingest("node1", frame) == 3
+    assert gateway.ingest("node1", frame) == 3
+    assert gateway.ingest("node1", frame[1:] + [_event(4)]) == 4
+    
+    assert gateway.stats["events"] == 4
+    assert gateway.stats["duplicates"] == 5
+    gateway.stop()
+    assert [kind for kind, _, _ in gateway.line_service.sent] == ["alert"]
+
+
+def test_rejected_token_keeps_events_in_outbox(gateway, tmp_path, wait_until):
+    server = FleetGatewayServer(gateway, "127.0.0.1", 0, token="secret").start()
+    outbox = str(tmp_path / "node.db")
+    uploader = FleetUploader(server.url, "node1", outbox, token="wrong", flush_interval=0.02,
+                             retry_base=0.01, retry_max=0.02).start()
+    uploader.notify("alert", None, 1, "2026-01-01")
+    
+    assert wait_until(lambda: uploader.stats["retried"] >= 2)
+    uploader.stop()
+    server.stop()
+    
+    assert gateway.stats["events"] == 0
+    assert _outbox_size(outbox) == 1
+
+
+def test_malformed_ack_is_retried(tmp_path, wait_until):
+    bodies = [b"not json", b'{"acked": 1}', b"[1]", b'{"ack": "1"}', b'{"ack": true}']
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            frame = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body = bodies.pop(0) if bodies else json.dumps({"ack": frame["events"][-1][0]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    outbox = str(tmp_path / "node.db")
+    uploader = FleetUploader(f"http://127.0.0.1:{server.server_port}/v1/frames", "node1", outbox,
+                             flush_interval=0.02, retry_base=0.01, retry_max=0.02).start()
+    uploader.notify("alert", None, 1, "2026-01-01")
+    
+    assert wait_until(lambda: uploader.stats["uploaded"] == 1)
+    uploader.stop()
+    server.shutdown()
+    server.server_close()
+    
+    assert uploader.stats["retried"] == 5
+    assert _outbox_size(outbox) == 0
+
+
+def test_malformed_frame_does_not_stop_the_writer(gateway):
+    server = FleetGatewayServer(gateway, "127.0.0.1", 0).start()
+    malformed = [["x", 1.0, "alert", "lid1", 0, "2026-01-01", None],
+                 [1, "later", "alert", "lid1", 0, "2026-01-01", None],
+                 [True, 1.0, "alert", "lid1", 0, "2026-01-01", None],
+                 [1, 1.0, 7, "lid1", 0, "2026-01-01", None]]
+    for event in malformed:
+        response = requests.post(server.url, json={"node": "node1", "events": [event]}, timeout=5)
+        assert response.status_code == 400
+    
+    # 直接呼叫 ingest() 不經過 HTTP 驗證：只有這個框架失敗
+    with pytest.raises(TypeError):
+        gateway.ingest("node1", [malformed[0]])
+    
+    response = requests.post(server.url, json={"node": "node1", "events": [_event(1)]}, timeout=5)
+    server.stop()
+    assert response.status_code == 200
+    assert response.json() == {"ack": 1}
+    assert all(thread.is_alive() for thread in gateway._threads)
+    assert gateway.stats["events"] == 1
+
+
+def test_acked_notifications_are_sent_after_gateway_restart(tmp_path, wait_until):
+    db_path = str(tmp_path / "fleet.db")
+    # 未設定 LINE 服務的閘道只提交事件，相當於確認後、通知前當機
+    gateway = FleetGateway(db_path).start()
+    gateway.ingest("node1", [_event(1), _event(2, "notify_alert")])
+    gateway.ingest("node2", [_event(1, "notify_end_of_day")])
+    gateway.stop()
+    
+    line = _RecordingLine()
+    gateway = FleetGateway(db_path, line).start()
+    assert wait_until(lambda: len(line.sent) == 2)
+    gateway.ingest("node1", [_event(3, "notify_alert")])
+    assert wait_until(lambda: len(line.sent) == 3)
+    gateway.stop()
+    
+    line = _RecordingLine()
+    gateway = FleetGateway(db_path, line).start()
+    time.sleep(0.1)
+    gateway.stop()
+    assert line.sent == []
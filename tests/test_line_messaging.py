@@ -0,0 +1,102 @@
+"""LINE 推播服務：多位收件者的 Multicast 分組與逐一結果、每月額度的保存"""
+import pytest
+
+from services.line_messaging import ALERT_TEMPLATE, LineMessagingService, PushBudget, parse_recipients
+from services.line_stub_server import LineStubServer
+
+
+@pytest.fixture
+def stub():
+    with LineStubServer() as stub:
+        yield stub
+
+
+def _service(stub: LineStubServer, **kwargs) -> LineMessagingService:
+    return LineMessagingService("test-token", "Udefault", api_url=stub.push_url, **kwargs)
+
+
+def _users(count: int) -> list:
+    return [f"U{index:032x}" for index in range(count)]
+
+
+def test_parse_recipients_splits_and_dedupes():
+    assert parse_recipients(" Ua, Ub+Ua ,,Cgroup ") == ("Ua", "Ub", "Cgroup")
+    assert parse_recipients(["Ua", "Ua", " "]) == ("Ua",)
+
+
+def test_multicast_chunks_users_and_pushes_groups(stub):
+    service = _service(stub)
+    recipients = _users(1201) + ["Cgroup", "Rroom"]
+    report = service.multicast([ALERT_TEMPLATE.render(alert_count=1, today_date="2026-01-01")], "",
+                               recipients)
+    service.close()
+    
+    assert report.ok
+    assert sorted(report.delivered) == sorted(recipients)
+    assert report.requests == 5
+    multicast = [request for request in stub.requests if request["path"].endswith("/multicast")]
+    assert sorted(len(request["payload"]["to"]) for request in multicast) == [201, 500, 500]
+    pushed = {request["payload"]["to"] for request in stub.requests if request["path"].endswith("/push")}
+    assert pushed == {"Cgroup", "Rroom"}
+
+
+def test_multicast_reports_invalid_recipients(stub):
+    service = _service(stub)
+    recipients = _users(20)
+    stub.invalid_recipients = {recipients[3], recipients[17]}
+    report = service.multicast([ALERT_TEMPLATE.render(alert_count=1, today_date="2026-01-01")], "",
+                               recipients)
+    service.close()
+    
+    assert sorted(report.failed) == sorted(stub.invalid_recipients)
+    assert sorted(report.delivered) == sorted(set(recipients) - stub.invalid_recipients)
+
+
+def test_send_alert_to_recipient_list_uses_one_request(stub):
+    service = _service(stub, coalesce_window=0)
+    assert service.send_alert(2, "2026-01-01", to="Ua,Ub,Uc")
+    service.close()
+    
+    assert len(stub.requests) == 1
+    assert stub.requests[0]["payload"]["to"] == ["Ua", "Ub", "Uc"]
+
+
+def test_budget_survives_restart(tmp_path):
+    db_path = str(tmp_path / "smartlid.db")
+    budget = PushBudget(100, 0.1, db_path=db_path)
+    budget.consume(3)
+    budget.save_deferred("Ua", "2026-01-01", 2)
+    budget.close()
+    
+    budget = PushBudget(100, 0.1, db_path=db_path)
+    assert budget.used == 3 and budget.remaining == 97
+    assert budget.load_deferred() == {"Ua": ("2026-01-01", 2)}
+    budget.save_deferred("Ua", "2026-01-01", 0)
+    assert budget.load_deferred() == {}
+    budget.close()
+
+
+def test_deferred_alerts_are_restored_and_reported(stub, tmp_path):
+    db_path = str(tmp_path / "smartlid.db")
+    service = _service(stub, monthly_quota=10, quota_reserve=1.0, coalesce_window=0, state_path=db_path)
+    assert service.send_alert(1, "2026-01-01")
+    service.close()
+    assert stub.requests == []
+    
+    service = _service(stub, monthly_quota=10, quota_reserve=1.0, state_path=db_path)
+    assert service.end_of_day("2026-01-01", 1)
+    service.close()
+    
+    [request] = stub.requests
+    assert "2026-01-01" in request["payload"]["messages"][0]["text"]
+    assert PushBudget(10, 1.0, db_path=db_path).used == 1
+
+
+def test_daily_summary_is_skipped_when_quota_is_exhausted(stub, tmp_path):
+    service = _service(stub, monthly_quota=2, quota_reserve=0.0, coalesce_window=0,
+                       state_path=str(tmp_path / "smartlid.db"))
+    service.budget.consume(2)
+    
+    assert not service.send_daily_summary("2026-01-01", 5)
+    service.close()
+    assert stub.requests == []
@@ -0,0 +1,136 @@
+"""LINE Webhook：簽章驗證、重送事件的去除、Reply API 的回覆內容與查詢失敗時不快取"""
+import base64
+import hashlib
+import hmac
+import json
+import socket
+import sqlite3
+from datetime import date
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+from services.line_messaging import LineMessagingService
+from services.line_stub_server import LineStubServer
+from services.line_webhook import LineWebhookServer, StatsResponder, verify_signature
+
+SECRET = "test-secret"
+
+
+def _sign(body: bytes, secret: str = SECRET) -> str:
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def _body(*events: dict) -> bytes:
+    return json.dumps({"destination": "Ubot", "events": list(events)}, ensure_ascii=False).encode("utf-8")
+
+
+def _text_event(event_id: str, reply_token: str, text: str) -> dict:
+    return {"type": "message", "webhookEventId": event_id, "replyToken": reply_token,
+            "source": {"type": "user", "userId": "Uasker"}, "message": {"type": "text", "text": text}}
+
+
+@pytest.fixture
+def webhook():
+    with LineStubServer() as stub:
+        service = LineMessagingService("test-token", "Udefault", api_url=stub.push_url)
+        server = LineWebhookServer(SECRET, service, StatsResponder(), host="127.0.0.1", port=0, workers=2).start()
+        try:
+            yield server, stub
+        finally:
+            server.stop()
+            service.close()
+
+
+def _post(server: LineWebhookServer, body: bytes, signature: str) -> int:
+    return requests.post(server.url, data=body, headers={"X-Line-Signature": signature}, timeout=5).status_code
+
+
+def test_verify_signature():
+    body = _body(_text_event("e1", "r1", "今天"))
+    assert verify_signature(SECRET.encode(), body, _sign(body))
+    assert not verify_signature(SECRET.encode(), body, _sign(body, "other-secret"))
+    assert not verify_signature(SECRET.encode(), body + b" ", _sign(body))
+    assert not verify_signature(SECRET.encode(), body, "\xe9\xff")
+
+
+def test_bad_signature_is_rejected(webhook):
+    server, stub = webhook
+    body = _body(_text_event("e1", "r1", "今天"))
+    assert _post(server, body, _sign(body, "other-secret")) == 401
+    assert _post(server, body, "") == 401
+    
+    assert server.stats["rejected"] == 2
+    assert server.stats["events"] == 0
+    assert stub.requests == []
+
+
+def test_non_ascii_signature_is_rejected(webhook):
+    server, stub = webhook
+    body = _body(_text_event("e1", "r1", "今天"))
+    head = (f"POST {server.path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n").encode("latin-1")
+    target = urlsplit(server.url)
+    with socket.create_connection((target.hostname, target.port), timeout=5) as sock:
+        sock.sendall(head + b"X-Line-Signature: \xe9\xff\r\n\r\n" + body)
+        status = sock.makefile("rb").readline().split()[1]
+    
+    assert status == b"401"
+    assert server.stats["rejected"] == 1
+
+
+def test_text_message_is_answered_with_reply_api(webhook, wait_until):
+    server, stub = webhook
+    body = _body(_text_event("e1", "reply-today", "今天"), _text_event("e2", "reply-help", "你好"))
+    assert _post(server, body, _sign(body)) == 200
+    
+    assert wait_until(lambda: server.stats["replies"] == 2)
+    replies = {request["payload"]["replyToken"]: request["payload"]["messages"] for request in stub.requests}
+    assert all(request["path"].endswith("/reply") for request in stub.requests)
+    assert replies["reply-today"] == [{"type": "text", "text": "📊 統計功能未啟用"}]
+    assert replies["reply-help"] == [{"type": "text", "text": "🤖 可以問我：今天、本週、狀態"}]
+
+
+def test_redelivered_event_is_answered_once(webhook, wait_until):
+    server, stub = webhook
+    body = _body(_text_event("e1", "reply-1", "狀態"))
+    assert _post(server, body, _sign(body)) == 200
+    # LINE 重送時 webhookEventId 相同（replyToken 也相同）
+    assert _post(server, body, _sign(body)) == 200
+    
+    assert wait_until(lambda: server.stats["replies"] == 1)
+    assert server.stats["events"] == 1
+    assert server.stats["duplicates"] == 1
+    assert [request["payload"]["replyToken"] for request in stub.requests] == ["reply-1"]
+
+
+class _FlakyStore:
+    """第一次查詢失敗（連線失效），之後返回一列彙總"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.connections = []
+    
+    def rollup(self, granularity, start, end, lid=None, conn=None):
+        self.connections.append(conn)
+        if len(self.connections) == 1:
+            raise sqlite3.OperationalError("disk I/O error")
+        return [{"day": start, "lid": "lid1", "opens": 3, "alerts": 1}]
+
+
+def test_failed_query_is_not_cached_and_connection_is_closed(tmp_path):
+    db_path = str(tmp_path / "smartlid.db")
+    sqlite3.connect(db_path).close()
+    store = _FlakyStore(db_path)
+    responder = StatsResponder(store, cache_ttl=60, today=lambda: date(2026, 1, 1))
+    
+    assert "今天還沒有紀錄" in responder.answer("今天")
+    assert "lid1：開蓋 3 次｜提醒 1 次" in responder.answer("今天")
+    assert "lid1：開蓋 3 次｜提醒 1 次" in responder.answer("今天")
+    
+    assert len(store.connections) == 2
+    failed, retried = store.connections
+    assert failed is not retried
+    with pytest.raises(sqlite3.ProgrammingError):
+        failed.execute("SELECT 1")
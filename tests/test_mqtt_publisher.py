@@ -0,0 +1,97 @@
+"""MQTT 發布器：離線緩衝、溢出到 SQLite，重新連線後依序補送"""
+import json
+
+import pytest
+
+pytest.importorskip("paho.mqtt.client")
+
+from services.mqtt_publisher import MqttPublisher  # noqa: E402
+from services.mqtt_stub_broker import MqttStubBroker  # noqa: E402
+
+LIDS = 2
+
+
+def _state(i: int) -> dict:
+    return {"lid": f"lid{i % LIDS}", "open": False, "countdown_active": False, "countdown_remaining": 0.0,
+            "daily_alert_count": i // LIDS, "day": "2026-01-01"}
+
+
+def _topic_payloads(broker: MqttStubBroker, topic: str) -> list:
+    with broker.lock:
+        return [json.loads(message["payload"]) for message in broker.messages if message["topic"] == topic]
+
+
+@pytest.fixture
+def broker():
+    broker = MqttStubBroker().start()
+    yield broker
+    broker.stop()
+
+
+def test_publishes_events_and_retained_state(broker, wait_until):
+    host, port = broker.address
+    publisher = MqttPublisher(host, port, discovery_prefix=None).start()
+    assert wait_until(publisher._connected.is_set)
+    for i in range(10):
+        publisher.publish("lid_opened", _state(i))
+    
+    assert wait_until(lambda: len(_topic_payloads(broker, "smartlid/lid1/event")) == 5)
+    # 最新狀態在事件之後送出
+    assert wait_until(lambda: all(_topic_payloads(broker, f"smartlid/lid{lid}/state") for lid in range(LIDS)))
+    publisher.stop()
+    
+    counts = [payload["daily_alert_count"] for payload in _topic_payloads(broker, "smartlid/lid0/event")]
+    assert counts == list(range(5))
+    assert _topic_payloads(broker, "smartlid/lid0/state")[-1]["daily_alert_count"] == 4
+
+
+def test_reconnect_drains_spooled_events_in_order(broker, tmp_path, wait_until):
+    host, port = broker.address
+    publisher = MqttPublisher(host, port, db_path=str(tmp_path / "smartlid.db"), buffer_size=20,
+                              discovery_prefix=None, reconnect_min=0.05, reconnect_max=0.1).start()
+    assert wait_until(publisher._connected.is_set)
+    broker.stop()
+    assert wait_until(lambda: not publisher._connected.is_set())
+    
+    outage = 100
+    for i in range(outage):
+        publisher.publish("alert", _state(i))
+    assert wait_until(lambda: publisher.stats["spooled"] >= outage - publisher.buffer_size)
+    
+    restarted = MqttStubBroker(host, port).start()
+    try:
+        assert wait_until(lambda: len(_topic_payloads(restarted, "smartlid/lid1/event")) >= outage // LIDS)
+        assert wait_until(lambda: all(_topic_payloads(restarted, f"smartlid/lid{lid}/state") for lid in range(LIDS)))
+        publisher.stop()
+        for lid in range(LIDS):
+            # QoS 1 斷線重送可能重複，只比較第一次收到的順序
+            counts = list(dict.fromkeys(payload["daily_alert_count"]
+                                        for payload in _topic_payloads(restarted, f"smartlid/lid{lid}/event")))
+            assert counts == list(range(outage // LIDS))
+        # 離線期間的狀態只保留每個馬桶蓋最新的一則
+        assert [payload["daily_alert_count"] for payload in _topic_payloads(restarted, "smartlid/lid0/state")] \
+            == [outage // LIDS - 1]
+    finally:
+        restarted.stop()
+
+
+def test_unsent_state_is_published_after_restart(broker, tmp_path, wait_until):
+    host, port = broker.address
+    db_path = str(tmp_path / "smartlid.db")
+    broker.stop()
+    publisher = MqttPublisher(host, port, db_path=db_path, discovery_prefix=None).start()
+    for i in range(6):
+        publisher.publish("alert", _state(i))
+    publisher.stop()
+    assert publisher.stats["spooled"] == 6 + LIDS
+    
+    restarted = MqttStubBroker(host, port).start()
+    publisher = MqttPublisher(host, port, db_path=db_path, discovery_prefix=None).start()
+    try:
+        assert wait_until(lambda: all(_topic_payloads(restarted, f"smartlid/lid{lid}/state") for lid in range(LIDS)))
+        publisher.stop()
+        states = [_topic_payloads(restarted, f"smartlid/lid{lid}/state")[-1] for lid in range(LIDS)]
+        assert [state["daily_alert_count"] for state in states] == [2, 2]
+        assert len(_topic_payloads(restarted, "smartlid/lid0/event")) == 3
+    finally:
+        restarted.stop()
@@ -0,0 +1,80 @@
+"""推播持久化佇列：重試、丟棄、逾期與重新啟動後接續投遞"""
+import threading
+
+from services.notification_spool import NotificationSpool
+
+
+class _Sender:
+    """依序回傳預先設定的狀態碼，之後一律回傳 200"""
+    
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+        self.lock = threading.Lock()
+    
+    def __call__(self, body: bytes, retry_key: str, description: str):
+        with self.lock:
+            self.calls.append((body, retry_key))
+            return self.statuses.pop(0) if self.statuses else 200
+
+
+def _spool(tmp_path, sender, **kwargs) -> NotificationSpool:
+    kwargs.setdefault("retry_base", 0.01)
+    kwargs.setdefault("retry_max", 0.02)
+    return NotificationSpool(str(tmp_path / "spool.db"), sender, **kwargs)
+
+
+def test_retries_server_errors_with_the_same_retry_key(tmp_path, wait_until):
+    sender = _Sender(500, None, 429)
+    spool = _spool(tmp_path, sender).start()
+    spool.enqueue(b"first", "第一則")
+    spool.enqueue(b"second", "第二則")
+    
+    assert wait_until(lambda: spool.stats["delivered"] == 2)
+    spool.stop()
+    
+    assert spool.stats["retried"] == 3
+    assert [body for body, _ in sender.calls] == [b"first"] * 4 + [b"second"]
+    assert len({key for body, key in sender.calls if body == b"first"}) == 1
+
+
+def test_client_errors_are_dropped(tmp_path, wait_until):
+    sender = _Sender(400)
+    spool = _spool(tmp_path, sender).start()
+    spool.enqueue(b"rejected")
+    spool.enqueue(b"accepted")
+    
+    assert wait_until(lambda: spool.stats["delivered"] == 1)
+    spool.stop()
+    
+    assert spool.stats["dropped"] == 1
+    assert [body for body, _ in sender.calls] == [b"rejected", b"accepted"]
+
+
+def test_expired_messages_are_not_sent(tmp_path, wait_until):
+    sender = _Sender()
+    spool = _spool(tmp_path, sender).start()
+    spool.enqueue(b"stale", deadline=-1)
+    spool.enqueue(b"fresh")
+    
+    assert wait_until(lambda: spool.stats["delivered"] == 1)
+    spool.stop()
+    
+    assert spool.stats["expired"] == 1
+    assert [body for body, _ in sender.calls] == [b"fresh"]
+
+
+def test_undelivered_messages_survive_restart(tmp_path, wait_until):
+    failing = _Sender(*[503] * 1000)
+    spool = _spool(tmp_path, failing, retry_base=0.2, retry_max=0.2).start()
+    spool.enqueue(b"pending")
+    assert wait_until(lambda: spool.stats["retried"] == 1)
+    spool.stop()
+    
+    sender = _Sender()
+    spool = _spool(tmp_path, sender).start()
+    assert wait_until(lambda: spool.stats["delivered"] == 1)
+    spool.stop()
+    
+    assert [body for body, _ in sender.calls] == [b"pending"]
+    assert sender.calls[0][1] == failing.calls[0][1]
@@ -0,0 +1,119 @@
+"""磁簧開關防彈跳：抖動合併為單一事件，短暫雜訊不產生回呼（含 gpiozero 模擬腳位）"""
+import time
+
+import pytest
+
+from sensors.reed_switch import ReedSwitch
+from simulation.drivers import SimInputDevice
+
+STABLE_TIME = 0.03
+
+
+@pytest.fixture
+def reed():
+    reed = ReedSwitch(0, stable_time=STABLE_TIME, device=SimInputDevice(0))
+    reed.events = []
+    reed.when_activated = reed.events.append
+    reed.when_deactivated = reed.events.append
+    yield reed
+    reed.cleanup()
+
+
+def _chatter(device: SimInputDevice, levels):
+    for level in levels:
+        device.drive(level)
+
+
+def test_bounces_coalesce_into_one_event(reed, wait_until):
+    _chatter(reed.device, [1, 0, 1, 0, 1])
+    assert wait_until(lambda: reed.events)
+    time.sleep(STABLE_TIME * 2)
+    
+    [event] = reed.events
+    assert event.value == 1 and reed.value == 1
+    assert event.bounces == 4
+    assert event.settle_delay >= STABLE_TIME
+    assert reed.stats == {"raw_edges": 5, "emitted": 1, "bounces": 4, "glitches": 0}
+
+
+def test_glitch_back_to_the_same_state_emits_nothing(reed, wait_until):
+    _chatter(reed.device, [1, 0])
+    assert wait_until(lambda: reed.stats["glitches"] == 1)
+    
+    assert reed.events == []
+    assert reed.value == 0
+
+
+def test_open_then_close_emits_both_edges(reed, wait_until):
+    _chatter(reed.device, [1, 0, 1])
+    assert wait_until(lambda: len(reed.events) == 1)
+    _chatter(reed.device, [0, 1, 0])
+    assert wait_until(lambda: len(reed.events) == 2)
+    
+    assert [event.value for event in reed.events] == [1, 0]
+    assert reed.last_event is reed.events[-1]
+
+
+def test_listeners_see_every_event(reed, wait_until):
+    heard = []
+    reed.add_listener(heard.append)
+    _chatter(reed.device, [1])
+    assert wait_until(lambda: len(reed.events) == 1)
+    
+    assert heard == reed.events
+
+
+def test_zero_stable_time_passes_edges_through():
+    reed = ReedSwitch(0, stable_time=0, device=SimInputDevice(0))
+    events = []
+    reed.when_activated = events.append
+    reed.when_deactivated = events.append
+    _chatter(reed.device, [1, 0, 1])
+    reed.cleanup()
+    
+    assert [event.value for event in events] == [1, 0, 1]
+    assert all(event.bounces == 0 for event in events)
+
+
+@pytest.fixture
+def mock_pin():
+    gpiozero = pytest.importorskip("gpiozero")
+    from gpiozero.pins.mock import MockFactory
+    
+    original_factory = gpiozero.Device.pin_factory
+    gpiozero.Device.pin_factory = MockFactory()
+    try:
+        yield gpiozero.Device.pin_factory.pin(17)
+    finally:
+        gpiozero.Device.pin_factory.close()
+        gpiozero.Device.pin_factory = original_factory
+
+
+def test_mock_pin_bounces_are_debounced(mock_pin, wait_until):
+    reed = ReedSwitch(17, stable_time=STABLE_TIME)
+    events = []
+    reed.when_activated = events.append
+    reed.when_deactivated = events.append
+    
+    def drive(level: int):
+        if level:
+            mock_pin.drive_high()
+        else:
+            mock_pin.drive_low()
+    
+    # 三次開合，每次 5 個原始邊緣（4 個抖動）；中間插入一次離開後又回到原狀態的雜訊
+    patterns = [[1, 0, 1, 0, 1], [0, 1, 0, 1, 0], [1, 0], [1, 0, 1, 0, 1]]
+    for levels in patterns:
+        for level in levels:
+            drive(level)
+        time.sleep(STABLE_TIME * 3)
+    assert wait_until(lambda: len(events) == 3)
+    reed.cleanup()
+    
+    raw_edges = sum(len(levels) for levels in patterns)
+    assert [event.value for event in events] == [1, 0, 1]
+    assert reed.stats["raw_edges"] == raw_edges
+    assert reed.stats["emitted"] == len(events) == 3
+    assert reed.stats["glitches"] == 1
+    # 防彈跳省下的回呼
+    assert raw_edges - reed.stats["emitted"] == 14